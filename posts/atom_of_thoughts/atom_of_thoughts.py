@@ -1,6 +1,10 @@
 import os
+import sys
+import re
 import time
-from typing import Dict, Any, List, Tuple
+import asyncio
+import contextlib
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
@@ -8,20 +12,41 @@ from rich.text import Text
 from rich.progress import Progress
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
+from langchain.schema import SystemMessage
 
-# Set your OpenAI API key here
-os.environ["OPENAI_API_KEY"] = "your-api-key-here"
+# Make the shared harness in posts/ importable when running this file directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_harness.budget import budget_from_env, budget_table
+from llm_harness.cache import cache_from_env
+from llm_harness.consistency import SelfConsistentChain, vote_table
+from llm_harness.dataset import RunningStats, run_dataset
+from llm_harness.hedging import HedgedModel
+from llm_harness.models import create_chat_model
+from llm_harness.profiling import profiler, profiler_from_env
+from llm_harness.prompts import build_prompt
+from llm_harness.scoring import answer_matches, answers_match, normalize_answers
+from llm_harness.sinks import CsvSink, JsonlSink, ResultSink, SinkDispatcher
+from llm_harness.strategies import Strategy, register_strategy
+from llm_harness.streaming import ChainRun, arun_chain, extract_answer, format_millis, format_seconds, run_chain
+from llm_harness.usage import (call_usage, chain_model_name, format_cached_tokens, format_cost, format_rate, format_tokens,
+                               prompt_text, token_usage)
+
+# ChatOpenAI reads the key from OPENAI_API_KEY; the model from setup_model's
+# arguments or GENAI_MODEL / GENAI_TEMPERATURE
 
 # Initialize Rich console for pretty printing
 console = Console()
 
-def setup_model(model_name: str = "gpt-4o", temperature: float = 0) -> ChatOpenAI:
-    """Initialize the LLM with the specified parameters."""
-    return ChatOpenAI(
-        model=model_name,
-        temperature=temperature
-    )
+def setup_model(model_name: Optional[str] = None, temperature: Optional[float] = None, backend: Optional[str] = None, **kwargs: Any) -> ChatOpenAI:
+    """
+    Initialize the LLM with the specified parameters.
+    
+    Unset arguments come from ``GENAI_MODEL`` / ``GENAI_TEMPERATURE``
+    (default gpt-4o at temperature 0). ``backend="fake"`` (or
+    ``GENAI_BACKEND=fake``) returns the offline FakeChatModel instead of
+    ChatOpenAI; extra kwargs go to the model.
+    """
+    return create_chat_model(model_name, temperature, backend=backend, **kwargs)
 
 # Example for few-shot learning (helps establish the pattern)
 FEW_SHOT_EXAMPLE = """
@@ -49,6 +74,9 @@ Synthesis: Emily gave 17 stickers to Rachel.
 #### 17
 """
 
+# Matches "Atom X: description | depends on: 1, 2" lines of a decomposition
+ATOM_PLAN_PATTERN = re.compile(r"^\s*Atom\s+(\d+)\s*:\s*(.*?)\s*(?:\|\s*depends on\s*:\s*(.*))?$", re.IGNORECASE | re.MULTILINE)
+
 # System messages for different reasoning approaches
 SYSTEM_MESSAGE_COT = """
 Think step by step to answer the following question. 
@@ -67,33 +95,82 @@ After solving all atomic subproblems, provide a synthesis that combines them int
 Return your final answer after a separator ####.
 """
 
-def create_chains(model: ChatOpenAI):
-    """Create both CoT and AoT chains using the same model."""
+# System messages for the executing (DAG) mode of Atom of Thoughts
+SYSTEM_MESSAGE_AOT_DECOMPOSE = """
+Break the following problem into the smallest "atomic" subproblems, but do NOT solve them.
+
+List one atom per line in exactly this format:
+Atom X: [what to compute] | depends on: [comma-separated atom numbers, or none]
+
+An atom may only depend on atoms listed before it. Keep atoms independent wherever possible
+so they can be solved in parallel.
+"""
+
+SYSTEM_MESSAGE_AOT_SOLVE_ATOM = """
+You are solving one atomic subproblem of a larger problem. Solve only this subproblem,
+using the results of the atoms it depends on. Be brief.
+Return the result of this subproblem after a separator ####.
+"""
+
+SYSTEM_MESSAGE_AOT_SYNTHESIZE = """
+The problem below has been broken into atomic subproblems, each already solved.
+Combine their results into a short synthesis that answers the original problem.
+Return your final answer after a separator ####.
+"""
+
+def create_chains(model: ChatOpenAI, hedge: Union[bool, Dict[str, Any]] = False, layout: str = "default"):
+    """
+    Create both CoT and AoT chains using the same model.
+    
+    With ``hedge`` set (True, or a dict of ``HedgedModel`` options), each
+    chain's model calls are hedged: a duplicate request is sent when a call
+    runs past a percentile of that chain's recent latencies.
+    
+    ``layout="shared_prefix"`` puts the shared few-shot example before the
+    strategy's system message, so both chains (and every question) share a
+    prompt prefix that provider prompt caches can reuse.
+    """
     # Create prompt templates
-    cot_prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=SYSTEM_MESSAGE_COT),
-        HumanMessage(content=FEW_SHOT_EXAMPLE),
-        HumanMessage(content="{question}")
-    ])
+    cot_prompt = build_prompt(SYSTEM_MESSAGE_COT, FEW_SHOT_EXAMPLE, layout)
+    aot_prompt = build_prompt(SYSTEM_MESSAGE_AOT, FEW_SHOT_EXAMPLE, layout)
     
-    aot_prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=SYSTEM_MESSAGE_AOT),
-        HumanMessage(content=FEW_SHOT_EXAMPLE),
-        HumanMessage(content="{question}")
-    ])
+    # Each chain gets its own hedger, so the latency history is per approach
+    def model_for_chain():
+        if not hedge:
+            return model
+        return HedgedModel(model, **(hedge if isinstance(hedge, dict) else {}))
     
     # Create and return chains
     return {
-        "cot": cot_prompt | model,
-        "aot": aot_prompt | model
+        "cot": cot_prompt | model_for_chain(),
+        "aot": aot_prompt | model_for_chain()
     }
 
-def extract_answer(response: str) -> str:
-    """Extract the final answer after the #### separator."""
-    parts = response.split("####")
-    if len(parts) > 1:
-        return parts[1].strip()
-    return "No answer found"
+# Register AoT for llm_harness.strategies.run_strategies; CoT is registered by chain_of_drafts
+register_strategy(Strategy("aot", "Atom of Thoughts", lambda: {"main": build_prompt(SYSTEM_MESSAGE_AOT, FEW_SHOT_EXAMPLE)}))
+
+def create_dag_chains(model: ChatOpenAI):
+    """Create the decomposition, atom-solving and synthesis chains for executing AoT."""
+    decompose_prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=SYSTEM_MESSAGE_AOT_DECOMPOSE),
+        ("human", "{question}")
+    ])
+    
+    solve_prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=SYSTEM_MESSAGE_AOT_SOLVE_ATOM),
+        ("human", "Problem: {question}\n\nSolved atoms it depends on:\n{dependencies}\n\nSubproblem: {atom}")
+    ])
+    
+    synthesis_prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=SYSTEM_MESSAGE_AOT_SYNTHESIZE),
+        ("human", "Problem: {question}\n\nSolved atoms:\n{atoms}")
+    ])
+    
+    return {
+        "decompose": decompose_prompt | model,
+        "solve_atom": solve_prompt | model,
+        "synthesize": synthesis_prompt | model
+    }
 
 def extract_atoms(response: str) -> List[Dict[str, str]]:
     """Extract atomic subproblems and their solutions."""
@@ -136,92 +213,333 @@ def extract_atoms(response: str) -> List[Dict[str, str]]:
     
     return atoms
 
-def measure_performance(chain, question: str) -> Tuple[str, int, str, float, List[Dict[str, str]]]:
+class AtomStreamParser:
     """
-    Measure the performance of a chain.
+    Incremental, single-pass parser for AoT responses.
     
-    Returns:
-        Tuple containing (response content, word count, extracted answer, time taken, atoms if available)
+    Feed text chunks as they arrive; each ``Atom N:`` block and the
+    ``Synthesis:`` block is returned as soon as the next block header closes
+    it (the last one on ``close()``). The #### answer is extracted in the same
+    pass. Only the current line and the current block are held in memory, so
+    arbitrarily large responses can be parsed from a stream or a file.
+    
+    Blocks and the answer match ``extract_atoms`` and ``extract_answer``.
     """
-    start_time = time.time()
-    response = chain.invoke({"question": question})
-    end_time = time.time()
     
-    content = response.content
-    words = len(content.split())
-    answer = extract_answer(content)
-    time_taken = end_time - start_time
+    def __init__(self):
+        self._partial = ""
+        self._name: Optional[str] = None
+        self._content: List[str] = []
+        self._separators = 0
+        self._answer: List[str] = []
+    
+    @property
+    def answer(self) -> str:
+        """The text after the first #### separator (up to a second one)."""
+        if self._separators == 0:
+            return "No answer found"
+        return "".join(self._answer).strip()
+    
+    def feed(self, chunk: str) -> List[Dict[str, str]]:
+        """Consume a chunk of text and return any blocks it completed."""
+        if "\n" not in chunk:
+            self._partial += chunk
+            return []
+        lines = (self._partial + chunk).split("\n")
+        self._partial = lines.pop()
+        return self._parse_lines(lines, True)
+    
+    def close(self) -> List[Dict[str, str]]:
+        """Flush the final line and return the remaining open block, if any."""
+        completed = self._parse_lines([self._partial], False)
+        self._partial = ""
+        if self._name:
+            completed.append({"name": self._name, "content": "\n".join(self._content)})
+            self._name = None
+            self._content = []
+        return completed
+    
+    def _parse_lines(self, lines: List[str], newline: bool) -> List[Dict[str, str]]:
+        completed = []
+        name, content = self._name, self._content
+        answer_open = self._separators < 2
+        for line in lines:
+            if answer_open and (self._separators == 1 or "####" in line):
+                self._track_answer(line, newline)
+                answer_open = self._separators < 2
+            
+            # Strip once per line; block headers are the only lines that need it
+            stripped = line.strip()
+            if stripped.startswith("Atom") and ":" in line:
+                if name:
+                    completed.append({"name": name, "content": "\n".join(content)})
+                name, content = stripped, []
+            elif stripped.startswith("Synthesis:"):
+                if name:
+                    completed.append({"name": name, "content": "\n".join(content)})
+                name, content = "Synthesis", [stripped[10:]]
+            elif name:
+                content.append(line)
+        self._name, self._content = name, content
+        return completed
+    
+    def _track_answer(self, line: str, newline: bool) -> None:
+        """Collect the text between the first and second #### separator."""
+        if self._separators == 0:
+            line = line.split("####", 1)[1]
+            self._separators = 1
+        if "####" in line:
+            line = line.split("####", 1)[0]
+            self._separators = 2
+        self._answer.append(line + "\n" if newline and self._separators == 1 else line)
+
+def iter_atoms(chunks: Iterable[str], parser: Optional[AtomStreamParser] = None) -> Iterator[Dict[str, str]]:
+    """Yield atoms and the synthesis from an iterable of text chunks as soon as each is complete."""
+    parser = parser or AtomStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+def stream_atoms(chain, question: str, parser: Optional[AtomStreamParser] = None) -> Iterator[Dict[str, str]]:
+    """
+    Stream an AoT chain and yield each atom as soon as its block is closed.
     
-    # Try to extract atoms if this is an AoT response
-    try:
-        atoms = extract_atoms(content)
-    except:
-        atoms = []
+    Consumers (a display, a checker) can start on atom 1 while later atoms are
+    still generating; ``parser.answer`` holds the #### answer once exhausted.
+    """
+    return iter_atoms((chunk.content for chunk in chain.stream({"question": question})), parser)
+
+def display_streamed_atoms(chain, question: str) -> str:
+    """Render each atom panel as soon as it is generated and return the final answer."""
+    parser = AtomStreamParser()
+    console.print(Panel(question, title="Question", border_style="blue"))
+    for atom in stream_atoms(chain, question, parser):
+        if atom["name"] == "Synthesis":
+            console.print(Panel(atom["content"], title="Synthesis", border_style="magenta"))
+        else:
+            console.print(Panel(atom["content"], title=atom["name"], border_style="yellow"))
+    console.print("\n[bold cyan]Final Answer:[/bold cyan]", parser.answer)
+    return parser.answer
+
+def parse_atom_plan(response: str) -> List[Dict[str, Any]]:
+    """
+    Parse a decomposition response into atoms and their dependencies.
     
-    return content, words, answer, time_taken, atoms
+    Dependencies on unknown atoms, or on atoms that are not listed earlier,
+    are dropped so the plan is always a DAG.
+    """
+    plan = []
+    seen = set()
+    for match in ATOM_PLAN_PATTERN.finditer(response):
+        atom_id = int(match.group(1))
+        if atom_id in seen:
+            continue
+        depends_on = [int(dep) for dep in re.findall(r"\d+", match.group(3) or "")]
+        plan.append({
+            "id": atom_id,
+            "description": match.group(2).strip(),
+            "depends_on": [dep for dep in depends_on if dep in seen]
+        })
+        seen.add(atom_id)
+    return plan
+
+def dag_levels(plan: List[Dict[str, Any]]) -> List[List[int]]:
+    """Group atom ids by their depth in the dependency DAG."""
+    depth = {}
+    for atom in plan:
+        depth[atom["id"]] = 1 + max((depth[dep] for dep in atom["depends_on"]), default=0)
+    levels = [[] for _ in range(max(depth.values(), default=0))]
+    for atom_id, level in depth.items():
+        levels[level - 1].append(atom_id)
+    return levels
 
-def compare_chains(question: str, chains: Dict[str, Any]) -> Dict[str, Any]:
+# (content, word count, answer, time, atoms, latency breakdown, token usage and cost)
+PerformanceRun = Tuple[str, int, str, float, List[Dict[str, str]], Dict[str, Any], Dict[str, Any]]
+
+def _analyze_response(run: ChainRun, chain=None, question: Optional[str] = None, strategy: Optional[str] = None) -> PerformanceRun:
+    """Compute word count, final answer, atoms and token usage for a completed chain run."""
+    content = run.content
+    
+    # Extract the answer and any atoms (if this is an AoT response) in one pass
+    with profiler.span("parse", strategy):
+        words = len(content.split())
+        parser = AtomStreamParser()
+        atoms = parser.feed(content) + parser.close()
+        answer = parser.answer
+    
+    latency = run.latency()
+    latency["hedge"] = run.message.response_metadata.get("hedge") if run.message is not None else None
+    
+    # Count the prompt locally only when the response carries no usage metadata
+    with profiler.span("usage", strategy):
+        prompt = None if token_usage(run.message) else prompt_text(chain, {"question": question})
+        usage = call_usage(run.message, content, run.total, prompt=prompt, model_name=chain_model_name(chain))
+    
+    return content, words, answer, run.total, atoms, latency, usage
+
+def measure_performance(chain, question: str, stream: bool = False, strategy: Optional[str] = None) -> PerformanceRun:
     """
-    Compare Chain of Thought vs Atom of Thoughts reasoning approaches.
+    Measure the performance of a chain.
+    
+    With ``stream=True`` the response is consumed token by token, which adds
+    time-to-first-token and inter-token latency to the breakdown and stops
+    generation once the line after the #### separator is complete.
+    ``strategy`` labels the stages recorded by the profiler.
     
     Returns:
-        Dictionary with comparison results
+        Tuple containing (response content, word count, extracted answer, time taken, atoms if available, latency breakdown, token usage)
+    """
+    return _analyze_response(run_chain(chain, {"question": question}, stream=stream, strategy=strategy), chain, question, strategy)
+
+async def ameasure_performance(chain, question: str, semaphore: Optional[asyncio.Semaphore] = None, stream: bool = False, strategy: Optional[str] = None) -> PerformanceRun:
     """
-    results = {}
+    Async version of measure_performance built on ``chain.ainvoke``.
     
-    # Print the question
-    console.print(Panel(question, title="Question", border_style="blue"))
+    The timer starts only once a concurrency slot has been acquired, so the
+    recorded time covers the model call itself and not the wait in the queue.
+    """
+    async with semaphore or contextlib.nullcontext():
+        run = await arun_chain(chain, {"question": question}, stream=stream, strategy=strategy)
     
-    # Get Chain of Thought response
-    with console.status("[bold cyan]Running Chain of Thought..."):
-        cot_content, cot_words, cot_answer, cot_time, _ = measure_performance(chains["cot"], question)
+    return _analyze_response(run, chain, question, strategy)
+
+async def aexecute_atom_dag(question: str, dag_chains: Dict[str, Any], semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """
+    Execute Atom of Thoughts as a dependency DAG.
     
-    # Get Atom of Thoughts response
-    with console.status("[bold green]Running Atom of Thoughts..."):
-        aot_content, aot_words, aot_answer, aot_time, aot_atoms = measure_performance(chains["aot"], question)
+    A decomposition call lists the atoms and their dependencies, every atom
+    whose dependencies are solved is dispatched to the model immediately, and
+    a final synthesis call combines the solved atoms. Independent atoms run in
+    parallel, so the critical path grows with the DAG depth rather than with
+    the number of atoms.
+    """
+    async def call(step, inputs):
+        async with semaphore or contextlib.nullcontext():
+            return await arun_chain(dag_chains[step], inputs, strategy=f"dag.{step}")
+    
+    start_time = time.perf_counter()
+    
+    decomposition = await call("decompose", {"question": question})
+    plan = parse_atom_plan(decomposition.content)
+    atoms_by_id = {atom["id"]: atom for atom in plan}
+    tasks: Dict[int, asyncio.Task] = {}
+    
+    async def solve(atom: Dict[str, Any]) -> str:
+        dependency_results = [await tasks[dep] for dep in atom["depends_on"]]
+        dependencies = "\n".join(
+            f"Atom {dep}: {atoms_by_id[dep]['description']} = {result}"
+            for dep, result in zip(atom["depends_on"], dependency_results)
+        ) or "none"
+        run = await call("solve_atom", {
+            "question": question,
+            "atom": atom["description"],
+            "dependencies": dependencies
+        })
+        atom["content"] = run.content
+        atom["result"] = extract_answer(run.content)
+        atom["time"] = run.total
+        return atom["result"]
+    
+    # Plans are parsed in dependency order, so every dependency has a task
+    for atom in plan:
+        tasks[atom["id"]] = asyncio.ensure_future(solve(atom))
+    await asyncio.gather(*tasks.values())
+    
+    solved = "\n".join(f"Atom {atom['id']}: {atom['description']} = {atom['result']}" for atom in plan)
+    synthesis = await call("synthesize", {"question": question, "atoms": solved or "none"})
+    
+    levels = dag_levels(plan)
+    return {
+        "content": synthesis.content,
+        "answer": extract_answer(synthesis.content),
+        "time": time.perf_counter() - start_time,
+        "atoms": plan,
+        "num_atoms": len(plan),
+        "width": max((len(level) for level in levels), default=0),
+        "depth": len(levels),
+        "model_calls": len(plan) + 2,
+        "stage_times": {
+            "decompose": decomposition.total,
+            "atoms": sum(atom["time"] for atom in plan),
+            "synthesize": synthesis.total
+        }
+    }
+
+def execute_atom_dag(question: str, dag_chains: Dict[str, Any]) -> Dict[str, Any]:
+    """Synchronous wrapper around aexecute_atom_dag."""
+    return asyncio.run(aexecute_atom_dag(question, dag_chains))
+
+def build_comparison(cot_run: Tuple, aot_run: Tuple, dag_run: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Combine the CoT and AoT (and optionally executed DAG AoT) measurements into a comparison result."""
+    cot_content, cot_words, cot_answer, cot_time, _, cot_latency, cot_usage = cot_run
+    aot_content, aot_words, aot_answer, aot_time, aot_atoms, aot_latency, aot_usage = aot_run
     
     # Calculate metrics
     word_difference = ((cot_words - aot_words) / cot_words) * 100 if cot_words > 0 else 0
+    cot_tokens, aot_tokens = cot_usage["output_tokens"], aot_usage["output_tokens"]
+    token_difference = ((cot_tokens - aot_tokens) / cot_tokens) * 100 if cot_tokens > 0 else 0
     time_difference = ((cot_time - aot_time) / cot_time) * 100 if cot_time > 0 else 0
     num_atoms = len(aot_atoms)
     
-    # Store results
     results = {
         "cot": {
             "content": cot_content,
             "words": cot_words,
             "answer": cot_answer,
-            "time": cot_time
+            "time": cot_time,
+            "latency": cot_latency,
+            "usage": cot_usage
         },
         "aot": {
             "content": aot_content,
             "words": aot_words,
             "answer": aot_answer,
             "time": aot_time,
+            "latency": aot_latency,
+            "usage": aot_usage,
             "atoms": aot_atoms,
             "num_atoms": num_atoms
         },
         "metrics": {
             "word_difference": word_difference,
+            "token_difference": token_difference,
             "time_difference": time_difference
         }
     }
     
+    if dag_run is not None:
+        results["aot_dag"] = dag_run
+        results["metrics"]["dag_speedup"] = aot_time / dag_run["time"] if dag_run["time"] > 0 else 0
+    
+    return results
+
+def _format_hedge(hedge: Optional[Dict[str, Any]]) -> str:
+    """Describe whether a call was hedged and which request won."""
+    if not hedge:
+        return "-"
+    if not hedge["hedged"]:
+        return "no"
+    return f"yes ({hedge['winner']} won)"
+
+def display_comparison(results: Dict[str, Any]) -> None:
+    """Render the responses, atoms and comparison table for one question."""
+    cot, aot, metrics = results["cot"], results["aot"], results["metrics"]
+    
     # Display the responses in pretty format
     console.print("\n[bold cyan]Chain of Thought Response:[/bold cyan]")
-    console.print(Panel(cot_content, border_style="cyan"))
+    console.print(Panel(cot["content"], border_style="cyan"))
     
     console.print("\n[bold green]Atom of Thoughts Response:[/bold green]")
-    console.print(Panel(aot_content, border_style="green"))
+    console.print(Panel(aot["content"], border_style="green"))
     
     # Display individual atoms
     console.print("\n[bold yellow]Atomic Subproblems:[/bold yellow]")
-    for atom in aot_atoms:
+    for atom in aot["atoms"]:
         if atom["name"] != "Synthesis":
             console.print(Panel(atom["content"], title=atom["name"], border_style="yellow"))
     
     # Display synthesis if available
-    synthesis = next((atom for atom in aot_atoms if atom["name"] == "Synthesis"), None)
+    synthesis = next((atom for atom in aot["atoms"] if atom["name"] == "Synthesis"), None)
     if synthesis:
         console.print(Panel(synthesis["content"], title="Synthesis", border_style="magenta"))
     
@@ -231,77 +549,426 @@ def compare_chains(question: str, chains: Dict[str, Any]) -> Dict[str, Any]:
     table.add_column("Chain of Thought", justify="right")
     table.add_column("Atom of Thoughts", justify="right")
     
-    table.add_row("Word Count", str(cot_words), str(aot_words))
-    table.add_row("Time (seconds)", f"{cot_time:.2f}", f"{aot_time:.2f}")
-    table.add_row("Final Answer", cot_answer, aot_answer)
-    table.add_row("Number of Atoms", "-", str(num_atoms))
-    
+    table.add_row("Word Count", str(cot["words"]), str(aot["words"]))
+    table.add_row("Input Tokens", format_tokens(cot["usage"], "input_tokens"), format_tokens(aot["usage"], "input_tokens"))
+    table.add_row("Output Tokens", format_tokens(cot["usage"], "output_tokens"), format_tokens(aot["usage"], "output_tokens"))
+    table.add_row("Time (seconds)", f"{cot['time']:.2f}", f"{aot['time']:.2f}")
+    table.add_row("Output Tokens/sec", format_rate(cot["usage"]), format_rate(aot["usage"]))
+    table.add_row("Cost (USD)", format_cost(cot["usage"]["cost"]), format_cost(aot["usage"]["cost"]))
+    if cot["latency"]["streamed"] or aot["latency"]["streamed"]:
+        table.add_row("Time to First Token (seconds)", format_seconds(cot["latency"]["ttft"]), format_seconds(aot["latency"]["ttft"]))
+        table.add_row("Inter-token Latency (ms, mean)", format_millis(cot["latency"]["mean_inter_token"]), format_millis(aot["latency"]["mean_inter_token"]))
+        table.add_row("Inter-token Latency (ms, p95)", format_millis(cot["latency"]["p95_inter_token"]), format_millis(aot["latency"]["p95_inter_token"]))
+        table.add_row("Stopped After Answer", "yes" if cot["latency"]["stopped_early"] else "no", "yes" if aot["latency"]["stopped_early"] else "no")
+    if cot["latency"].get("hedge") or aot["latency"].get("hedge"):
+        table.add_row("Hedged Request", _format_hedge(cot["latency"].get("hedge")), _format_hedge(aot["latency"].get("hedge")))
+    if "provider" in (cot["usage"]["source"], aot["usage"]["source"]):
+        table.add_row("Cached Input Tokens (of total)", format_cached_tokens(cot["usage"]), format_cached_tokens(aot["usage"]))
+    table.add_row("Final Answer", cot["answer"], aot["answer"])
+    table.add_row("Number of Atoms", "-", str(aot["num_atoms"]))
+    
+    word_difference = metrics["word_difference"]
     if word_difference > 0:
         table.add_row("Word Reduction", "-", f"{word_difference:.1f}%")
     else:
         table.add_row("Word Increase", "-", f"{-word_difference:.1f}%")
     
+    token_difference = metrics["token_difference"]
+    if token_difference > 0:
+        table.add_row("Output Token Reduction", "-", f"{token_difference:.1f}%")
+    else:
+        table.add_row("Output Token Increase", "-", f"{-token_difference:.1f}%")
+    
+    time_difference = metrics["time_difference"]
     if time_difference > 0:
         table.add_row("Time Reduction", "-", f"{time_difference:.1f}%")
     else:
         table.add_row("Time Increase", "-", f"{-time_difference:.1f}%")
     
+    dag = results.get("aot_dag")
+    if dag is not None:
+        table.add_row("DAG Width / Depth", "-", f"{dag['width']} / {dag['depth']}")
+        table.add_row("DAG Model Calls", "-", str(dag["model_calls"]))
+        table.add_row("DAG Time (seconds)", "-", f"{dag['time']:.2f}")
+        table.add_row("DAG Final Answer", "-", dag["answer"])
+        table.add_row("DAG Speedup vs Single-Call AoT", "-", f"{metrics['dag_speedup']:.2f}x")
+    
     console.print(table)
+
+def display_result(result: Dict[str, Any]) -> None:
+    """Render one batch result (its question and comparison); use as ``RichSink(display_result)``."""
+    console.print(Panel(result["question"], title="Question", border_style="blue"))
+    with profiler.span("render"):
+        display_comparison(result)
+
+def compare_chains(question: str, chains: Dict[str, Any], stream: bool = False, dag_chains: Optional[Dict[str, Any]] = None, render: bool = True) -> Dict[str, Any]:
+    """
+    Compare Chain of Thought vs Atom of Thoughts reasoning approaches.
+    
+    Set ``stream=True`` to stream both responses and report time-to-first-token
+    and inter-token latency alongside the total time. Pass ``dag_chains`` (from
+    ``create_dag_chains``) to also execute AoT as a parallel atom DAG and report
+    its shape and speedup over the single-call AoT. With ``render=False``
+    nothing is printed (headless mode; see ``batch_test(sinks=...)``).
+    
+    Returns:
+        Dictionary with comparison results
+    """
+    status = console.status if render else (lambda _: contextlib.nullcontext())
+    
+    # Print the question
+    if render:
+        console.print(Panel(question, title="Question", border_style="blue"))
+    
+    # Get Chain of Thought response
+    with status("[bold cyan]Running Chain of Thought..."):
+        cot_run = measure_performance(chains["cot"], question, stream=stream, strategy="cot")
+    
+    # Get Atom of Thoughts response
+    with status("[bold green]Running Atom of Thoughts..."):
+        aot_run = measure_performance(chains["aot"], question, stream=stream, strategy="aot")
+    
+    # Execute the atoms as a DAG if requested
+    dag_run = None
+    if dag_chains is not None:
+        with status("[bold yellow]Executing Atom DAG..."):
+            dag_run = execute_atom_dag(question, dag_chains)
+    
+    results = build_comparison(cot_run, aot_run, dag_run)
+    if render:
+        with profiler.span("render"):
+            display_comparison(results)
     
     return results
 
-def batch_test(questions: List[str]) -> Dict[str, Any]:
-    """Run tests on a batch of questions and compile statistics."""
-    model = setup_model()
-    chains = create_chains(model)
-    
-    results = []
+async def acompare_chains(question: str, chains: Dict[str, Any], semaphore: Optional[asyncio.Semaphore] = None, stream: bool = False, dag_chains: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run the CoT and AoT chains for one question concurrently.
     
-    for i, question in enumerate(questions):
-        console.rule(f"[bold]Question {i+1}/{len(questions)}")
-        result = compare_chains(question, chains)
-        results.append(result)
+    Nothing is rendered here; the caller displays the results once they are
+    all in, so the console output keeps the question order.
+    """
+    runs = [
+        ameasure_performance(chains["cot"], question, semaphore, stream, "cot"),
+        ameasure_performance(chains["aot"], question, semaphore, stream, "aot")
+    ]
+    if dag_chains is not None:
+        runs.append(aexecute_atom_dag(question, dag_chains, semaphore))
+    return build_comparison(*await asyncio.gather(*runs))
+
+def aggregate_results(results: List[Dict[str, Any]], gold: Optional[Sequence[str]] = None) -> Dict[str, float]:
+    """
+    Calculate aggregate statistics over a list of comparison results.
     
-    # Calculate aggregate statistics
+    Answers are compared after normalization (see ``llm_harness.scoring``), so
+    "$4.00" matches "4". With ``gold`` answers (one per result), the accuracy
+    of each approach is added.
+    """
     avg_num_atoms = sum(r["aot"]["num_atoms"] for r in results) / len(results)
     avg_word_difference = sum(r["metrics"]["word_difference"] for r in results) / len(results)
+    avg_token_difference = sum(r["metrics"]["token_difference"] for r in results) / len(results)
     avg_time_difference = sum(r["metrics"]["time_difference"] for r in results) / len(results)
     
     # Count matching answers
-    matching_answers = sum(1 for r in results if r["cot"]["answer"] == r["aot"]["answer"])
+    answers = {key: normalize_answers([r[key]["answer"] for r in results]) for key in ("cot", "aot")}
+    matching_answers = int(answers_match(answers["cot"], answers["aot"]).sum())
+    
+    aggregate = {
+        "word_difference": avg_word_difference,
+        "token_difference": avg_token_difference,
+        "time_difference": avg_time_difference,
+        "avg_num_atoms": avg_num_atoms,
+        "answer_match_rate": (matching_answers/len(results))*100
+    }
     
+    if gold is not None:
+        gold_answers = normalize_answers(gold)
+        for key in ("cot", "aot"):
+            aggregate[f"{key}_accuracy"] = float(answers_match(answers[key], gold_answers).mean()) * 100
+    
+    # Tokens, cost and throughput per strategy
+    for key in ("cot", "aot"):
+        usages = [r[key]["usage"] for r in results]
+        costs = [u["cost"] for u in usages if u["cost"] is not None]
+        rates = [u["tokens_per_second"] for u in usages if u["tokens_per_second"] is not None]
+        aggregate[f"{key}_input_tokens"] = sum(u["input_tokens"] for u in usages)
+        aggregate[f"{key}_output_tokens"] = sum(u["output_tokens"] for u in usages)
+        aggregate[f"{key}_cost"] = sum(costs) if costs else None
+        aggregate[f"{key}_tokens_per_second"] = sum(rates) / len(rates) if rates else None
+    
+    dag_results = [r for r in results if "aot_dag" in r]
+    if dag_results:
+        aggregate["avg_dag_speedup"] = sum(r["metrics"]["dag_speedup"] for r in dag_results) / len(dag_results)
+        aggregate["avg_dag_depth"] = sum(r["aot_dag"]["depth"] for r in dag_results) / len(dag_results)
+    
+    # Share of input tokens served from the provider's prompt cache
+    usages = [r[key]["usage"] for r in results for key in ("cot", "aot") if r[key]["usage"]["source"] == "provider"]
+    input_tokens = sum(u["input_tokens"] for u in usages)
+    if input_tokens:
+        aggregate["cached_input_rate"] = sum(u["cached_input_tokens"] for u in usages) / input_tokens * 100
+    
+    # Tail latency and hedge spend, when the chains were hedged
+    if any(r[key]["latency"].get("hedge") for r in results for key in ("cot", "aot")):
+        for key in ("cot", "aot"):
+            times = sorted(r[key]["time"] for r in results)
+            hedges = sum(1 for r in results if (r[key]["latency"].get("hedge") or {}).get("hedged"))
+            aggregate[f"{key}_p50_time"] = times[len(times) // 2]
+            aggregate[f"{key}_p99_time"] = times[min(len(times) - 1, int(0.99 * len(times)))]
+            aggregate[f"{key}_hedges"] = hedges
+            # Every hedge is one extra call whose result is thrown away
+            aggregate[f"{key}_hedge_waste_ratio"] = hedges / (len(results) + hedges)
+    
+    return aggregate
+
+def display_aggregate(aggregate: Dict[str, float], num_questions: int) -> None:
+    """Render the aggregate statistics table."""
     console.rule("[bold]Aggregate Results")
     aggregate_table = Table(title="Average Performance", show_header=True)
     aggregate_table.add_column("Metric")
     aggregate_table.add_column("Value")
     
+    avg_word_difference = aggregate["word_difference"]
     if avg_word_difference > 0:
         aggregate_table.add_row("Average Word Reduction", f"{avg_word_difference:.1f}%")
     else:
         aggregate_table.add_row("Average Word Increase", f"{-avg_word_difference:.1f}%")
-        
+    
+    avg_token_difference = aggregate["token_difference"]
+    if avg_token_difference > 0:
+        aggregate_table.add_row("Average Output Token Reduction", f"{avg_token_difference:.1f}%")
+    else:
+        aggregate_table.add_row("Average Output Token Increase", f"{-avg_token_difference:.1f}%")
+    
+    avg_time_difference = aggregate["time_difference"]
     if avg_time_difference > 0:
         aggregate_table.add_row("Average Time Reduction", f"{avg_time_difference:.1f}%")
     else:
         aggregate_table.add_row("Average Time Increase", f"{-avg_time_difference:.1f}%")
     
-    aggregate_table.add_row("Average Number of Atoms", f"{avg_num_atoms:.1f}")
-    aggregate_table.add_row("Answer Match Rate", f"{(matching_answers/len(results))*100:.1f}%")
-    aggregate_table.add_row("Questions Tested", str(len(questions)))
+    for key, name in (("cot", "CoT"), ("aot", "AoT")):
+        rate = aggregate[f"{key}_tokens_per_second"]
+        aggregate_table.add_row(f"{name} Tokens (input / output)", f"{aggregate[f'{key}_input_tokens']} / {aggregate[f'{key}_output_tokens']}")
+        aggregate_table.add_row(f"{name} Output Tokens/sec", "-" if rate is None else f"{rate:.1f}")
+        aggregate_table.add_row(f"{name} Total Cost (USD)", format_cost(aggregate[f"{key}_cost"]))
+    
+    aggregate_table.add_row("Average Number of Atoms", f"{aggregate['avg_num_atoms']:.1f}")
+    if "avg_dag_speedup" in aggregate:
+        aggregate_table.add_row("Average DAG Depth", f"{aggregate['avg_dag_depth']:.1f}")
+        aggregate_table.add_row("Average DAG Speedup", f"{aggregate['avg_dag_speedup']:.2f}x")
+    for key, name in (("cot", "CoT"), ("aot", "AoT")):
+        if f"{key}_hedges" in aggregate:
+            aggregate_table.add_row(f"{name} Time p50 / p99 (seconds)", f"{aggregate[f'{key}_p50_time']:.2f} / {aggregate[f'{key}_p99_time']:.2f}")
+            aggregate_table.add_row(f"{name} Hedged Requests", str(aggregate[f"{key}_hedges"]))
+            aggregate_table.add_row(f"{name} Hedge Waste Ratio", f"{aggregate[f'{key}_hedge_waste_ratio']:.1%}")
+    if "cached_input_rate" in aggregate:
+        aggregate_table.add_row("Cached Input Tokens", f"{aggregate['cached_input_rate']:.1f}%")
+    aggregate_table.add_row("Answer Match Rate", f"{aggregate['answer_match_rate']:.1f}%")
+    for key, name in (("cot", "CoT"), ("aot", "AoT")):
+        if f"{key}_accuracy" in aggregate:
+            aggregate_table.add_row(f"{name} Accuracy", f"{aggregate[f'{key}_accuracy']:.1f}%")
+    aggregate_table.add_row("Questions Tested", str(num_questions))
     
     console.print(aggregate_table)
+
+def batch_test(questions: List[str], max_concurrency: Optional[int] = None, chains: Optional[Dict[str, Any]] = None, stream: bool = False, dag_chains: Optional[Dict[str, Any]] = None, sinks: Optional[List[ResultSink]] = None, gold: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Run tests on a batch of questions and compile statistics.
+    
+    Args:
+        questions: Questions to compare the two approaches on
+        max_concurrency: If set, run every question and both chains concurrently
+            through ``abatch_test`` with at most this many model calls in flight
+        chains: Pre-built chains to use instead of creating new ones
+        stream: Stream responses, recording time-to-first-token and stopping
+            each generation once the #### answer line is complete
+        dag_chains: Also execute AoT as a parallel atom DAG (see create_dag_chains)
+        sinks: Run headless: instead of rendering each question, hand its result
+            (with a "question" key) to these sinks on a background thread, e.g.
+            ``[JsonlSink("results.jsonl"), RichSink(display_result)]``
+        gold: Gold answers, one per question, to report each approach's accuracy
+    """
+    if max_concurrency is not None:
+        return asyncio.run(abatch_test(questions, max_concurrency, chains, stream, dag_chains, sinks, gold))
+    
+    if chains is None:
+        chains = create_chains(setup_model())
+    
+    results = []
+    headless = sinks is not None
+    
+    with SinkDispatcher(sinks) if headless else contextlib.nullcontext() as dispatcher:
+        for i, question in enumerate(questions):
+            if not headless:
+                console.rule(f"[bold]Question {i+1}/{len(questions)}")
+            result = compare_chains(question, chains, stream=stream, dag_chains=dag_chains, render=not headless)
+            if headless:
+                dispatcher.emit({"question": question, **result})
+            results.append(result)
+    
+    aggregate = aggregate_results(results, gold)
+    display_aggregate(aggregate, len(questions))
     
     return {
         "individual_results": results, 
-        "aggregate": {
-            "word_difference": avg_word_difference, 
-            "time_difference": avg_time_difference,
-            "avg_num_atoms": avg_num_atoms,
-            "answer_match_rate": (matching_answers/len(results))*100
-        }
+        "aggregate": aggregate
+    }
+
+async def abatch_test(questions: List[str], max_concurrency: int = 8, chains: Optional[Dict[str, Any]] = None, stream: bool = False, dag_chains: Optional[Dict[str, Any]] = None, sinks: Optional[List[ResultSink]] = None, gold: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """
+    Async version of batch_test.
+    
+    All questions and both chains per question are scheduled at once, with a
+    semaphore capping the number of model calls in flight. Results are
+    displayed in question order after the run, so the per-question output and
+    the aggregate table match the serial run. With ``sinks``, each result is
+    instead handed to the sinks as soon as its question completes.
+    """
+    if chains is None:
+        chains = create_chains(setup_model())
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    headless = sinks is not None
+    
+    with SinkDispatcher(sinks) if headless else contextlib.nullcontext() as dispatcher:
+        async def run(question: str) -> Dict[str, Any]:
+            result = await acompare_chains(question, chains, semaphore, stream, dag_chains)
+            if headless:
+                dispatcher.emit({"question": question, **result})
+            return result
+        
+        with console.status(f"[bold cyan]Running {len(questions)} questions ({max_concurrency} concurrent calls)..."):
+            results = await asyncio.gather(*(run(question) for question in questions))
+    
+    if not headless:
+        for i, (question, result) in enumerate(zip(questions, results)):
+            console.rule(f"[bold]Question {i+1}/{len(questions)}")
+            display_result({"question": question, **result})
+    
+    aggregate = aggregate_results(results, gold)
+    display_aggregate(aggregate, len(questions))
+    
+    return {
+        "individual_results": list(results), 
+        "aggregate": aggregate
+    }
+
+def self_consistency(question: str, chain, k: int = 10, **options: Any) -> Dict[str, Any]:
+    """
+    Majority-vote over up to ``k`` samples of a chain.
+    
+    Sampling stops as soon as the remaining samples can no longer overturn
+    the leading answer; the vote table reports how many samples were saved.
+    Extra options (``temperature``, ``use_n``, ``normalize``) go to
+    ``SelfConsistentChain``.
+    
+    Returns:
+        Dictionary with the majority answer, votes and samples drawn/saved
+    """
+    console.print(Panel(question, title="Question", border_style="blue"))
+    
+    with console.status(f"[bold cyan]Sampling up to {k} responses..."):
+        result = SelfConsistentChain(chain, extract_answer, k=k, **options).invoke({"question": question})
+    
+    console.print(vote_table(result))
+    return result
+
+def result_metrics(result: Dict[str, Any]) -> Dict[str, float]:
+    """Per-question numbers that aggregate_results averages, for incremental aggregation."""
+    metrics = {
+        "word_difference": result["metrics"]["word_difference"],
+        "time_difference": result["metrics"]["time_difference"],
+        "num_atoms": result["aot"]["num_atoms"],
+        "answer_match": 100.0 if answer_matches(result["cot"]["answer"], result["aot"]["answer"]) else 0.0
+    }
+    # Results checkpointed before token accounting existed have no usage
+    if "token_difference" in result["metrics"]:
+        metrics["token_difference"] = result["metrics"]["token_difference"]
+        for key in ("cot", "aot"):
+            usage = result[key]["usage"]
+            metrics[f"{key}_input_tokens"] = usage["input_tokens"]
+            metrics[f"{key}_output_tokens"] = usage["output_tokens"]
+            metrics[f"{key}_cost"] = usage["cost"]
+            metrics[f"{key}_tokens_per_second"] = usage["tokens_per_second"]
+    if "aot_dag" in result:
+        metrics["dag_speedup"] = result["metrics"]["dag_speedup"]
+        metrics["dag_depth"] = result["aot_dag"]["depth"]
+    return metrics
+
+def aggregate_from_stats(stats: RunningStats) -> Dict[str, float]:
+    """Build the aggregate_results dictionary from running statistics."""
+    summary = stats.summary()
+    
+    def total(name):
+        return summary[name]["mean"] * summary[name]["n"] if name in summary else None
+    
+    aggregate = {
+        "word_difference": stats.mean("word_difference"),
+        "token_difference": stats.mean("token_difference"),
+        "time_difference": stats.mean("time_difference"),
+        "avg_num_atoms": stats.mean("num_atoms"),
+        "answer_match_rate": stats.mean("answer_match")
+    }
+    for key in ("cot", "aot"):
+        aggregate[f"{key}_input_tokens"] = round(total(f"{key}_input_tokens") or 0)
+        aggregate[f"{key}_output_tokens"] = round(total(f"{key}_output_tokens") or 0)
+        aggregate[f"{key}_cost"] = total(f"{key}_cost")
+        aggregate[f"{key}_tokens_per_second"] = stats.mean(f"{key}_tokens_per_second") if f"{key}_tokens_per_second" in summary else None
+    if "dag_speedup" in summary:
+        aggregate["avg_dag_speedup"] = stats.mean("dag_speedup")
+        aggregate["avg_dag_depth"] = stats.mean("dag_depth")
+    return aggregate
+
+def run_dataset_file(input_path: str, output_path: str, max_concurrency: int = 8, chains: Optional[Dict[str, Any]] = None, stream: bool = False, dag_chains: Optional[Dict[str, Any]] = None, question_field: str = "question") -> Dict[str, Any]:
+    """
+    Compare both approaches on every question of a JSONL/CSV dataset, resumably.
+    
+    Questions are streamed from ``input_path`` and each comparison result is
+    appended to the JSONL ``output_path`` as soon as it finishes. Rerunning
+    with the same output skips the questions already in it, so a crashed run
+    loses at most the questions that were in flight. Aggregates are computed
+    incrementally and per-question output is not rendered, so memory stays
+    flat regardless of the dataset size.
+    
+    Returns:
+        Dictionary with the aggregate over all completed questions and the
+        skipped/completed/failed counts for this run
+    """
+    if chains is None:
+        chains = create_chains(setup_model())
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def evaluate(question: str) -> Dict[str, Any]:
+        return await acompare_chains(question, chains, semaphore, stream, dag_chains)
+    
+    with Progress(console=console, transient=True) as progress:
+        task = progress.add_task("[cyan]Running dataset...", total=None)
+        stats, counts = asyncio.run(run_dataset(
+            input_path, output_path, evaluate, result_metrics,
+            # Keep a few questions queued per free slot so the semaphore stays busy
+            max_concurrency=max_concurrency * 2,
+            question_field=question_field,
+            on_result=lambda item_id, result: progress.advance(task)
+        ))
+    
+    console.print(f"[dim]{counts['completed']} completed, {counts['skipped']} already done, {counts['failed']} failed[/dim]")
+    aggregate = aggregate_from_stats(stats)
+    if stats.count:
+        display_aggregate(aggregate, stats.count)
+    
+    return {
+        "aggregate": aggregate,
+        "counts": counts
     }
 
 if __name__ == "__main__":
+    # Reuse cached responses when GENAI_RESPONSE_CACHE is set
+    cache = cache_from_env()
+    # Time each stage and write a Chrome trace when GENAI_PROFILE is set
+    profile = profiler_from_env()
+    # Cap max_tokens per strategy at a learned output-length quantile when GENAI_TOKEN_BUDGET is set
+    budget = budget_from_env()
+    
     # Sample questions to test
     test_questions = [
         """
@@ -322,5 +989,31 @@ if __name__ == "__main__":
     chains = create_chains(model)
     compare_chains(test_questions[1], chains)
     
-    # Option 2: Uncomment to run batch testing
-    # batch_results = batch_test(test_questions)
\ No newline at end of file
+    # Option 2: Uncomment to also execute AoT as a parallel atom DAG
+    # compare_chains(test_questions[1], chains, dag_chains=create_dag_chains(model))
+    
+    # Option 3: Uncomment to run batch testing
+    # batch_results = batch_test(test_questions)
+    
+    # Option 4: Uncomment to run batch testing concurrently (async, bounded)
+    # batch_results = batch_test(test_questions, max_concurrency=8)
+    
+    # Option 5: Uncomment to hedge slow calls (a duplicate is sent past the p95 latency)
+    # batch_results = batch_test(test_questions, max_concurrency=8, chains=create_chains(model, hedge={"min_samples": 2}))
+    
+    # Option 6: Uncomment to run a JSONL/CSV dataset resumably (rerun to pick up where it stopped)
+    # dataset_results = run_dataset_file("questions.jsonl", "results.jsonl", max_concurrency=8)
+    
+    # Option 7: Uncomment to majority-vote over up to 10 AoT samples (stops early once settled)
+    # self_consistency(test_questions[1], chains["aot"], k=10)
+    
+    # Option 8: Uncomment to run headless: results go to JSONL and a CSV summary on a background thread
+    # batch_results = batch_test(test_questions, max_concurrency=8, sinks=[JsonlSink("results.jsonl"), CsvSink("summary.csv")])
+    
+    if cache:
+        console.print(f"[dim]{cache.summary()}[/dim]")
+    if profile:
+        console.print(profile.table())
+        console.print(f"[dim]Trace written to {profile.export_chrome_trace()}[/dim]")
+    if budget:
+        console.print(budget_table(budget.stats()))
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Benchmark the serial batch_test against the async, bounded-concurrency mode.
+
+Both runs use a local fake chat model with injected latency, so no API key or
+network access is needed:
+
+    python benchmark_async.py --questions 50 --latency 0.2 --concurrency 16
+"""
+import argparse
+import time
+
+from rich.table import Table
+
+import atom_of_thoughts as aot
+from llm_harness.fake import FakeChatModel
+
+def run_benchmark(num_questions: int, latency: float, concurrency: int) -> None:
+    """Time both batch modes and print the speedup and per-call timing accuracy."""
+    chains = aot.create_chains(FakeChatModel(latency=latency))
+    questions = [f"Q: Benchmark question {i}" for i in range(num_questions)]
+
+    # Silence the per-question output; only the timings matter here
+    aot.console.quiet = True
+    try:
+        start = time.perf_counter()
+        serial = aot.batch_test(questions, chains=chains)
+        serial_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        concurrent = aot.batch_test(questions, max_concurrency=concurrency, chains=chains)
+        concurrent_time = time.perf_counter() - start
+    finally:
+        aot.console.quiet = False
+
+    def mean_call_time(run):
+        times = [r[k]["time"] for r in run["individual_results"] for k in ("cot", "aot")]
+        return sum(times) / len(times)
+
+    table = Table(title=f"batch_test: {num_questions} questions, {latency:.3f}s latency", show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    table.add_column("Serial", justify="right")
+    table.add_column(f"Async (limit {concurrency})", justify="right")
+
+    table.add_row("Wall Time (seconds)", f"{serial_time:.2f}", f"{concurrent_time:.2f}")
+    table.add_row("Mean Call Time (seconds)", f"{mean_call_time(serial):.3f}", f"{mean_call_time(concurrent):.3f}")
+    table.add_row("Questions/sec", f"{num_questions / serial_time:.1f}", f"{num_questions / concurrent_time:.1f}")
+    table.add_row("Speedup", "-", f"{serial_time / concurrent_time:.1f}x")
+    table.add_row("Answer Match Rate", f"{serial['aggregate']['answer_match_rate']:.1f}%", f"{concurrent['aggregate']['answer_match_rate']:.1f}%")
+
+    aot.console.print(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    run_benchmark(args.questions, args.latency, args.concurrency)
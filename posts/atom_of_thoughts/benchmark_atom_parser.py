@@ -0,0 +1,105 @@
+"""
+Micro-benchmark: extract_atoms vs the incremental AtomStreamParser.
+
+Builds a multi-megabyte synthetic AoT response and parses it three ways:
+the whole-response extract_atoms/extract_answer pair, the incremental parser
+fed the whole text, and the incremental parser fed small token-sized chunks
+as a stream would deliver them. Peak memory of the streamed run is measured
+with tracemalloc:
+
+    python benchmark_atom_parser.py --megabytes 8
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, Iterator
+
+from rich.table import Table
+
+import atom_of_thoughts as aot
+
+def synthetic_response(target_bytes: int) -> str:
+    """Build an AoT-shaped response of roughly target_bytes characters."""
+    blocks = []
+    size = 0
+    atom = 1
+    while size < target_bytes:
+        block = (
+            f"Atom {atom}: Compute partial quantity {atom}\n"
+            f"Let x{atom} = {atom} * 12 + 7\n"
+            f"x{atom} = {atom * 12 + 7}\n"
+            "This step is independent of the others.\n\n"
+        )
+        blocks.append(block)
+        size += len(block)
+        atom += 1
+    blocks.append("Synthesis: Combine all partial quantities.\n\n#### 42\n")
+    return "".join(blocks)
+
+def chunked(text: str, size: int) -> Iterator[str]:
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+def best_of(repeats: int, fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run_benchmark(megabytes: float, chunk_size: int, repeats: int) -> None:
+    text = synthetic_response(int(megabytes * 1024 * 1024))
+
+    def legacy():
+        return aot.extract_atoms(text), aot.extract_answer(text)
+
+    def incremental_whole():
+        parser = aot.AtomStreamParser()
+        return parser.feed(text) + parser.close(), parser.answer
+
+    def incremental_stream():
+        # Count the atoms instead of keeping them, like a streaming consumer would
+        parser = aot.AtomStreamParser()
+        return sum(1 for _ in aot.iter_atoms(chunked(text, chunk_size), parser)), parser.answer
+
+    expected = legacy()
+    assert incremental_whole() == expected
+    assert incremental_stream() == (len(expected[0]), expected[1])
+
+    timings = {
+        "extract_atoms + extract_answer": best_of(repeats, legacy),
+        "AtomStreamParser (whole text)": best_of(repeats, incremental_whole),
+        f"AtomStreamParser ({chunk_size}-char chunks)": best_of(repeats, incremental_stream),
+    }
+
+    # Peak memory beyond the input text for the streaming consumer
+    tracemalloc.start()
+    incremental_stream()
+    _, stream_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    legacy()
+    _, legacy_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    baseline = timings["extract_atoms + extract_answer"]
+    table = Table(title=f"Parsing a {len(text) / 1024 / 1024:.1f} MB response ({len(expected[0])} blocks)", show_header=True, header_style="bold magenta")
+    table.add_column("Parser", style="dim")
+    table.add_column("Time (ms)", justify="right")
+    table.add_column("MB/s", justify="right")
+    table.add_column("Speedup", justify="right")
+    for name, seconds in timings.items():
+        table.add_row(name, f"{seconds * 1000:.1f}", f"{len(text) / 1024 / 1024 / seconds:.1f}", f"{baseline / seconds:.2f}x")
+    aot.console.print(table)
+    aot.console.print(f"Peak extra memory: extract_atoms {legacy_peak / 1024 / 1024:.1f} MB, streamed parser {stream_peak / 1024:.1f} KB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, default=4)
+    parser.add_argument("--chunk-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    run_benchmark(args.megabytes, args.chunk_size, args.repeats)
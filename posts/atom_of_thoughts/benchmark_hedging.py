@@ -0,0 +1,61 @@
+"""
+Benchmark hedged requests against a heavy-tailed latency distribution.
+
+Both runs use a local fake chat model with lognormal latency, so no API key
+or network access is needed:
+
+    python benchmark_hedging.py --questions 200 --latency 0.05 --spread 1.0
+"""
+import argparse
+import time
+
+from rich.table import Table
+
+import atom_of_thoughts as aot
+from llm_harness.fake import FakeChatModel
+
+def run_benchmark(num_questions: int, latency: float, spread: float, concurrency: int, percentile: float, max_extra_ratio: float) -> None:
+    """Run the same batch with and without hedging and compare tail latency and spend."""
+    questions = [f"Q: Benchmark question {i}" for i in range(num_questions)]
+    hedge = {"percentile": percentile, "max_extra_ratio": max_extra_ratio, "min_samples": 20}
+
+    runs = {}
+    aot.console.quiet = True
+    try:
+        for name, hedge_options in (("Unhedged", False), ("Hedged", hedge)):
+            model = FakeChatModel(latency=latency, latency_distribution="lognormal", latency_spread=spread, seed=7)
+            chains = aot.create_chains(model, hedge=hedge_options)
+            start = time.perf_counter()
+            result = aot.batch_test(questions, max_concurrency=concurrency, chains=chains)
+            runs[name] = (result, time.perf_counter() - start, model.calls)
+    finally:
+        aot.console.quiet = False
+
+    def percentile_time(result, q):
+        times = sorted(r[k]["time"] for r in result["individual_results"] for k in ("cot", "aot"))
+        return times[min(len(times) - 1, int(q * len(times)))]
+
+    table = Table(title=f"Hedging: {num_questions} questions, lognormal latency (median {latency:.3f}s, sigma {spread})", show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    for name in runs:
+        table.add_column(name, justify="right")
+
+    table.add_row("Wall Time (seconds)", *(f"{wall:.2f}" for _, wall, _ in runs.values()))
+    for q in (0.5, 0.95, 0.99):
+        table.add_row(f"Call Time p{int(q * 100)} (seconds)", *(f"{percentile_time(result, q):.3f}" for result, _, _ in runs.values()))
+    table.add_row("Model Calls", *(str(calls) for _, _, calls in runs.values()))
+    table.add_row("Extra Spend", *(f"{calls / (2 * num_questions) - 1:.1%}" for _, _, calls in runs.values()))
+
+    aot.console.print(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--spread", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--percentile", type=float, default=0.95)
+    parser.add_argument("--max-extra-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    run_benchmark(args.questions, args.latency, args.spread, args.concurrency, args.percentile, args.max_extra_ratio)
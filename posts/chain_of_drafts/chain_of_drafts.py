@@ -1,20 +1,43 @@
 import os
-from typing import Dict, Any
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich.text import Text
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
+import sys
+import re
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 
-os.environ["OPENAI_API_KEY"] = "your api key"
+# Make the shared harness in posts/ importable when running this file directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_harness.lazy import LazyConsole
+from llm_harness.models import create_chat_model
+from llm_harness.profiling import profiler, profiler_from_env
+from llm_harness.prompts import build_prompt
+from llm_harness.sinks import CsvSink, JsonlSink, ResultSink, SinkDispatcher
+from llm_harness.strategies import Strategy, register_strategy
+from llm_harness.streaming import extract_answer, format_millis, format_seconds, run_chain
+from llm_harness.usage import (call_usage, chain_model_name, count_tokens, format_cached_tokens, format_cost, format_rate, format_tokens,
+                               prompt_text, token_usage)
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+
+# Rich, LangChain and the model client are loaded on first use, so importing
+# this module (e.g. for extract_answer or the prompts) stays cheap. The model
+# is configured by setup_model's arguments or GENAI_MODEL / GENAI_TEMPERATURE,
+# and ChatOpenAI reads the key from OPENAI_API_KEY.
 
 # Initialize Rich console for pretty printing
-console = Console()
+console = LazyConsole()
 
-# Set up the OpenAI model
-model = ChatOpenAI(model="gpt-4o", temperature=0)
+def setup_model(model_name: Optional[str] = None, temperature: Optional[float] = None, backend: Optional[str] = None, **kwargs: Any) -> "ChatOpenAI":
+    """
+    Initialize the LLM with the specified parameters.
+    
+    Unset arguments come from ``GENAI_MODEL`` / ``GENAI_TEMPERATURE``
+    (default gpt-4o at temperature 0). ``backend="fake"`` (or
+    ``GENAI_BACKEND=fake``) returns the offline FakeChatModel instead of
+    ChatOpenAI; extra kwargs go to the model.
+    """
+    return create_chat_model(model_name, temperature, backend=backend, **kwargs)
 
 # Example for few-shot learning
 FEW_SHOT_EXAMPLE = """
@@ -33,69 +56,346 @@ Think step by step, but only keep a minimum draft for each thinking step, with 5
 Return the answer at the end of the response after a separator ####.
 """
 
-# Create prompt templates
-cot_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content=SYSTEM_MESSAGE_COT),
-    HumanMessage(content=FEW_SHOT_EXAMPLE),
-    HumanMessage(content="{question}")
-])
-
-cod_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content=SYSTEM_MESSAGE_COD),
-    HumanMessage(content=FEW_SHOT_EXAMPLE),
-    HumanMessage(content="{question}")
-])
-
-# Create chains
-cot_chain = cot_prompt | model
-cod_chain = cod_prompt | model
-
-def extract_answer(response: str) -> str:
-    """Extract the final answer after the #### separator."""
-    parts = response.split("####")
-    if len(parts) > 1:
-        return parts[1].strip()
-    return "No answer found"
-
-def compare_chains(question: str) -> None:
-    """Compare Chain of Thought vs Chain of Draft reasoning approaches."""
-    console.print(Panel(question, title="Question", border_style="blue"))
+SYSTEM_MESSAGES = {"cot": SYSTEM_MESSAGE_COT, "cod": SYSTEM_MESSAGE_COD}
+
+# The model, prompt templates and chains, built on first use
+_model = None
+_layout = "default"
+_prompts: Dict[str, Any] = {}
+_chains: Dict[str, Any] = {}
+
+def get_model():
+    """The module's model, created with ``setup_model()`` on first use."""
+    global _model
+    if _model is None:
+        _model = setup_model()
+    return _model
+
+def get_prompt(name: str):
+    """The prompt template of ``"cot"`` or ``"cod"`` for the current layout."""
+    if name not in _prompts:
+        _prompts[name] = build_prompt(SYSTEM_MESSAGES[name], FEW_SHOT_EXAMPLE, _layout)
+    return _prompts[name]
+
+def get_chain(name: str):
+    """The ``prompt | model`` chain of ``"cot"`` or ``"cod"``."""
+    if name not in _chains:
+        _chains[name] = get_prompt(name) | get_model()
+    return _chains[name]
+
+def __getattr__(name: str) -> Any:
+    # Keep model, cot_prompt, cod_chain, ... available as module attributes
+    if name == "model":
+        return get_model()
+    strategy, _, kind = name.partition("_")
+    if strategy in SYSTEM_MESSAGES and kind in ("prompt", "chain"):
+        return get_prompt(strategy) if kind == "prompt" else get_chain(strategy)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Register both approaches for llm_harness.strategies.run_strategies (prompts are read at bind time)
+register_strategy(Strategy("cot", "Chain of Thought", lambda: {"main": get_prompt("cot")}))
+register_strategy(Strategy("cod", "Chain of Draft", lambda: {"main": get_prompt("cod")}))
+
+def set_model(new_model) -> None:
+    """Swap the module-level model (e.g. for a FakeChatModel); the chains are rebuilt on next use."""
+    global _model
+    _model = new_model
+    _chains.clear()
+
+def set_prompt_layout(layout: str) -> None:
+    """
+    Rebuild the prompts with a different layout and rebuild the chains.
     
-    # Get Chain of Thought response
-    cot_response = cot_chain.invoke({"question": question})
-    cot_content = cot_response.content
-    cot_tokens = len(cot_content.split())
-    cot_answer = extract_answer(cot_content)
+    ``"shared_prefix"`` puts the shared few-shot example before the system
+    message, so CoT and CoD prompts (and every question) share a prefix that
+    provider prompt caches can reuse; ``"default"`` restores the original order.
+    """
+    global _layout
+    _layout = layout
+    _prompts.clear()
+    _chains.clear()
+
+def _measure(chain, question: str, stream: bool, strategy: str) -> Dict[str, Any]:
+    """Run one chain and collect its response, answer, latency breakdown and token usage."""
+    run = run_chain(chain, {"question": question}, stream=stream, strategy=strategy)
+    with profiler.span("parse", strategy):
+        words = len(run.content.split())
+        answer = extract_answer(run.content)
+    with profiler.span("usage", strategy):
+        prompt = None if token_usage(run.message) else prompt_text(chain, {"question": question})
+        usage = call_usage(run.message, run.content, run.total, prompt=prompt, model_name=chain_model_name(chain))
+    return {"content": run.content, "words": words, "answer": answer, "time": run.total, "latency": run.latency(), "usage": usage}
+
+def display_comparison(results: Dict[str, Any]) -> None:
+    """Render the responses and comparison table of ``compare_chains``; also usable as ``RichSink(display_comparison)``."""
+    from rich.panel import Panel
+    from rich.table import Table
     
-    # Get Chain of Draft response
-    cod_response = cod_chain.invoke({"question": question})
-    cod_content = cod_response.content
-    cod_tokens = len(cod_content.split())
-    cod_answer = extract_answer(cod_content)
+    cot, cod, metrics = results["cot"], results["cod"], results["metrics"]
+    cot_usage, cod_usage = cot["usage"], cod["usage"]
+    cot_latency, cod_latency = cot["latency"], cod["latency"]
+    
+    with profiler.span("render"):
+        if "question" in results:
+            console.print(Panel(results["question"], title="Question", border_style="blue"))
+        
+        # Display the responses in pretty format
+        console.print("\n[bold cyan]Chain of Thought Response:[/bold cyan]")
+        console.print(Panel(cot["content"], border_style="cyan"))
+        
+        console.print("\n[bold green]Chain of Draft Response:[/bold green]")
+        console.print(Panel(cod["content"], border_style="green"))
+        
+        # Create comparison table
+        table = Table(title="Comparison Results", show_header=True, header_style="bold magenta")
+        table.add_column("Metric", style="dim")
+        table.add_column("Chain of Thought", justify="right")
+        table.add_column("Chain of Draft", justify="right")
+        
+        table.add_row("Word Count", str(cot["words"]), str(cod["words"]))
+        table.add_row("Input Tokens", format_tokens(cot_usage, "input_tokens"), format_tokens(cod_usage, "input_tokens"))
+        table.add_row("Output Tokens", format_tokens(cot_usage, "output_tokens"), format_tokens(cod_usage, "output_tokens"))
+        table.add_row("Time (seconds)", format_seconds(cot["time"]), format_seconds(cod["time"]))
+        table.add_row("Output Tokens/sec", format_rate(cot_usage), format_rate(cod_usage))
+        table.add_row("Cost (USD)", format_cost(cot_usage["cost"]), format_cost(cod_usage["cost"]))
+        if cot_latency["streamed"]:
+            table.add_row("Time to First Token (seconds)", format_seconds(cot_latency["ttft"]), format_seconds(cod_latency["ttft"]))
+            table.add_row("Inter-token Latency (ms, mean)", format_millis(cot_latency["mean_inter_token"]), format_millis(cod_latency["mean_inter_token"]))
+            table.add_row("Inter-token Latency (ms, p95)", format_millis(cot_latency["p95_inter_token"]), format_millis(cod_latency["p95_inter_token"]))
+        if cot_usage["source"] == "provider" or cod_usage["source"] == "provider":
+            table.add_row("Cached Input Tokens (of total)", format_cached_tokens(cot_usage), format_cached_tokens(cod_usage))
+        table.add_row("Final Answer", cot["answer"], cod["answer"])
+        table.add_row("Token Reduction", "", f"{metrics['token_reduction']:.1f}%")
+        table.add_row("Word Reduction", "", f"{metrics['word_reduction']:.1f}%")
+        
+        console.print(table)
+
+def compare_chains(question: str, stream: bool = False, render: bool = True) -> Dict[str, Any]:
+    """
+    Compare Chain of Thought vs Chain of Draft reasoning approaches.
+    
+    Token counts come from the provider's usage metadata (or are counted
+    locally when a response carries none), so the reduction is measured in
+    billed output tokens rather than words.
+    
+    Set ``stream=True`` to stream both responses, report time-to-first-token and
+    inter-token latency, and stop each generation once the #### answer line is done.
+    With ``render=False`` nothing is printed (headless mode; see ``batch_compare``).
+    
+    Returns:
+        Dictionary with the question, both responses, their usage and the token/word reduction
+    """
+    # Get Chain of Thought and Chain of Draft responses
+    cot = _measure(get_chain("cot"), question, stream, "cot")
+    cod = _measure(get_chain("cod"), question, stream, "cod")
     
     # Calculate token reduction
-    reduction = ((cot_tokens - cod_tokens) / cot_tokens) * 100
+    cot_tokens, cod_tokens = cot["usage"]["output_tokens"], cod["usage"]["output_tokens"]
+    reduction = ((cot_tokens - cod_tokens) / cot_tokens) * 100 if cot_tokens else 0.0
+    word_reduction = ((cot["words"] - cod["words"]) / cot["words"]) * 100 if cot["words"] else 0.0
+    
+    results = {
+        "question": question,
+        "cot": cot,
+        "cod": cod,
+        "metrics": {"token_reduction": reduction, "word_reduction": word_reduction}
+    }
+    if render:
+        display_comparison(results)
+    
+    return results
+
+def batch_compare(questions: List[str], sinks: List[ResultSink], stream: bool = False) -> List[Dict[str, Any]]:
+    """
+    Compare CoT and CoD on many questions headlessly.
+    
+    Nothing is rendered on the request path: each result goes to ``sinks`` on a
+    background thread, e.g. ``[JsonlSink("results.jsonl"), CsvSink("summary.csv")]``
+    (add ``RichSink(display_comparison)`` to still print them).
+    
+    Returns:
+        The results of every question, in order
+    """
+    results = []
+    with SinkDispatcher(sinks) as dispatcher:
+        for question in questions:
+            result = compare_chains(question, stream=stream, render=False)
+            dispatcher.emit(result)
+            results.append(result)
+    return results
+
+# A number, optionally signed, with currency, thousands separators, decimals or a fraction
+NUMERIC_ANSWER = re.compile(r"[-+]?\$?\s*\d[\d,]*(\.\d+)?(/\d+)?")
+
+@dataclass
+class RouterPolicy:
+    """
+    When the cascade escalates a Chain of Draft answer to a stronger chain.
     
-    # Display the responses in pretty format
-    console.print("\n[bold cyan]Chain of Thought Response:[/bold cyan]")
-    console.print(Panel(cot_content, border_style="cyan"))
+    Each enabled check is a cheap confidence signal; the first one that fails
+    sends the question to ``escalate_to`` (the CoT chain when None, or any
+    chain taking ``question``, e.g. an AoT or step-back chain).
+    """
+    require_answer: bool = True
+    """Escalate when the draft has no #### answer."""
+    require_numeric: bool = True
+    """Escalate when the answer is not a short number."""
+    drafts: int = 1
+    """Draft this many times (concurrently); escalate if the answers disagree."""
+    draft_temperature: float = 0.7
+    """Sampling temperature for the extra drafts, so they can disagree."""
+    max_answer_words: int = 4
+    escalate_to: Any = None
+
+def is_numeric_answer(answer: str, max_words: int = 4) -> bool:
+    """Whether an answer is a short numeric value such as ``17``, ``$2,450.50`` or ``3 cakes``."""
+    return bool(NUMERIC_ANSWER.search(answer)) and len(answer.split()) <= max_words
+
+def route_drafts(answers: List[str], policy: RouterPolicy) -> Optional[str]:
+    """Return why the drafts should be escalated, or None to accept the first draft."""
+    from llm_harness.scoring import answer_key
+    
+    if policy.require_answer and any(answer == "No answer found" for answer in answers):
+        return "missing answer"
+    if policy.require_numeric and not all(is_numeric_answer(answer, policy.max_answer_words) for answer in answers):
+        return "non-numeric answer"
+    if len({answer_key(answer) for answer in answers}) > 1:
+        return "drafts disagree"
+    return None
+
+def _output_tokens(message) -> int:
+    """Output tokens from a response's usage metadata, falling back to a local count."""
+    usage = token_usage(message)
+    return usage["output_tokens"] if usage else count_tokens(message.content)
+
+def cascade(question: str, policy: Optional[RouterPolicy] = None) -> Dict[str, Any]:
+    """
+    Answer with Chain of Draft, escalating to a stronger chain only when needed.
+    
+    Returns:
+        Dictionary with the answer, whether and why it escalated, and the
+        total output tokens and time spent across all calls
+    """
+    from langchain_core.runnables import RunnableParallel
+    from llm_harness.consistency import sampling_model
+    
+    policy = policy or RouterPolicy()
+    start = time.perf_counter()
+    
+    inputs = {"question": question}
+    draft_chains = {"draft_0": get_chain("cod")}
+    if policy.drafts > 1:
+        # Extra drafts are sampled (and bypass the response cache) so they can disagree
+        sampled_chain = get_prompt("cod") | sampling_model(get_model(), policy.draft_temperature)
+        draft_chains.update({f"draft_{i}": sampled_chain for i in range(1, policy.drafts)})
+    with profiler.span("model", "cascade.draft", drafts=policy.drafts):
+        drafts = list(RunnableParallel(draft_chains).invoke(inputs).values())
+    answers = [extract_answer(draft.content) for draft in drafts]
+    tokens = sum(_output_tokens(draft) for draft in drafts)
+    
+    reason = route_drafts(answers, policy)
+    content, answer = drafts[0].content, answers[0]
+    if reason is not None:
+        with profiler.span("model", "cascade.escalate", reason=reason):
+            escalation = (policy.escalate_to or get_chain("cot")).invoke(inputs)
+        content, answer = escalation.content, extract_answer(escalation.content)
+        tokens += _output_tokens(escalation)
+    
+    return {
+        "content": content,
+        "answer": answer,
+        "escalated": reason is not None,
+        "reason": reason,
+        "draft_answers": answers,
+        "tokens": tokens,
+        "time": time.perf_counter() - start
+    }
+
+def cascade_dataset(questions: List[str], policy: Optional[RouterPolicy] = None) -> Dict[str, Any]:
+    """
+    Compare the CoD-first cascade with always running CoT over a set of questions.
+    
+    Returns:
+        Dictionary with per-question results and the averages shown in the table
+    """
+    from rich.table import Table
+    from llm_harness.scoring import answer_matches
+    
+    results = []
+    for i, question in enumerate(questions):
+        with console.status(f"[bold cyan]Question {i+1}/{len(questions)}..."):
+            routed = cascade(question, policy)
+            cot_run = run_chain(get_chain("cot"), {"question": question}, strategy="cot")
+        results.append({
+            "question": question,
+            "cascade": routed,
+            "cot": {"answer": extract_answer(cot_run.content), "tokens": _output_tokens(cot_run.message), "time": cot_run.total}
+        })
     
-    console.print("\n[bold green]Chain of Draft Response:[/bold green]")
-    console.print(Panel(cod_content, border_style="green"))
+    n = len(results)
+    summary = {
+        "cascade_tokens": sum(r["cascade"]["tokens"] for r in results) / n,
+        "cot_tokens": sum(r["cot"]["tokens"] for r in results) / n,
+        "cascade_time": sum(r["cascade"]["time"] for r in results) / n,
+        "cot_time": sum(r["cot"]["time"] for r in results) / n,
+        "escalation_rate": sum(r["cascade"]["escalated"] for r in results) / n * 100,
+        "answer_match_rate": sum(answer_matches(r["cascade"]["answer"], r["cot"]["answer"]) for r in results) / n * 100
+    }
     
-    # Create comparison table
-    table = Table(title="Comparison Results", show_header=True, header_style="bold magenta")
+    table = Table(title=f"Cascade vs Always-CoT ({n} questions)", show_header=True, header_style="bold magenta")
     table.add_column("Metric", style="dim")
-    table.add_column("Chain of Thought", justify="right")
-    table.add_column("Chain of Draft", justify="right")
+    table.add_column("Always CoT", justify="right")
+    table.add_column("CoD → CoT Cascade", justify="right")
     
-    table.add_row("Word Count", str(cot_tokens), str(cod_tokens))
-    table.add_row("Final Answer", cot_answer, cod_answer)
-    table.add_row("Token Reduction", "", f"{reduction:.1f}%")
+    table.add_row("Average Output Tokens", f"{summary['cot_tokens']:.1f}", f"{summary['cascade_tokens']:.1f}")
+    table.add_row("Average Time (seconds)", f"{summary['cot_time']:.2f}", f"{summary['cascade_time']:.2f}")
+    table.add_row("Escalation Rate", "-", f"{summary['escalation_rate']:.1f}%")
+    table.add_row("Answer Match vs CoT", "-", f"{summary['answer_match_rate']:.1f}%")
+    if summary["cot_tokens"] > 0:
+        table.add_row("Token Reduction", "-", f"{(1 - summary['cascade_tokens'] / summary['cot_tokens']) * 100:.1f}%")
     
     console.print(table)
+    
+    return {
+        "individual_results": results,
+        "summary": summary
+    }
+
+def self_consistency(question: str, chain=None, k: int = 10, **options: Any) -> Dict[str, Any]:
+    """
+    Majority-vote over up to ``k`` samples of a chain (the CoD chain by default).
+    
+    Sampling stops as soon as the remaining samples can no longer overturn
+    the leading answer; the vote table reports how many samples were saved.
+    Extra options (``temperature``, ``use_n``, ``normalize``) go to
+    ``SelfConsistentChain``.
+    
+    Returns:
+        Dictionary with the majority answer, votes and samples drawn/saved
+    """
+    from rich.panel import Panel
+    from llm_harness.consistency import SelfConsistentChain, vote_table
+    
+    chain = get_chain("cod") if chain is None else chain
+    console.print(Panel(question, title="Question", border_style="blue"))
+    
+    with console.status(f"[bold cyan]Sampling up to {k} responses..."):
+        result = SelfConsistentChain(chain, extract_answer, k=k, **options).invoke({"question": question})
+    
+    console.print(vote_table(result))
+    return result
 
 if __name__ == "__main__":
+    from llm_harness.budget import budget_from_env, budget_table
+    from llm_harness.cache import cache_from_env
+    
+    # Reuse cached responses when GENAI_RESPONSE_CACHE is set
+    cache = cache_from_env()
+    # Time each stage and write a Chrome trace when GENAI_PROFILE is set
+    profile = profiler_from_env()
+    # Cap max_tokens per strategy at a learned output-length quantile when GENAI_TOKEN_BUDGET is set
+    budget = budget_from_env()
+    
     # Run comparison with a test question
     test_question = """
     Q: A bakery sells muffins for $4 each and cakes for $12 each. 
@@ -103,4 +403,25 @@ if __name__ == "__main__":
     how many cakes did he buy?
     """
     
-    compare_chains(test_question)
\ No newline at end of file
+    compare_chains(test_question)
+    
+    # Uncomment to put the shared few-shot example first so prompt caches hit across CoT/CoD
+    # set_prompt_layout("shared_prefix")
+    # compare_chains(test_question)
+    
+    # Uncomment to answer with CoD first and escalate to CoT only on weak drafts
+    # cascade_dataset([test_question], RouterPolicy(drafts=2))
+    
+    # Uncomment to majority-vote over up to 10 Chain of Draft samples (stops early once settled)
+    # self_consistency(test_question, get_chain("cod"), k=10)
+    
+    # Uncomment to compare headlessly: results go to JSONL and a CSV summary on a background thread
+    # batch_compare([test_question], [JsonlSink("cod_results.jsonl"), CsvSink("cod_summary.csv")])
+    
+    if cache:
+        console.print(f"[dim]{cache.summary()}[/dim]")
+    if profile:
+        console.print(profile.table())
+        console.print(f"[dim]Trace written to {profile.export_chrome_trace()}[/dim]")
+    if budget:
+        console.print(budget_table(budget.stats()))
\ No newline at end of file
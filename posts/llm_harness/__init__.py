@@ -0,0 +1,7 @@
+"""
+Shared execution harness for the technique posts.
+
+The posts in this directory stay independent scripts; this package holds the
+plumbing they share (response caching and friends). Submodules are imported
+explicitly, e.g. ``from llm_harness.cache import enable_response_cache``.
+"""
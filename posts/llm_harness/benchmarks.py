@@ -0,0 +1,418 @@
+"""
+Harness-overhead benchmarks for the technique scripts.
+
+Every case runs against a zero-latency FakeChatModel, so the numbers measure
+our own code (prompt formatting, LangChain plumbing, parsing, Rich
+rendering) and not provider latency. Run from the posts/ directory:
+
+    python -m llm_harness.benchmarks --questions 200
+
+Compare the output between commits to catch regressions in the harness.
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from rich.console import Console
+from rich.table import Table
+
+from llm_harness.fake import FakeChatModel
+from llm_harness.profiling import DEFAULT_TRACE_PATH, Profiler, profiler
+from llm_harness.sinks import JsonlSink
+from llm_harness.strategies import POSTS_DIR, TECHNIQUE_DIRS, load_techniques
+
+console = Console()
+
+@contextlib.contextmanager
+def rendering(module: Any, enabled: bool) -> Iterator[None]:
+    """Send a module's Rich output to memory (enabled) or drop it (disabled)."""
+    original = module.console
+    module.console = Console(file=io.StringIO(), width=120, quiet=not enabled)
+    try:
+        yield
+    finally:
+        module.console = original
+
+def per_call(fn: Callable[[], Any], repeats: int) -> List[float]:
+    """Wall time of each of ``repeats`` calls, in seconds."""
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def _row(table: Table, name: str, samples: List[float]) -> None:
+    total = sum(samples)
+    table.add_row(
+        name,
+        f"{statistics.median(samples) * 1e6:,.0f}",
+        f"{sorted(samples)[int(0.95 * (len(samples) - 1))] * 1e6:,.0f}",
+        f"{len(samples) / total:,.1f}" if total > 0 else "-"
+    )
+
+def run_benchmarks(questions: int) -> None:
+    modules = load_techniques()
+    aot = modules["atom_of_thoughts"]
+    cod = modules["chain_of_drafts"]
+    stepback = modules["step_back_prompting"]
+
+    fake = FakeChatModel()
+    cod.set_model(fake)
+    stepback.set_model(fake)
+    aot_chains = aot.create_chains(fake)
+    question = "Q: A bakery sells muffins for $4 each and cakes for $12 each. How many cakes?"
+    batch = [f"{question} (#{i})" for i in range(questions)]
+
+    # Per-stage overhead on the AoT chain: prompt, model plumbing, parsing, rendering
+    prompt, model = aot_chains["aot"].first, aot_chains["aot"].last
+    messages = prompt.invoke({"question": question})
+    response = model.invoke(messages)
+    results = aot.build_comparison(
+        aot.measure_performance(aot_chains["cot"], question),
+        aot.measure_performance(aot_chains["aot"], question)
+    )
+
+    stages = Table(title="Per-stage overhead (AoT chain, fake model)", show_header=True, header_style="bold magenta")
+    stages.add_column("Stage", style="dim")
+    stages.add_column("Median (µs)", justify="right")
+    stages.add_column("p95 (µs)", justify="right")
+    stages.add_column("Calls/sec", justify="right")
+    _row(stages, "Prompt formatting", per_call(lambda: prompt.invoke({"question": question}), questions))
+    _row(stages, "Model call plumbing", per_call(lambda: model.invoke(messages), questions))
+    _row(stages, "Full chain invoke", per_call(lambda: aot_chains["aot"].invoke({"question": question}), questions))
+    _row(stages, "extract_answer", per_call(lambda: aot.extract_answer(response.content), questions))
+    _row(stages, "extract_atoms", per_call(lambda: aot.extract_atoms(response.content), questions))
+    with rendering(aot, enabled=True):
+        _row(stages, "Rich rendering (display_comparison)", per_call(lambda: aot.display_comparison(results), questions))
+    for enabled in (False, True):
+        spans = Profiler(enabled=enabled)
+        _row(stages, f"Profiler span ({'enabled' if enabled else 'disabled'}, x1000)", per_call(lambda: _spans(spans, 1000), questions))
+    console.print(stages)
+
+    # End-to-end harness throughput, with and without rendering
+    throughput = Table(title=f"Harness throughput ({questions} questions, fake model)", show_header=True, header_style="bold magenta")
+    throughput.add_column("Entry point", style="dim")
+    throughput.add_column("Median (µs)", justify="right")
+    throughput.add_column("p95 (µs)", justify="right")
+    throughput.add_column("Questions/sec", justify="right")
+
+    for enabled in (False, True):
+        # Note: a quiet Rich console still builds every renderable, it only drops the output
+        label = "rendered" if enabled else "console quiet"
+        with rendering(aot, enabled):
+            start = time.perf_counter()
+            aot.batch_test(batch, chains=aot_chains)
+            elapsed = time.perf_counter() - start
+            _row(throughput, f"atom_of_thoughts.batch_test ({label})", [elapsed / questions] * questions)
+        with rendering(cod, enabled):
+            _row(throughput, f"chain_of_drafts.compare_chains ({label})", per_call(lambda: cod.compare_chains(question), questions))
+        with rendering(stepback, enabled):
+            _row(throughput, f"step_back_prompting.compare_approaches ({label})", per_call(lambda: stepback.compare_approaches(question), questions))
+
+    # Headless: results go to a JSONL sink on the dispatcher thread instead of the terminal
+    with tempfile.TemporaryDirectory() as tmp, rendering(aot, enabled=True):
+        start = time.perf_counter()
+        aot.batch_test(batch, chains=aot_chains, sinks=[JsonlSink(os.path.join(tmp, "results.jsonl"))])
+        elapsed = time.perf_counter() - start
+        _row(throughput, "atom_of_thoughts.batch_test (headless, JSONL sink)", [elapsed / questions] * questions)
+
+    console.print(throughput)
+
+def _spans(spans: Profiler, count: int) -> None:
+    for _ in range(count):
+        with spans.span("parse", "aot"):
+            pass
+
+def run_profile(questions: int, trace_path: str, max_concurrency: int = 16, latency: float = 0.05) -> None:
+    """Profile an async AoT batch stage by stage and write its Chrome trace."""
+    aot = load_techniques()["atom_of_thoughts"]
+    chains = aot.create_chains(FakeChatModel(latency=latency, latency_distribution="lognormal", seed=0))
+    batch = [f"Q: Profiled question {i}" for i in range(questions)]
+
+    profiler.reset()
+    profiler.enable()
+    try:
+        with rendering(aot, enabled=True):
+            aot.batch_test(batch, max_concurrency=max_concurrency, chains=chains)
+    finally:
+        profiler.disable()
+    console.print(profiler.table(title=f"Per-stage latency ({questions} questions, {max_concurrency} concurrent calls)"))
+    console.print(f"[dim]Trace written to {profiler.export_chrome_trace(trace_path)} (open in ui.perfetto.dev or chrome://tracing)[/dim]")
+
+def run_rate_limit_benchmark(questions: int, capacity: int = 16, latency: float = 0.05) -> None:
+    """
+    Drive an AoT batch through the RequestScheduler against a fake provider
+    that returns 429s above ``capacity`` concurrent requests, and compare it
+    with fixed concurrency limits.
+    """
+    from llm_harness.ratelimit import RequestScheduler
+
+    aot = load_techniques()["atom_of_thoughts"]
+    batch = [f"Q: Rate limit benchmark question {i}" for i in range(questions)]
+    ideal = 2 * questions * latency / capacity
+
+    table = Table(title=f"Throughput vs a provider capped at {capacity} concurrent requests", show_header=True, header_style="bold magenta")
+    table.add_column("Mode", style="dim")
+    table.add_column("Wall Time (seconds)", justify="right")
+    table.add_column("Questions/sec", justify="right")
+    table.add_column("429s", justify="right")
+    table.add_column("Final Limit", justify="right")
+
+    for mode, initial, maximum in [("Fixed limit 4", 4, 4), (f"Fixed limit {capacity}", capacity, capacity), ("Adaptive (AIMD from 2)", 2, 256)]:
+        fake = FakeChatModel(latency=latency, max_concurrency=capacity)
+        scheduler = RequestScheduler(default_limits=(1e6, 1e9), initial_concurrency=initial, max_concurrency=maximum, backoff_base=latency, seed=0)
+        chains = aot.create_chains(scheduler.wrap(fake))
+        with rendering(aot, enabled=False):
+            start = time.perf_counter()
+            aot.batch_test(batch, max_concurrency=4 * capacity, chains=chains)
+            elapsed = time.perf_counter() - start
+        table.add_row(mode, f"{elapsed:.2f}", f"{questions / elapsed:.1f}", str(scheduler.stats["throttled"]), f"{scheduler.concurrency.limit:.1f}")
+
+    table.add_row("Ideal (capacity-bound)", f"{ideal:.2f}", f"{questions / ideal:.1f}", "0", str(capacity))
+    console.print(table)
+
+def run_scoring_benchmark(rows: int = 100_000, n_boot: int = 1000) -> None:
+    """Score a synthetic CoT/AoT result set against gold answers, stage by stage."""
+    import numpy as np
+
+    from llm_harness.scoring import evaluate, evaluation_table, normalize_answers, result_columns
+
+    rng = np.random.default_rng(0)
+    gold = rng.integers(0, 10_000, rows)
+    formats = ["{}", "${}.00", "{} cakes", "x = {}", "{:,}"]
+
+    def answer(value: int, accuracy: float) -> str:
+        if rng.random() > accuracy:
+            return "No answer found" if rng.random() < 0.2 else str(value + 1)
+        return formats[rng.integers(len(formats))].format(value)
+
+    results = [
+        {
+            "id": str(i),
+            "cot": {"answer": answer(g, 0.8), "time": rng.lognormal(0, 0.5), "usage": {"output_tokens": int(rng.integers(100, 300)), "cost": 1e-3}},
+            "aot": {"answer": answer(g, 0.85), "time": rng.lognormal(0.2, 0.5), "usage": {"output_tokens": int(rng.integers(50, 200)), "cost": 8e-4}}
+        }
+        for i, g in enumerate(gold)
+    ]
+
+    table = Table(title=f"Scoring engine ({rows:,} rows, {n_boot} bootstrap resamples)", show_header=True, header_style="bold magenta")
+    table.add_column("Stage", style="dim")
+    table.add_column("Time (seconds)", justify="right")
+    table.add_column("Rows/sec", justify="right")
+
+    gold_answers = [str(g) for g in gold]
+    stages = [
+        ("result_columns", lambda: result_columns(results)),
+        ("normalize_answers (one column)", lambda: normalize_answers([r["cot"]["answer"] for r in results])),
+    ]
+    columns = None
+    for name, fn in stages:
+        start = time.perf_counter()
+        output = fn()
+        elapsed = time.perf_counter() - start
+        columns = columns if columns is not None else output
+        table.add_row(name, f"{elapsed:.2f}", f"{rows / elapsed:,.0f}")
+    start = time.perf_counter()
+    evaluation = evaluate(columns, gold_answers, n_boot=n_boot)
+    elapsed = time.perf_counter() - start
+    table.add_row("evaluate (accuracy, percentiles, bootstrap CIs)", f"{elapsed:.2f}", f"{rows / elapsed:,.0f}")
+    console.print(table)
+    console.print(evaluation_table(evaluation))
+
+def run_http_benchmark(questions: int, concurrency: int = 8, handshake: float = 0.05, latency: float = 0.02) -> None:
+    """
+    ChatOpenAI against a local stub server: a client per call, the default client and the shared pool.
+
+    Each new connection to the stub costs ``handshake`` seconds, standing in
+    for a TCP + TLS handshake, so the table shows what connection reuse and
+    warm-up save on a batch of ``questions`` calls, ``concurrency`` at a time.
+    """
+    import asyncio
+
+    import httpx
+    from langchain_openai import ChatOpenAI
+
+    from llm_harness.fake import FakeOpenAIServer
+    from llm_harness.pool import awarm_up, get_async_http_client, pool_metrics, pool_table
+
+    table = Table(title=f"HTTP client ({questions} calls, {concurrency} in flight, {handshake * 1e3:.0f} ms handshake)", show_header=True,
+                  header_style="bold magenta")
+    table.add_column("Client", style="dim")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("p50 (ms)", justify="right")
+    table.add_column("p95 (ms)", justify="right")
+    table.add_column("Max (ms)", justify="right")
+    table.add_column("Conns", justify="right")
+    table.add_column("Warm-up (ms)", justify="right")
+
+    with FakeOpenAIServer(latency=latency, handshake=handshake) as server:
+        options = {"base_url": server.base_url, "api_key": "fake", "max_retries": 0}
+
+        async def batch(case: str) -> Tuple[List[float], float, Optional[float]]:
+            semaphore = asyncio.Semaphore(concurrency)
+            shared = ChatOpenAI(**options, http_async_client=get_async_http_client()) if case.startswith("shared") else ChatOpenAI(**options)
+            warm = (await awarm_up(concurrency, server.base_url))["time"] if case == "shared (warmed up)" else None
+
+            async def call(i: int) -> float:
+                async with semaphore:
+                    start = time.perf_counter()
+                    if case == "per call":
+                        async with httpx.AsyncClient() as client:
+                            await ChatOpenAI(**options, http_async_client=client).ainvoke(f"Question {i}")
+                    else:
+                        await shared.ainvoke(f"Question {i}")
+                    return time.perf_counter() - start
+
+            start = time.perf_counter()
+            samples = await asyncio.gather(*(call(i) for i in range(questions)))
+            return sorted(samples), time.perf_counter() - start, warm
+
+        for case in ("per call", "default client", "shared (cold)", "shared (warmed up)"):
+            # A fresh event loop per case, so every pool starts cold
+            connections = server.connections
+            samples, wall, warm = asyncio.run(batch(case))
+            table.add_row(case, f"{wall:.2f}", f"{statistics.median(samples) * 1e3:,.1f}", f"{samples[int(0.95 * (len(samples) - 1))] * 1e3:,.1f}",
+                          f"{samples[-1] * 1e3:,.1f}", f"{server.connections - connections:,}", f"{warm * 1e3:,.1f}" if warm is not None else "-")
+    console.print(table)
+    console.print(pool_table(pool_metrics.snapshot(), title="Shared pool (both shared runs, warm-up included)"))
+
+def run_budget_benchmark(questions: int, concurrency: int = 16, runaway_rate: float = 0.05, runaway_tokens: int = 2000,
+                         tokens_per_second: float = 2000) -> None:
+    """
+    The same fake workload with and without the adaptive ``max_tokens`` caps.
+
+    Normal responses are 40-120 tokens ending in a #### answer; a
+    ``runaway_rate`` share ramble for ``runaway_tokens`` tokens without one.
+    Each response is seeded by its question, so every run sees the same
+    runaways and, as at temperature 0, a retried runaway rambles again: the
+    "capped" row is what the caps alone remove. The "resampled" row also
+    seeds each retry by its attempt, as with a sampling temperature, so it
+    adds what retries recover on top.
+    """
+    import asyncio
+    import collections
+    import random
+
+    from langchain_core.prompts import ChatPromptTemplate
+
+    from llm_harness.budget import budget_table, token_budget
+    from llm_harness.streaming import ANSWER_SEPARATOR, arun_chain
+    from llm_harness.usage import token_usage
+
+    prompt = ChatPromptTemplate.from_messages([("human", "{question}")])
+    table = Table(title=f"Token budget ({questions} calls, {runaway_rate:.0%} runaways of {runaway_tokens:,} tokens)", show_header=True,
+                  header_style="bold magenta")
+    table.add_column("Run", style="dim")
+    for column in ("Wall (s)", "p50 (s)", "p95 (s)", "p99 (s)", "Tokens", "Retries", "Recovered", "Gave up", "Answered"):
+        table.add_column(column, justify="right")
+
+    for label, enabled, resample in (("uncapped", False, False), ("capped", True, False), ("resampled", True, True)):
+        attempts: Dict[str, int] = collections.Counter()
+
+        def responder(messages, resample=resample, attempts=attempts) -> str:
+            question = messages[-1].content
+            attempts[question] += 1
+            rng = random.Random(f"{question}/{attempts[question]}" if resample else question)
+            if rng.random() < runaway_rate:
+                return "Let me reconsider the problem once more. " * (runaway_tokens // 14)
+            return "draft " * rng.randint(20, 60) + f"{ANSWER_SEPARATOR} 42\n"
+
+        chain = prompt | FakeChatModel(responder=responder, tokens_per_second=tokens_per_second)
+        token_budget.reset()
+        token_budget.enabled = enabled
+
+        async def batch() -> List[Any]:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def call(i: int) -> Any:
+                async with semaphore:
+                    return await arun_chain(chain, {"question": f"Question {i}"}, strategy="cot")
+
+            return await asyncio.gather(*(call(i) for i in range(questions)))
+
+        start = time.perf_counter()
+        runs = asyncio.run(batch())
+        wall = time.perf_counter() - start
+        # Cut-off attempts are billed too: the budget counted them
+        stats = token_budget.stats().values() if enabled else []
+        tokens = sum(token_usage(run.message)["output_tokens"] for run in runs) + sum(entry["truncated_tokens"] for entry in stats)
+        times = sorted(run.total for run in runs)
+        table.add_row(label, f"{wall:.2f}", *(f"{times[int(q * (len(times) - 1))]:.2f}" for q in (0.5, 0.95, 0.99)),
+                      f"{tokens:,}", f"{sum(run.retries for run in runs):,}",
+                      *(f"{sum(entry[key] for entry in stats):,}" for key in ("recovered", "gave_up")),
+                      f"{sum(ANSWER_SEPARATOR in run.content for run in runs) / len(runs):.1%}")
+        if enabled:
+            console.print(budget_table(title=f"Token Budget: {label}"))
+    token_budget.disable()
+    console.print(table)
+
+def import_time(module: str, path: str) -> Tuple[float, str, float]:
+    """
+    Import ``module`` in a fresh interpreter under ``python -X importtime``.
+
+    Returns:
+        Cumulative import time of the module in seconds, and the name and
+        cumulative time of its slowest direct dependency
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([path, POSTS_DIR]))
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, cwd=path,
+                            capture_output=True, text=True, check=True).stderr
+    # "import time: self [us] | cumulative | imported package", children before their parent
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            name = parts[2][1:]
+            rows.append((len(name) - len(name.lstrip()), name.strip(), int(parts[1]) / 1e6))
+    end = max(i for i, (depth, name, _) in enumerate(rows) if depth == 0 and name == module)
+    start = max((i for i, (depth, _, _) in enumerate(rows[:end]) if depth == 0), default=-1) + 1
+    slowest = max((row for row in rows[start:end] if row[0] == 2), key=lambda row: row[2], default=(0, "-", 0.0))
+    return rows[end][2], slowest[1], slowest[2]
+
+def run_import_benchmark(repeats: int = 5) -> None:
+    """Startup cost of importing each technique script, in fresh interpreters."""
+    table = Table(title=f"Import time (python -X importtime, best of {repeats})", show_header=True, header_style="bold magenta")
+    table.add_column("Module", style="dim")
+    table.add_column("Import (ms)", justify="right")
+    table.add_column("Slowest dependency", justify="left")
+    table.add_column("Its time (ms)", justify="right")
+
+    for name in TECHNIQUE_DIRS:
+        path = os.path.join(POSTS_DIR, name)
+        total, dependency, dependency_time = min(import_time(name, path) for _ in range(repeats))
+        table.add_row(name, f"{total * 1e3:,.1f}", dependency, f"{dependency_time * 1e3:,.1f}")
+    console.print(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--rate-limit", action="store_true", help="Benchmark the adaptive request scheduler against a 429-emitting fake provider")
+    parser.add_argument("--profile", metavar="TRACE", nargs="?", const=DEFAULT_TRACE_PATH, help="Profile an async AoT batch per stage and write a Chrome trace")
+    parser.add_argument("--budget", action="store_true", help="Benchmark adaptive max_tokens caps on a fake workload with runaway generations")
+    parser.add_argument("--http", action="store_true", help="Benchmark the shared HTTP connection pool against a local stub OpenAI server")
+    parser.add_argument("--import-time", action="store_true", help="Measure the startup cost of importing each technique script")
+    parser.add_argument("--scoring", metavar="ROWS", type=int, nargs="?", const=100_000, help="Benchmark the answer scoring engine on a synthetic result set")
+    args = parser.parse_args()
+
+    if args.budget:
+        run_budget_benchmark(args.questions)
+    elif args.http:
+        run_http_benchmark(args.questions)
+    elif args.import_time:
+        run_import_benchmark()
+    elif args.scoring:
+        run_scoring_benchmark(args.scoring)
+    elif args.profile:
+        run_profile(args.questions, args.profile)
+    elif args.rate_limit:
+        run_rate_limit_benchmark(args.questions)
+    else:
+        run_benchmarks(args.questions)
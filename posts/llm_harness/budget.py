@@ -0,0 +1,223 @@
+"""
+Adaptive ``max_tokens`` caps learned from observed output lengths.
+
+No chain sets ``max_tokens``, so one runaway generation can run for tens of
+seconds while holding a concurrency slot. While the shared ``token_budget``
+is enabled, ``run_chain`` / ``arun_chain`` cap each call at a high quantile
+of its strategy's recent output lengths:
+
+- The first ``min_samples`` calls of a strategy run uncapped and only teach
+  the controller its length distribution
+- After that the cap is ``quantile`` of the window times ``headroom``,
+  clamped to ``[floor, ceiling]``
+- A response cut off by the cap (``finish_reason == "length"``) before its
+  ``####`` answer is retried with ``growth`` times the budget, up to
+  ``max_retries`` times; the final retry above ``ceiling`` runs uncapped
+
+Only responses that finished on their own are learned from, so truncated
+attempts never drag the caps down. ``stats()`` / ``budget_table()`` compare
+the capped calls with the uncapped ones seen while learning: tail latency,
+output tokens (retries included), truncations and retries.
+"""
+import collections
+import math
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class TokenBudget:
+    """
+    Per-strategy output caps at a quantile of recent output lengths, with retries on truncation.
+
+    Args:
+        quantile: Output-length quantile the cap is set at
+        headroom: Multiplier on that quantile
+        min_samples: Completed calls of a strategy before it is capped
+        window: Recent output lengths kept per strategy
+        floor / ceiling: Smallest and largest cap
+        growth: Budget multiplier for each retry of a truncated response
+        max_retries: Retries of a truncated response before it is returned as is
+    """
+
+    def __init__(self, quantile: float = 0.99, headroom: float = 1.25, min_samples: int = 20, window: int = 500,
+                 floor: int = 64, ceiling: int = 4096, growth: float = 2.0, max_retries: int = 2, enabled: bool = False):
+        self.quantile = quantile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.window = window
+        self.floor = floor
+        self.ceiling = ceiling
+        self.growth = growth
+        self.max_retries = max_retries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Forget the learned lengths and the counters."""
+        with self._lock:
+            self._lengths: Dict[str, Deque[int]] = collections.defaultdict(lambda: collections.deque(maxlen=self.window))
+            self._calls: Dict[str, Dict[str, Deque[Tuple[float, int]]]] = collections.defaultdict(
+                lambda: {kind: collections.deque(maxlen=self.window) for kind in ("uncapped", "capped")})
+            self._counts: Dict[str, Dict[str, int]] = collections.defaultdict(collections.Counter)
+
+    def cap(self, strategy: str) -> Optional[int]:
+        """Current ``max_tokens`` of a strategy, or None while it is still learning."""
+        with self._lock:
+            lengths = list(self._lengths.get(strategy, ()))
+        if len(lengths) < self.min_samples:
+            return None
+        return min(self.ceiling, max(self.floor, math.ceil(_percentile(lengths, self.quantile) * self.headroom)))
+
+    def retry_cap(self, cap: int) -> Optional[int]:
+        """Budget of the retry after a response was cut off at ``cap`` (None = uncapped)."""
+        if cap >= self.ceiling:
+            return None
+        return min(self.ceiling, math.ceil(cap * self.growth))
+
+    @staticmethod
+    def truncated(message: Any, output_tokens: int, cap: Optional[int]) -> bool:
+        """Whether a response stopped at its token limit rather than on its own."""
+        metadata = getattr(message, "response_metadata", None) or {}
+        reason = metadata.get("finish_reason")
+        if reason is not None:
+            return reason == "length"
+        return cap is not None and output_tokens >= cap
+
+    def record_attempt(self, strategy: str, cap: Optional[int], output_tokens: int, truncated: bool) -> None:
+        """Count one model call; the lengths of responses that finished on their own are learned."""
+        with self._lock:
+            counts = self._counts[strategy]
+            counts["attempts"] += 1
+            if cap is not None:
+                counts["capped_attempts"] += 1
+            if truncated:
+                counts["truncated"] += 1
+                counts["truncated_tokens"] += output_tokens
+            else:
+                self._lengths[strategy].append(output_tokens)
+
+    def record_call(self, strategy: str, capped: bool, seconds: float, output_tokens: int, retries: int, answered: bool) -> None:
+        """Count one logical call: its total time and output tokens across all attempts."""
+        with self._lock:
+            counts = self._counts[strategy]
+            counts["calls"] += 1
+            counts["retries"] += retries
+            if retries:
+                counts["recovered" if answered else "gave_up"] += 1
+            kind = "capped" if capped else "uncapped"
+            counts[f"{kind}_calls"] += 1
+            self._calls[strategy][kind].append((seconds, output_tokens))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-strategy cap and counters, plus uncapped vs capped calls compared.
+
+        Returns:
+            Dictionary per strategy with the current cap, learned samples and
+            length quantiles, call/truncation/retry counts, and for uncapped
+            and capped calls their total count plus the p50/p95/p99 time and
+            mean output tokens (retries included) of the last ``window``
+        """
+        with self._lock:
+            strategies = sorted(set(self._counts) | set(self._lengths))
+            snapshot = {name: (list(self._lengths.get(name, ())), {kind: list(calls) for kind, calls in self._calls.get(name, {}).items()},
+                               dict(self._counts.get(name, {}))) for name in strategies}
+
+        stats = {}
+        for name, (lengths, calls, counts) in snapshot.items():
+            entry = {
+                "cap": self.cap(name),
+                "samples": len(lengths),
+                "p50_length": _percentile(lengths, 0.5),
+                "quantile_length": _percentile(lengths, self.quantile),
+                **{key: counts.get(key, 0) for key in ("calls", "attempts", "capped_attempts", "truncated", "truncated_tokens",
+                                                        "retries", "recovered", "gave_up")}
+            }
+            for kind in ("uncapped", "capped"):
+                times = [seconds for seconds, _ in calls.get(kind, [])]
+                tokens = [tokens for _, tokens in calls.get(kind, [])]
+                entry[kind] = {
+                    "calls": counts.get(f"{kind}_calls", 0),
+                    "p50_time": _percentile(times, 0.5),
+                    "p95_time": _percentile(times, 0.95),
+                    "p99_time": _percentile(times, 0.99),
+                    "mean_output_tokens": sum(tokens) / len(tokens) if tokens else None
+                }
+            stats[name] = entry
+        return stats
+
+token_budget = TokenBudget()
+
+def budget_from_env() -> Optional[TokenBudget]:
+    """
+    Enable the shared token budget if ``GENAI_TOKEN_BUDGET`` is set.
+
+    The variable holds the output-length quantile of the caps ("1" selects
+    the default 0.99).
+    """
+    setting = os.environ.get("GENAI_TOKEN_BUDGET")
+    if not setting or setting == "0":
+        return None
+    if setting != "1":
+        token_budget.quantile = float(setting)
+    token_budget.enable()
+    return token_budget
+
+def with_max_tokens(chain: Any, max_tokens: Optional[int]) -> Any:
+    """``chain`` with its final model bound to ``max_tokens`` (unchanged for None)."""
+    if max_tokens is None:
+        return chain
+    from llm_harness.streaming import split_chain
+
+    prompt, model = split_chain(chain)
+    capped = model.bind(max_tokens=max_tokens)
+    return capped if prompt is None else prompt | capped
+
+def _seconds(value: Optional[float]) -> str:
+    return f"{value:.2f}" if value is not None else "-"
+
+def budget_table(stats: Optional[Dict[str, Dict[str, Any]]] = None, title: str = "Token Budget (uncapped → capped calls)") -> "Table":
+    """Render ``TokenBudget.stats()`` (the shared budget's by default) as a Rich table, one row per strategy."""
+    from rich.table import Table
+
+    stats = stats if stats is not None else token_budget.stats()
+    table = Table(title=title, show_header=True, header_style="bold magenta")
+    table.add_column("Strategy", style="dim", no_wrap=True)
+    table.add_column("Cap", justify="right")
+    table.add_column("Calls", justify="right")
+    table.add_column("p99 (s)", justify="right")
+    table.add_column("Output tokens", justify="right")
+    table.add_column("Truncated", justify="right")
+    table.add_column("Retries", justify="right")
+    table.add_column("Gave up", justify="right")
+
+    for name, entry in stats.items():
+        uncapped, capped = entry["uncapped"], entry["capped"]
+        tokens = [f"{kind['mean_output_tokens']:,.0f}" if kind["mean_output_tokens"] is not None else "-" for kind in (uncapped, capped)]
+        table.add_row(
+            name,
+            f"{entry['cap']:,}" if entry["cap"] is not None else "learning",
+            f"{uncapped['calls']:,} → {capped['calls']:,}",
+            f"{_seconds(uncapped['p99_time'])} → {_seconds(capped['p99_time'])}",
+            f"{tokens[0]} → {tokens[1]}",
+            f"{entry['truncated']:,}",
+            f"{entry['retries']:,}",
+            f"{entry['gave_up']:,}"
+        )
+    return table
@@ -0,0 +1,278 @@
+"""
+Persistent, content-addressed response cache for the technique scripts.
+
+The cache plugs into LangChain's global LLM cache, so every chat model call
+made by any chain is looked up before it goes to the provider. The key is a
+SHA-256 of the rendered messages plus the model's ``llm_string`` (model name,
+temperature, stop sequences and any other invocation parameters).
+
+Entries live in a single SQLite file. WAL mode and ``BEGIN IMMEDIATE``
+transactions make it safe to share between several processes, and the total
+payload size is kept under ``max_bytes`` by evicting least-recently-used
+entries.
+
+LangChain's ``stream``/``astream`` bypass the LLM cache, so ``run_chain`` /
+``arun_chain`` consult it themselves for streamed calls through
+``stream_cache_key``: a hit is replayed as a single chunk and cut after
+the answer line, so it matches what the live stream returned. On a miss, the
+whole stream is stored under the same key a blocking call would use. A
+stream cut off after its answer line is then read to the end (usually a few
+tokens) before it is stored; its timings and content still stop at the
+answer. That gives up part of the early cut-off's saving on a miss in
+exchange for cacheable responses.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage, BaseMessageChunk, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+from langchain_core.runnables import Runnable, RunnableBinding
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "genai", "responses.sqlite")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (name, value) VALUES ('total_bytes', 0);
+"""
+
+def _dump_generation(generation: Generation) -> Dict[str, Any]:
+    if isinstance(generation, ChatGeneration):
+        return {"message": message_to_dict(generation.message), "generation_info": generation.generation_info}
+    return {"text": generation.text, "generation_info": generation.generation_info}
+
+def _load_generation(data: Dict[str, Any]) -> Generation:
+    if "message" in data:
+        message = messages_from_dict([data["message"]])[0]
+        return ChatGeneration(message=message, generation_info=data["generation_info"])
+    return Generation(text=data["text"], generation_info=data["generation_info"])
+
+class PersistentResponseCache(BaseCache):
+    """SQLite-backed LangChain cache with size-bounded LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES, timeout: float = 30.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bytes_read": 0, "bytes_written": 0, "evictions": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return a connection owned by the current thread and process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, **deltas: int) -> None:
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        """Content address of a rendered prompt and model configuration."""
+        digest = hashlib.sha256()
+        digest.update(prompt.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(llm_string.encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Return the cached generations for this prompt, or None on a miss."""
+        key = self.make_key(prompt, llm_string)
+        conn = self._connection()
+        row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(misses=1)
+            return None
+
+        conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count(hits=1, bytes_read=len(row[0]))
+        return [_load_generation(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Store generations for this prompt and evict old entries if over budget."""
+        key = self.make_key(prompt, llm_string)
+        payload = json.dumps([_dump_generation(generation) for generation in return_val])
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time())
+            )
+            conn.execute(
+                "UPDATE meta SET value = value + ? WHERE name = 'total_bytes'",
+                (size - (old[0] if old else 0),)
+            )
+            evicted = self._evict(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._count(bytes_written=size, evictions=evicted)
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """Delete least-recently-used entries until the cache fits in max_bytes."""
+        total = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+                if total <= self.max_bytes:
+                    break
+        conn.execute("UPDATE meta SET value = ? WHERE name = 'total_bytes'", (max(total, 0),))
+        return evicted
+
+    def clear(self, **kwargs: Any) -> None:
+        """Remove every cached response."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM responses")
+        conn.execute("UPDATE meta SET value = 0 WHERE name = 'total_bytes'")
+        conn.execute("COMMIT")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/byte counters for this process plus the current cache size."""
+        conn = self._connection()
+        entries = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        total = conn.execute("SELECT value FROM meta WHERE name = 'total_bytes'").fetchone()[0]
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = entries
+        stats["size_bytes"] = total
+        return stats
+
+    def summary(self) -> str:
+        """One-line summary of the counters, for printing after a run."""
+        stats = self.stats()
+        return (
+            f"Response cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate'] * 100:.0f}% hit rate), {stats['bytes_read']:,} bytes read, "
+            f"{stats['entries']} entries / {stats['size_bytes']:,} bytes on disk"
+        )
+
+def enable_response_cache(path: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES) -> PersistentResponseCache:
+    """Install a persistent response cache as LangChain's global LLM cache."""
+    cache = PersistentResponseCache(path or DEFAULT_CACHE_PATH, max_bytes=max_bytes)
+    set_llm_cache(cache)
+    return cache
+
+def cache_from_env() -> Optional[PersistentResponseCache]:
+    """
+    Enable the response cache if ``GENAI_RESPONSE_CACHE`` is set.
+
+    The variable holds the cache file path ("1" selects the default path).
+    ``GENAI_RESPONSE_CACHE_MAX_MB`` optionally overrides the size budget.
+    """
+    setting = os.environ.get("GENAI_RESPONSE_CACHE")
+    if not setting or setting == "0":
+        return None
+    max_mb = os.environ.get("GENAI_RESPONSE_CACHE_MAX_MB")
+    max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+    return enable_response_cache(None if setting == "1" else setting, max_bytes=max_bytes)
+
+StreamCacheKey = Tuple[BaseCache, str, str]
+
+def _chat_model(model: Any) -> Tuple[Optional[BaseChatModel], Dict[str, Any]]:
+    """The chat model inside bindings and ``.model`` wrappers (scheduler, hedging), with its bound kwargs."""
+    kwargs: Dict[str, Any] = {}
+    while not isinstance(model, BaseChatModel):
+        if isinstance(model, RunnableBinding):
+            kwargs = {**model.kwargs, **kwargs}
+            model = model.bound
+        elif isinstance(getattr(model, "model", None), Runnable):
+            model = model.model
+        else:
+            return None, kwargs
+    return model, kwargs
+
+def stream_cache_key(model: Any, input: Any) -> Optional[StreamCacheKey]:
+    """
+    The cache and key a blocking call of ``model`` on ``input`` would use.
+
+    Returns:
+        (cache, prompt, llm_string), or None when no cache applies to the model
+    """
+    chat, kwargs = _chat_model(model)
+    if chat is None or chat.cache is False:
+        return None
+    cache = chat.cache if isinstance(chat.cache, BaseCache) else get_llm_cache()
+    if cache is None:
+        return None
+    stop = kwargs.pop("stop", None)
+    return cache, dumps(chat._convert_input(input).to_messages()), chat._get_llm_string(stop=stop, **kwargs)
+
+def _message(generations: Optional[RETURN_VAL_TYPE]) -> Optional[BaseMessage]:
+    if not generations:
+        return None
+    generation = generations[0]
+    return generation.message if isinstance(generation, ChatGeneration) else None
+
+def _generations(message: BaseMessage) -> RETURN_VAL_TYPE:
+    if isinstance(message, BaseMessageChunk):
+        message = message_chunk_to_message(message)
+    return [ChatGeneration(message=message)]
+
+def cached_message(key: StreamCacheKey) -> Optional[BaseMessage]:
+    """The cached response for a ``stream_cache_key``, or None on a miss."""
+    cache, prompt, llm_string = key
+    return _message(cache.lookup(prompt, llm_string))
+
+def cache_message(key: StreamCacheKey, message: BaseMessage) -> None:
+    """Store a streamed response (its chunks added up) under a ``stream_cache_key``."""
+    cache, prompt, llm_string = key
+    cache.update(prompt, llm_string, _generations(message))
+
+async def acached_message(key: StreamCacheKey) -> Optional[BaseMessage]:
+    """Async version of cached_message."""
+    cache, prompt, llm_string = key
+    return _message(await cache.alookup(prompt, llm_string))
+
+async def acache_message(key: StreamCacheKey, message: BaseMessage) -> None:
+    """Async version of cache_message."""
+    cache, prompt, llm_string = key
+    await cache.aupdate(prompt, llm_string, _generations(message))
@@ -0,0 +1,184 @@
+"""
+Self-consistency sampling with early-stop majority voting.
+
+``SelfConsistentChain`` draws up to ``k`` samples from a chain, normalizes
+each final answer and returns the majority. Samples are drawn in waves: each
+wave is the smallest number of samples that could settle the vote if they
+all agreed with the current leader. Sampling stops as soon as the leader's
+margin over the runner-up exceeds the samples left, i.e. when the remaining
+votes can no longer overturn it. Unanimous answers therefore settle after
+``k // 2 + 1`` samples instead of ``k``. With ``confidence`` set, sampling
+also stops once the leader is the majority with that posterior probability
+(a Beta model of leader vs runner-up votes), which settles clear-cut
+questions sooner at a small risk of stopping on the wrong answer.
+
+When the chain ends in a chat model with an ``n`` parameter (e.g.
+``ChatOpenAI``), a wave is a single request with ``n`` choices; otherwise the
+wave's samples are concurrent requests. Samples bypass the response cache
+and run at a sampling temperature, since identical cached completions would
+make the vote meaningless.
+"""
+import asyncio
+import collections
+import copy
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from rich.table import Table
+
+from llm_harness.streaming import split_chain
+
+def normalize_answer(answer: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation so equivalent answers vote together."""
+    return " ".join(answer.lower().split()).strip(" .")
+
+def votes_needed(counts: collections.Counter, remaining: int) -> int:
+    """
+    Samples still needed before the vote can be settled.
+
+    The leader wins once ``leader - runner_up > remaining``. If the next
+    ``d`` samples all go to the leader, that holds when
+    ``d > (remaining + runner_up - leader) / 2``, so this is the smallest
+    such ``d`` (0 when the vote is already settled).
+    """
+    top = counts.most_common(2) + [(None, 0), (None, 0)]
+    leader, runner_up = top[0][1], top[1][1]
+    if leader - runner_up > remaining:
+        return 0
+    return min(remaining, (remaining + runner_up - leader) // 2 + 1)
+
+def leader_confidence(leader: int, runner_up: int) -> float:
+    """
+    Posterior probability that the leader beats the runner-up.
+
+    With a uniform prior, the leader's share of the two is
+    ``Beta(leader + 1, runner_up + 1)``; for integer parameters,
+    ``P(share > 1/2) = P(Binomial(leader + runner_up + 1, 1/2) <= leader)``.
+    """
+    n = leader + runner_up + 1
+    return sum(math.comb(n, j) for j in range(leader + 1)) / 2 ** n
+
+def sampling_model(model: Runnable, temperature: Optional[float]) -> Runnable:
+    """Copy a (possibly wrapped) chat model with the cache disabled and the sampling temperature set."""
+    if isinstance(model, BaseChatModel):
+        update = {"cache": False}
+        if temperature is not None and "temperature" in type(model).model_fields:
+            update["temperature"] = temperature
+        return model.model_copy(update=update)
+    if isinstance(getattr(model, "model", None), Runnable):
+        # Scheduler/hedging wrappers: keep their shared state, swap the inner model
+        wrapper = copy.copy(model)
+        wrapper.model = sampling_model(model.model, temperature)
+        return wrapper
+    return model
+
+class SelfConsistentChain:
+    """
+    Majority voting over samples of a chain, with early stopping.
+
+    Args:
+        chain: A ``prompt | model`` chain (CoT, CoD, AoT, step-back, ...)
+        extract: Pulls the final answer out of a response (the script's ``extract_answer``)
+        k: Maximum number of samples per question
+        temperature: Sampling temperature (None keeps the model's own)
+        use_n: Use the provider's ``n`` parameter (None = when the model supports it)
+        normalize: Maps answers to the form they are compared in
+        confidence: Also stop once ``leader_confidence`` reaches this (None = only
+            stop when the vote cannot be overturned)
+    """
+
+    def __init__(self, chain: Runnable, extract: Callable[[str], str], k: int = 10, temperature: Optional[float] = 0.7,
+                 use_n: Optional[bool] = None, normalize: Callable[[str], str] = normalize_answer,
+                 confidence: Optional[float] = None):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self.k = k
+        self.confidence = confidence
+        self.extract = extract
+        self.normalize = normalize
+        self.prompt, model = split_chain(chain)
+        self.model = sampling_model(model, temperature)
+        supports_n = isinstance(self.model, BaseChatModel) and "n" in type(self.model).model_fields
+        self.use_n = self.prompt is not None and supports_n and use_n is not False
+
+    async def _wave(self, inputs: Dict[str, Any], size: int) -> List[str]:
+        """Draw ``size`` samples; returns their contents."""
+        prompt_value = await self.prompt.ainvoke(inputs) if self.prompt is not None else inputs
+        if self.use_n:
+            result = await self.model.agenerate([prompt_value.to_messages()], n=size)
+            return [generation.message.content for generation in result.generations[0]]
+        responses = await asyncio.gather(*(self.model.ainvoke(prompt_value) for _ in range(size)))
+        return [response.content for response in responses]
+
+    def _wave_size(self, counts: collections.Counter, remaining: int) -> int:
+        """Smallest number of samples that could settle the vote, 0 if it is settled."""
+        size = votes_needed(counts, remaining)
+        if self.confidence is None or size == 0:
+            return size
+        top = counts.most_common(2) + [(None, 0), (None, 0)]
+        leader, runner_up = top[0][1], top[1][1]
+        for extra in range(size):
+            if leader_confidence(leader + extra, runner_up) >= self.confidence:
+                return extra
+        return size
+
+    async def ainvoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Sample until the majority answer is settled or ``k`` samples are drawn.
+
+        Returns:
+            Dictionary with the majority answer, vote counts, the raw samples,
+            samples drawn/saved, model requests and wall time
+        """
+        start = time.perf_counter()
+        counts: collections.Counter = collections.Counter()
+        originals: Dict[str, str] = {}
+        samples: List[str] = []
+        requests = 0
+
+        while len(samples) < self.k:
+            size = self._wave_size(counts, self.k - len(samples))
+            if size == 0:
+                break
+            contents = await self._wave(inputs, size)
+            requests += 1 if self.use_n else len(contents)
+            for content in contents:
+                answer = self.extract(content)
+                key = self.normalize(answer)
+                originals.setdefault(key, answer)
+                counts[key] += 1
+            samples.extend(contents)
+
+        winner, votes = counts.most_common(1)[0]
+        return {
+            "answer": originals[winner],
+            "votes": {originals[key]: count for key, count in counts.most_common()},
+            "agreement": votes / len(samples),
+            "samples": samples,
+            "samples_drawn": len(samples),
+            "samples_saved": self.k - len(samples),
+            "requests": requests,
+            "time": time.perf_counter() - start
+        }
+
+    def invoke(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        return asyncio.run(self.ainvoke(inputs))
+
+def vote_table(result: Dict[str, Any], title: str = "Self-Consistency Vote") -> Table:
+    """Render a self-consistency result as a Rich table."""
+    table = Table(title=title, show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    table.add_column("Value", justify="right")
+
+    table.add_row("Majority Answer", result["answer"])
+    for answer, count in result["votes"].items():
+        table.add_row(f"Votes: {answer}", str(count))
+    table.add_row("Agreement", f"{result['agreement']:.0%}")
+    table.add_row("Samples Drawn", f"{result['samples_drawn']} / {result['samples_drawn'] + result['samples_saved']}")
+    table.add_row("Samples Saved by Early Stop", str(result["samples_saved"]))
+    table.add_row("Model Requests", str(result["requests"]))
+    table.add_row("Time (seconds)", f"{result['time']:.2f}")
+    return table
@@ -0,0 +1,151 @@
+"""
+Resumable, checkpointed dataset runner.
+
+``run_dataset`` streams questions from a JSONL or CSV file, evaluates them
+with bounded concurrency and appends each result to a JSONL output file as
+soon as it finishes. The output file is the checkpoint: on a rerun, items
+whose id is already in it are skipped, and their metrics are folded back into
+the running statistics. Only the ids of finished items and the in-flight
+window are kept in memory, so memory stays flat however large the dataset is.
+"""
+import csv
+import json
+import math
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Set, Tuple
+
+class RunningStats:
+    """Incremental count, mean and standard deviation per metric (Welford's algorithm)."""
+
+    def __init__(self):
+        self.count = 0
+        self._mean: Dict[str, float] = {}
+        self._m2: Dict[str, float] = {}
+        self._n: Dict[str, int] = {}
+
+    def update(self, metrics: Dict[str, float]) -> None:
+        self.count += 1
+        for name, value in metrics.items():
+            if value is None:
+                continue
+            n = self._n.get(name, 0) + 1
+            mean = self._mean.get(name, 0.0)
+            delta = value - mean
+            mean += delta / n
+            self._n[name] = n
+            self._mean[name] = mean
+            self._m2[name] = self._m2.get(name, 0.0) + delta * (value - mean)
+
+    def mean(self, name: str) -> float:
+        return self._mean.get(name, 0.0)
+
+    def std(self, name: str) -> float:
+        n = self._n.get(name, 0)
+        return math.sqrt(self._m2[name] / (n - 1)) if n > 1 else 0.0
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: {"mean": self._mean[name], "std": self.std(name), "n": self._n[name]} for name in self._mean}
+
+def iter_questions(path: str, question_field: str = "question", id_field: str = "id") -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Stream ``(item_id, question, record)`` from a JSONL or CSV file.
+
+    Items without an id get their row number as id, so a file must not be
+    reordered between a run and its resume.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for index, record in enumerate(records):
+            item_id = record.get(id_field)
+            yield str(item_id if item_id not in (None, "") else index), record[question_field], record
+
+def iter_results(output_path: str) -> Iterator[Dict[str, Any]]:
+    """Stream completed results from an output file, skipping a torn last line from a crash."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+def _open_for_append(output_path: str):
+    """Open the output for appending, terminating a torn last line first."""
+    f = open(output_path, "a+b")
+    if f.tell() > 0:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+    return f
+
+async def run_dataset(
+    input_path: str,
+    output_path: str,
+    evaluate: Callable[[str], Awaitable[Dict[str, Any]]],
+    metrics: Callable[[Dict[str, Any]], Dict[str, float]],
+    max_concurrency: int = 8,
+    question_field: str = "question",
+    id_field: str = "id",
+    on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None
+) -> Tuple[RunningStats, Dict[str, int]]:
+    """
+    Evaluate every question in ``input_path`` that is not yet in ``output_path``.
+
+    Args:
+        input_path: JSONL or CSV file with one question per record
+        output_path: JSONL file results are appended to (and resumed from)
+        evaluate: Coroutine function producing a JSON-serializable result for a question
+        metrics: Maps a result to the numbers folded into the running statistics
+        max_concurrency: Questions evaluated at once; also bounds memory use
+        on_result: Called with each new ``(item_id, result)`` after it is written
+
+    Returns:
+        Running statistics over all completed items (old and new) and counts
+        of skipped, completed and failed items for this run
+    """
+    import asyncio
+    
+    stats = RunningStats()
+    done: Set[str] = set()
+    for row in iter_results(output_path):
+        done.add(row["id"])
+        stats.update(metrics(row["result"]))
+    counts = {"skipped": len(done), "completed": 0, "failed": 0}
+
+    async def process(item_id: str, question: str) -> None:
+        try:
+            result = await evaluate(question)
+        except Exception:
+            # Left out of the checkpoint, so the next run retries it
+            counts["failed"] += 1
+            return
+        line = json.dumps({"id": item_id, "question": question, "result": result}, default=str) + "\n"
+        out.write(line.encode("utf-8"))
+        out.flush()
+        os.fsync(out.fileno())
+        stats.update(metrics(result))
+        counts["completed"] += 1
+        if on_result is not None:
+            on_result(item_id, result)
+
+    out = _open_for_append(output_path)
+    pending: Set["asyncio.Task"] = set()
+    try:
+        for item_id, question, _ in iter_questions(input_path, question_field, id_field):
+            if item_id in done:
+                continue
+            if len(pending) >= max_concurrency:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.add(asyncio.ensure_future(process(item_id, question)))
+        if pending:
+            await asyncio.wait(pending)
+    finally:
+        for task in pending:
+            task.cancel()
+        out.close()
+
+    return stats, counts
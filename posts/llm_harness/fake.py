@@ -0,0 +1,405 @@
+"""
+Offline, deterministic fake chat model backend.
+
+``FakeChatModel`` is a drop-in LangChain chat model that never touches the
+network. Completions come from a scripted list, a template or a callable;
+latency is drawn from a configurable distribution (time to first token plus
+a token rate), and failures such as provider 429s can be injected at a fixed
+rate. With a seed, every run produces the same completions, delays and
+failures, which makes it suitable for profiling and benchmarking the harness
+itself.
+
+``FakeOpenAIServer`` goes one level down: a local HTTP server speaking the
+OpenAI chat completions API, for exercising the real ``ChatOpenAI`` client
+and its connection handling (``pool.py``) without network access.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+DEFAULT_RESPONSE = """Atom 1: Identify the known quantities
+The problem gives the values needed.
+
+Atom 2: Combine them
+Applying the relationship gives the result.
+
+Synthesis: The answer follows from combining both atoms.
+
+#### 42
+"""
+
+# Splits text into word and whitespace runs, a rough stand-in for tokens
+_TOKEN_PATTERN = re.compile(r"\s+|[^\s]+")
+
+class FakeProviderError(Exception):
+    """Injected provider failure carrying an HTTP-like status code."""
+
+    def __init__(self, status_code: int = 429, message: str = "Rate limit reached (injected)"):
+        super().__init__(f"Error code: {status_code} - {message}")
+        self.status_code = status_code
+
+def _sample_delay(rng: random.Random, distribution: str, mean: float, spread: float) -> float:
+    """Sample a non-negative delay from one of the supported distributions."""
+    if mean <= 0:
+        return 0.0
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return max(0.0, rng.uniform(mean - spread, mean + spread))
+    if distribution == "exponential":
+        return rng.expovariate(1.0 / mean)
+    if distribution == "lognormal":
+        # spread is the sigma of the underlying normal; mean is the median
+        return mean * rng.lognormvariate(0.0, spread)
+    raise ValueError(f"Unknown latency distribution: {distribution}")
+
+_PLAIN = (str, int, float, bool, bytes, type(None))
+
+def _callable_digest(fn: Callable[..., Any]) -> List[Any]:
+    """A process-independent description of a responder: its name, bytecode and plain constants and defaults."""
+    parts: List[Any] = [getattr(fn, "__module__", None), getattr(fn, "__qualname__", type(fn).__qualname__)]
+    code = getattr(fn, "__code__", None)
+    if code is not None:
+        parts += [code.co_code.hex(), [repr(const) for const in code.co_consts if isinstance(const, _PLAIN)]]
+    parts.append([repr(value) for value in getattr(fn, "__defaults__", None) or () if isinstance(value, _PLAIN)])
+    return parts
+
+class FakeChatModel(BaseChatModel):
+    """
+    Scripted chat model with configurable latency, token rate and failures.
+
+    Completion source, in order of precedence: ``responder`` (a callable that
+    receives the messages), ``template`` (formatted with ``question`` = the
+    last message, ``system`` = the first system message and ``index`` = the
+    call number), then ``responses`` (cycled).
+    """
+
+    model_name: str = "fake"
+    temperature: float = 0.0
+    responses: List[str] = [DEFAULT_RESPONSE]
+    template: Optional[str] = None
+    responder: Optional[Callable[[List[BaseMessage]], str]] = None
+
+    latency: float = 0.0
+    """Median time to first token, in seconds."""
+    latency_distribution: str = "fixed"
+    latency_spread: float = 0.0
+    tokens_per_second: Optional[float] = None
+    """Output rate after the first token; None returns all tokens at once."""
+
+    failure_rate: float = 0.0
+    failure_status: int = 429
+    prompt_cache: bool = False
+    """Emulate provider prefix caching: previously seen prompt prefixes are reported as cached input tokens."""
+    prompt_cache_block: int = 16
+    """Caching granularity in tokens; only whole blocks of a repeated prefix count as cached."""
+    prefill_tokens_per_second: Optional[float] = None
+    """Prefill rate for uncached input tokens, added to the time to first token; None adds nothing."""
+    n: int = 1
+    """Completions per request; a per-call ``n`` keyword overrides it, like the OpenAI parameter."""
+    max_tokens: Optional[int] = None
+    """Output cap in tokens; longer completions are cut off with ``finish_reason="length"``. A per-call keyword overrides it."""
+    max_concurrency: Optional[int] = None
+    """Emulate a provider capacity limit: calls beyond this many in flight get a 429."""
+    seed: Optional[int] = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _in_flight: int = PrivateAttr(default=0)
+    _prefixes: set = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        # Everything that shapes the output, so fakes with different scripts never share response-cache keys
+        script = {
+            "responses": self.responses,
+            "template": self.template,
+            "responder": _callable_digest(self.responder) if self.responder is not None else None,
+            "seed": self.seed,
+            "latency": [self.latency, self.latency_distribution, self.latency_spread, self.tokens_per_second, self.prefill_tokens_per_second],
+            "failures": [self.failure_rate, self.failure_status, self.max_concurrency],
+            "max_tokens": self.max_tokens,
+            "n": self.n,
+            "prompt_cache": [self.prompt_cache, self.prompt_cache_block]
+        }
+        digest = hashlib.sha256(json.dumps(script, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+        return {"model_name": self.model_name, "temperature": self.temperature, "script": digest}
+
+    @property
+    def calls(self) -> int:
+        """Number of completions requested so far (including failed ones)."""
+        return self._calls
+
+    def _plan(self, messages: List[BaseMessage]) -> Tuple[str, float, float, bool]:
+        """Pick the completion, the delays and whether this call fails."""
+        with self._lock:
+            index = self._calls
+            self._calls += 1
+            first_token = _sample_delay(self._rng, self.latency_distribution, self.latency, self.latency_spread)
+            fails = self.failure_rate > 0 and self._rng.random() < self.failure_rate
+            if self.max_concurrency is not None and self._in_flight >= self.max_concurrency:
+                fails = True
+
+        if self.responder is not None:
+            text = self.responder(messages)
+        elif self.template is not None:
+            system = next((m.content for m in messages if m.type == "system"), "")
+            question = messages[-1].content if messages else ""
+            text = self.template.format(question=question, system=system, index=index)
+        else:
+            text = self.responses[index % len(self.responses)]
+
+        per_token = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        return text, first_token, per_token, fails
+
+    def _cached_tokens(self, messages: List[BaseMessage]) -> int:
+        """Input tokens served from the emulated prefix cache (4 characters per token)."""
+        if not self.prompt_cache:
+            return 0
+        text = "".join(f"{m.type}:{m.content}\n" for m in messages)
+        block = self.prompt_cache_block * 4
+        cached_blocks = 0
+        with self._lock:
+            for end in range(block, len(text) + 1, block):
+                key = hash(text[:end])
+                if key in self._prefixes and cached_blocks == end // block - 1:
+                    cached_blocks += 1
+                self._prefixes.add(key)
+        return min(cached_blocks * self.prompt_cache_block, self._input_tokens(messages))
+
+    @staticmethod
+    def _input_tokens(messages: List[BaseMessage]) -> int:
+        return sum(len(str(m.content)) for m in messages) // 4
+
+    def _plan_choices(self, messages: List[BaseMessage], n: int) -> Tuple[List[str], float, float, bool, int]:
+        """Plan ``n`` completions for one request; it takes as long as the slowest choice."""
+        plans = [self._plan(messages) for _ in range(n)]
+        cached = self._cached_tokens(messages)
+        first_token = max(p[1] for p in plans)
+        if self.prefill_tokens_per_second:
+            first_token += (self._input_tokens(messages) - cached) / self.prefill_tokens_per_second
+        return [p[0] for p in plans], first_token, plans[0][2], any(p[3] for p in plans), cached
+
+    def _truncate(self, texts: List[str], kwargs: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """Cut completions at ``max_tokens``; returns the texts and their finish reasons."""
+        max_tokens = kwargs.get("max_tokens", self.max_tokens)
+        if max_tokens is None:
+            return texts, ["stop"] * len(texts)
+        capped, reasons = [], []
+        for text in texts:
+            tokens = _TOKEN_PATTERN.findall(text)
+            capped.append("".join(tokens[:max_tokens]))
+            reasons.append("length" if len(tokens) > max_tokens else "stop")
+        return capped, reasons
+
+    def _usage(self, messages: List[BaseMessage], text: str, cached: int) -> Dict[str, Any]:
+        input_tokens = self._input_tokens(messages)
+        output_tokens = len(_TOKEN_PATTERN.findall(text))
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cached}
+        }
+
+    def _result(self, messages: List[BaseMessage], texts: List[str], cached: int = 0, reasons: Optional[List[str]] = None) -> ChatResult:
+        generations = []
+        for text, reason in zip(texts, reasons or ["stop"] * len(texts)):
+            message = AIMessage(
+                content=text,
+                response_metadata={"model_name": self.model_name, "finish_reason": reason},
+                usage_metadata=self._usage(messages, text, cached)
+            )
+            generations.append(ChatGeneration(message=message))
+        return ChatResult(generations=generations)
+
+    def _track(self, delta: int) -> None:
+        with self._lock:
+            self._in_flight += delta
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        texts, first_token, per_token, fails, cached = self._plan_choices(messages, kwargs.get("n", self.n))
+        texts, reasons = self._truncate(texts, kwargs)
+        if fails:
+            # Rejected requests come back quickly, like a provider 429
+            time.sleep(min(first_token, 0.01))
+            raise FakeProviderError(self.failure_status)
+        self._track(1)
+        try:
+            time.sleep(first_token + per_token * max(len(_TOKEN_PATTERN.findall(text)) for text in texts))
+        finally:
+            self._track(-1)
+        return self._result(messages, texts, cached, reasons)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        texts, first_token, per_token, fails, cached = self._plan_choices(messages, kwargs.get("n", self.n))
+        texts, reasons = self._truncate(texts, kwargs)
+        if fails:
+            await asyncio.sleep(min(first_token, 0.01))
+            raise FakeProviderError(self.failure_status)
+        self._track(1)
+        try:
+            await asyncio.sleep(first_token + per_token * max(len(_TOKEN_PATTERN.findall(text)) for text in texts))
+        finally:
+            self._track(-1)
+        return self._result(messages, texts, cached, reasons)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        (text,), first_token, per_token, fails, cached = self._plan_choices(messages, 1)
+        (text,), (reason,) = self._truncate([text], kwargs)
+        time.sleep(first_token)
+        if fails:
+            raise FakeProviderError(self.failure_status)
+        for i, token in enumerate(_TOKEN_PATTERN.findall(text)):
+            if i and per_token:
+                time.sleep(per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        # Usage arrives on a final empty chunk, like OpenAI's stream_usage
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text, cached),
+                                                         response_metadata={"finish_reason": reason}))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        (text,), first_token, per_token, fails, cached = self._plan_choices(messages, 1)
+        (text,), (reason,) = self._truncate([text], kwargs)
+        await asyncio.sleep(first_token)
+        if fails:
+            raise FakeProviderError(self.failure_status)
+        for i, token in enumerate(_TOKEN_PATTERN.findall(text)):
+            if i and per_token:
+                await asyncio.sleep(per_token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text, cached),
+                                                         response_metadata={"finish_reason": reason}))
+
+class _FakeOpenAIHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops concurrent connects, which then retry after a second
+    request_queue_size = 256
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 with Content-Length keeps connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        # Stands in for the TCP + TLS handshake a real provider connection costs
+        time.sleep(server.handshake)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self) -> None:
+        self._send(200, b"{}")
+
+    def do_POST(self) -> None:
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests += 1
+        if not self.path.endswith("/chat/completions"):
+            self._send(404, b'{"error": {"message": "Not found"}}')
+            return
+        time.sleep(server.latency)
+        content = server.response
+        usage = {"prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in request.get("messages", [])),
+                 "completion_tokens": len(content.split())}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion = {"id": f"chatcmpl-fake{server.requests}", "created": int(time.time()), "model": request.get("model", "fake")}
+        if not request.get("stream"):
+            choice = {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+            self._send(200, json.dumps({**completion, "object": "chat.completion", "choices": [choice], "usage": usage}).encode())
+            return
+        events = []
+        for delta, finish in (({"role": "assistant", "content": content}, None), ({}, "stop")):
+            chunk = {**completion, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            events.append(f"data: {json.dumps(chunk)}\n\n")
+        if request.get("stream_options", {}).get("include_usage"):
+            events.append(f"data: {json.dumps({**completion, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n")
+        events.append("data: [DONE]\n\n")
+        self._send(200, "".join(events).encode(), "text/event-stream")
+
+class FakeOpenAIServer:
+    """
+    Local OpenAI-compatible chat completions server, run on a background thread.
+
+    Every new connection sleeps ``handshake`` seconds before it is served, like
+    the TCP + TLS setup of a real provider connection, and every completion
+    takes ``latency`` seconds. The server counts the connections it accepted
+    and the requests it served, so connection reuse can be checked from the
+    server side too.
+
+        with FakeOpenAIServer(handshake=0.05) as server:
+            model = ChatOpenAI(base_url=server.base_url, api_key="fake")
+    """
+
+    def __init__(self, response: str = DEFAULT_RESPONSE, latency: float = 0.0, handshake: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self._server = _FakeOpenAIHTTPServer((host, port), _FakeOpenAIHandler)
+        self._server.lock = threading.Lock()
+        self._server.response = response
+        self._server.latency = latency
+        self._server.handshake = handshake
+        self._server.connections = 0
+        self._server.requests = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def connections(self) -> int:
+        return self._server.connections
+
+    @property
+    def requests(self) -> int:
+        return self._server.requests
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
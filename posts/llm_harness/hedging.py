@@ -0,0 +1,181 @@
+"""
+Hedged requests to cut tail latency.
+
+A ``HedgedModel`` sends a call to the wrapped model and, if it has not
+returned within a percentile of recently observed latencies, sends a
+duplicate. Whichever finishes first wins; the loser is cancelled (async) or
+abandoned (sync, since threads cannot be cancelled). Extra spend is capped:
+at most ``max_extra_ratio`` hedges per primary request.
+
+Each response carries ``response_metadata["hedge"]`` describing what
+happened, and ``stats()`` reports hedge counts and the waste ratio (calls
+whose result was thrown away, over all calls sent).
+"""
+import asyncio
+import collections
+import concurrent.futures
+import threading
+import time
+from typing import Any, Deque, Dict, Optional
+
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.runnables import Runnable, RunnableConfig
+
+class LatencyTracker:
+    """Rolling window of recent call latencies with percentile lookup."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class HedgedModel(Runnable):
+    """
+    Wrap a chat model so slow calls are hedged with a duplicate request.
+
+    Args:
+        model: The chat model (or scheduled model) to call
+        percentile: Hedge once a call exceeds this percentile of recent latency
+        min_samples: Latencies to observe before hedging starts
+        max_extra_ratio: Cap on hedges per primary request (e.g. 0.1 = 10% extra spend)
+        min_delay: Never hedge earlier than this many seconds
+    """
+
+    def __init__(self, model: Runnable, percentile: float = 0.95, min_samples: int = 20,
+                 max_extra_ratio: float = 0.1, min_delay: float = 0.0, window: int = 200,
+                 executor: Optional[concurrent.futures.Executor] = None):
+        self.model = model
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_extra_ratio = max_extra_ratio
+        self.min_delay = min_delay
+        self.tracker = LatencyTracker(window)
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "hedges": 0, "hedge_wins": 0, "wasted_calls": 0}
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+        return self._executor
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Count a new request and return how long to wait before hedging it (None = never)."""
+        with self._lock:
+            self._stats["requests"] += 1
+        if len(self.tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, self.tracker.percentile(self.percentile))
+
+    def _reserve_hedge(self) -> bool:
+        """Claim budget for one hedge; in-flight hedges count against the cap."""
+        with self._lock:
+            if self._stats["hedges"] + 1 > self.max_extra_ratio * self._stats["requests"]:
+                return False
+            self._stats["hedges"] += 1
+            self._stats["wasted_calls"] += 1
+            return True
+
+    def _record(self, hedged: bool, hedge_won: bool) -> Dict[str, Any]:
+        if hedge_won:
+            with self._lock:
+                self._stats["hedge_wins"] += 1
+        return {"hedged": hedged, "winner": "hedge" if hedge_won else "primary"}
+
+    @staticmethod
+    def _annotate(response: Any, info: Dict[str, Any]) -> Any:
+        metadata = getattr(response, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata["hedge"] = info
+        return response
+
+    def _timed_invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig], kwargs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        response = self.model.invoke(input, config, **kwargs)
+        self.tracker.record(time.perf_counter() - start)
+        return response
+
+    async def _timed_ainvoke(self, input: LanguageModelInput, config: Optional[RunnableConfig], kwargs: Dict[str, Any]) -> Any:
+        start = time.perf_counter()
+        response = await self.model.ainvoke(input, config, **kwargs)
+        self.tracker.record(time.perf_counter() - start)
+        return response
+
+    def invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._annotate(self._timed_invoke(input, config, kwargs), self._record(False, False))
+
+        primary = self.executor.submit(self._timed_invoke, input, config, kwargs)
+        try:
+            return self._annotate(primary.result(timeout=delay), self._record(False, False))
+        except concurrent.futures.TimeoutError:
+            if not self._reserve_hedge():
+                return self._annotate(primary.result(), self._record(False, False))
+
+        hedge = self.executor.submit(self._timed_invoke, input, config, kwargs)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None or not pending:
+                    # The loser keeps running in its thread; its result is discarded
+                    for loser in pending:
+                        loser.cancel()
+                    return self._annotate(future.result(), self._record(True, future is hedge))
+
+    async def ainvoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._annotate(await self._timed_ainvoke(input, config, kwargs), self._record(False, False))
+
+        primary = asyncio.ensure_future(self._timed_ainvoke(input, config, kwargs))
+        pending = {primary}
+        try:
+            # Cancellation of the caller, or an error, must not leave the primary running as an orphan
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._reserve_hedge():
+                return self._annotate(await primary, self._record(False, False))
+
+            hedge = asyncio.ensure_future(self._timed_ainvoke(input, config, kwargs))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None or not pending:
+                        return self._annotate(task.result(), self._record(True, task is hedge))
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+
+    def stream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any):
+        # Streams are not hedged: the first tokens would already be consumed
+        return self.model.stream(input, config, **kwargs)
+
+    def astream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any):
+        return self.model.astream(input, config, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedge counters plus the waste ratio (discarded calls / calls sent)."""
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats["requests"] + stats["hedges"]
+        stats["calls"] = calls
+        stats["waste_ratio"] = stats["wasted_calls"] / calls if calls else 0.0
+        stats["hedge_delay"] = self.tracker.percentile(self.percentile)
+        return stats
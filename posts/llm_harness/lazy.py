@@ -0,0 +1,31 @@
+"""
+Deferred construction for the technique scripts' module-level objects.
+
+Importing a technique script should not pay for rich, LangChain or a model
+client when the caller only wants its prompt constants or ``extract_answer``.
+The scripts import heavy dependencies inside the functions that use them,
+build their model, prompts and chains on first use, and keep their
+module-level ``console`` as a ``LazyConsole`` that imports rich only when
+something is printed.
+"""
+from typing import Any
+
+class LazyConsole:
+    """Stand-in for a ``rich.console.Console`` that is created on first use."""
+
+    def __init__(self, **options: Any):
+        object.__setattr__(self, "_options", options)
+        object.__setattr__(self, "_console", None)
+
+    def _get(self) -> Any:
+        if self._console is None:
+            from rich.console import Console
+            object.__setattr__(self, "_console", Console(**self._options))
+        return self._console
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # e.g. ``console.quiet = True`` must reach the real console
+        setattr(self._get(), name, value)
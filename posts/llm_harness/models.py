@@ -0,0 +1,61 @@
+"""
+Chat model construction with a pluggable backend.
+
+``create_chat_model`` is what the technique scripts' ``setup_model`` calls.
+The backend is chosen by argument or by the ``GENAI_BACKEND`` environment
+variable:
+
+- ``openai`` (default): ``langchain_openai.ChatOpenAI``
+- ``fake``: the offline ``FakeChatModel``; ``GENAI_FAKE_LATENCY`` and
+  ``GENAI_FAKE_TOKENS_PER_SECOND`` set its latency and token rate
+
+Unset model names and temperatures come from ``GENAI_MODEL`` and
+``GENAI_TEMPERATURE`` (default gpt-4o at temperature 0); ChatOpenAI reads
+its key from ``OPENAI_API_KEY``.
+
+OpenAI models share the process-wide pooled httpx clients of ``pool.py``
+(``GENAI_SHARED_POOL=0`` gives each model its own default client instead).
+
+If a ``RequestScheduler`` is passed (or ``GENAI_RPM``/``GENAI_TPM`` are set),
+the model is wrapped so every call is paced and retried through it.
+"""
+import os
+from typing import Any, Optional
+
+def create_chat_model(model_name: Optional[str] = None, temperature: Optional[float] = None, backend: Optional[str] = None, scheduler: Any = None,
+                      **kwargs: Any):
+    """Create a chat model for the selected backend, optionally behind a request scheduler."""
+    if model_name is None:
+        model_name = os.environ.get("GENAI_MODEL", "gpt-4o")
+    if temperature is None:
+        temperature = float(os.environ.get("GENAI_TEMPERATURE", 0))
+    if scheduler is None:
+        from llm_harness.ratelimit import scheduler_from_env
+        scheduler = scheduler_from_env()
+    model = _create_backend_model(model_name, temperature, backend, **kwargs)
+    return scheduler.wrap(model) if scheduler is not None else model
+
+def _create_backend_model(model_name: str, temperature: float, backend: Optional[str], **kwargs: Any):
+    backend = backend or os.environ.get("GENAI_BACKEND", "openai")
+
+    if backend == "fake":
+        from llm_harness.fake import FakeChatModel
+
+        if "GENAI_FAKE_LATENCY" in os.environ:
+            kwargs.setdefault("latency", float(os.environ["GENAI_FAKE_LATENCY"]))
+        if "GENAI_FAKE_TOKENS_PER_SECOND" in os.environ:
+            kwargs.setdefault("tokens_per_second", float(os.environ["GENAI_FAKE_TOKENS_PER_SECOND"]))
+        return FakeChatModel(model_name=model_name, temperature=temperature, **kwargs)
+
+    if backend == "openai":
+        from langchain_openai import ChatOpenAI
+
+        # One keep-alive pool for every chain and strategy; ChatOpenAI refuses clients alongside a proxy
+        if os.environ.get("GENAI_SHARED_POOL", "1") != "0" and not (kwargs.get("openai_proxy") or os.environ.get("OPENAI_PROXY")):
+            from llm_harness.pool import get_async_http_client, get_http_client
+
+            kwargs.setdefault("http_client", get_http_client())
+            kwargs.setdefault("http_async_client", get_async_http_client())
+        return ChatOpenAI(model=model_name, temperature=temperature, **kwargs)
+
+    raise ValueError(f"Unknown model backend: {backend}")
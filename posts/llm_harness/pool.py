@@ -0,0 +1,365 @@
+"""
+Shared, pooled HTTP clients for the OpenAI backend.
+
+``create_chat_model`` hands every ``ChatOpenAI`` it builds the same pair of
+httpx clients, so all chains and strategies in a process draw from one
+keep-alive connection pool instead of paying TCP/TLS handshakes per client:
+
+- The pool size and keep-alive expiry come from ``PoolConfig`` (or
+  ``GENAI_POOL_SIZE`` / ``GENAI_POOL_KEEPALIVE``)
+- HTTP/2 multiplexes concurrent requests over one connection when the ``h2``
+  package is installed (``GENAI_HTTP2=0`` turns it off)
+- ``warm_up`` / ``awarm_up`` open connections before the first real request
+- Every request is traced through httpcore's ``trace`` extension, and
+  ``pool_metrics`` reports how often a connection was reused, how long
+  requests waited for one and how long new connections took to open
+
+Connections can't be shared across processes, so each process (e.g. each
+sweep worker) builds its own pool on first use. The async client keeps one
+pool per event loop, because connections opened on a loop die with it.
+"""
+import collections
+import importlib.util
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import httpx
+    from rich.table import Table
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """
+    Connection pool settings shared by the sync and async clients.
+
+    Args:
+        max_connections: Connections open at once per pool; further requests wait for one
+        max_keepalive: Idle connections kept open for reuse
+        keepalive_expiry: Seconds an idle connection is kept before it is closed
+        http2: Negotiate HTTP/2 (None = when ``h2`` is installed)
+        connect_timeout: Seconds allowed to open a connection
+        timeout: Default seconds for the rest of a request (the OpenAI client sets its own)
+    """
+    max_connections: int = 64
+    max_keepalive: int = 32
+    keepalive_expiry: float = 60.0
+    http2: Optional[bool] = None
+    connect_timeout: float = 10.0
+    timeout: float = 600.0
+
+    def use_http2(self) -> bool:
+        if self.http2 is None:
+            return importlib.util.find_spec("h2") is not None
+        return self.http2
+
+def pool_config_from_env() -> PoolConfig:
+    """``PoolConfig`` with ``GENAI_POOL_SIZE``, ``GENAI_POOL_KEEPALIVE`` and ``GENAI_HTTP2`` applied."""
+    config = PoolConfig()
+    if "GENAI_POOL_SIZE" in os.environ:
+        size = int(os.environ["GENAI_POOL_SIZE"])
+        config = replace(config, max_connections=size, max_keepalive=min(config.max_keepalive, size))
+    if "GENAI_POOL_KEEPALIVE" in os.environ:
+        config = replace(config, max_keepalive=int(os.environ["GENAI_POOL_KEEPALIVE"]))
+    if "GENAI_HTTP2" in os.environ:
+        config = replace(config, http2=os.environ["GENAI_HTTP2"] not in ("0", "false", ""))
+    return config
+
+class PoolMetrics:
+    """Thread-safe counters of connection reuse, pool wait and connect times."""
+
+    def __init__(self, window: int = 10_000):
+        self._lock = threading.Lock()
+        self._window = window
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.reused = 0
+            self.failed = 0
+            self.connections = 0
+            self.connect_time = 0.0
+            self.wait_time = 0.0
+            self.protocols: Dict[str, int] = collections.Counter()
+            self._waits: Deque[float] = collections.deque(maxlen=self._window)
+
+    def record(self, trace: "_RequestTrace", failed: bool = False) -> None:
+        wait = trace.wait()
+        with self._lock:
+            self.requests += 1
+            self.failed += failed
+            if trace.connect_start is not None:
+                self.connections += 1
+                self.connect_time += (trace.connect_end or trace.connect_start) - trace.connect_start
+            elif trace.sent is not None:
+                self.reused += 1
+            if trace.protocol:
+                self.protocols[trace.protocol] += 1
+            if wait is not None:
+                self.wait_time += wait
+                self._waits.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Request count, reuse rate, connections opened and mean/p95/max pool wait and connect times (seconds)."""
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "requests": self.requests,
+                "reused": self.reused,
+                "reuse_rate": self.reused / self.requests if self.requests else None,
+                "connections": self.connections,
+                "failed": self.failed,
+                "mean_connect": self.connect_time / self.connections if self.connections else None,
+                "mean_wait": self.wait_time / len(waits) if waits else None,
+                "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else None,
+                "max_wait": waits[-1] if waits else None,
+                "protocols": dict(self.protocols)
+            }
+
+class _RequestTrace:
+    """httpcore trace of one request: did it open a connection, and when was it sent."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.connect_start: Optional[float] = None
+        self.connect_end: Optional[float] = None
+        self.sent: Optional[float] = None
+        self.protocol: Optional[str] = None
+
+    def event(self, name: str, info: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        if name == "connection.connect_tcp.started" and self.connect_start is None:
+            self.connect_start = now
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            self.connect_end = now
+        elif name.endswith(".send_request_headers.started") and self.sent is None:
+            self.sent = now
+            self.protocol = name.split(".", 1)[0]
+
+    async def aevent(self, name: str, info: Dict[str, Any]) -> None:
+        self.event(name, info)
+
+    def wait(self) -> Optional[float]:
+        """Time spent waiting for a pooled connection (up to opening one, or sending on a reused one)."""
+        ready = self.connect_start if self.connect_start is not None else self.sent
+        return ready - self.start if ready is not None else None
+
+def _transport_options(config: PoolConfig) -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(max_connections=config.max_connections, max_keepalive_connections=config.max_keepalive,
+                          keepalive_expiry=config.keepalive_expiry)
+    return {"limits": limits, "http2": config.use_http2()}
+
+def _traced(request: "httpx.Request", callback, is_async: bool = False) -> None:
+    # Chain to a trace callback the caller already set
+    previous = request.extensions.get("trace")
+    if previous is None:
+        request.extensions["trace"] = callback
+    elif is_async:
+        async def both(name: str, info: Dict[str, Any]) -> None:
+            await callback(name, info)
+            await previous(name, info)
+        request.extensions["trace"] = both
+    else:
+        def both(name: str, info: Dict[str, Any]) -> None:
+            callback(name, info)
+            previous(name, info)
+        request.extensions["trace"] = both
+
+def _metered_transports():
+    """Transport classes wrapping httpx's pools with per-request tracing (httpx imported on first use)."""
+    import asyncio
+    import httpx
+
+    class MeteredTransport(httpx.BaseTransport):
+        def __init__(self, config: PoolConfig, metrics: PoolMetrics):
+            self.metrics = metrics
+            self._transport = httpx.HTTPTransport(**_transport_options(config))
+
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            trace = _RequestTrace()
+            _traced(request, trace.event)
+            try:
+                response = self._transport.handle_request(request)
+            except Exception:
+                self.metrics.record(trace, failed=True)
+                raise
+            self.metrics.record(trace)
+            return response
+
+        def close(self) -> None:
+            self._transport.close()
+
+    class MeteredAsyncTransport(httpx.AsyncBaseTransport):
+        def __init__(self, config: PoolConfig, metrics: PoolMetrics):
+            self.config = config
+            self.metrics = metrics
+            self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = weakref.WeakKeyDictionary()
+
+        def _transport(self) -> httpx.AsyncHTTPTransport:
+            loop = asyncio.get_running_loop()
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**_transport_options(self.config))
+            return transport
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            trace = _RequestTrace()
+            _traced(request, trace.aevent, is_async=True)
+            try:
+                response = await self._transport().handle_async_request(request)
+            except Exception:
+                self.metrics.record(trace, failed=True)
+                raise
+            self.metrics.record(trace)
+            return response
+
+        async def aclose(self) -> None:
+            # Only the running loop's connections can be closed from here; others went with their loop
+            loop = asyncio.get_running_loop()
+            transport = self._transports.pop(loop, None)
+            if transport is not None:
+                await transport.aclose()
+
+        def close_all(self) -> None:
+            """Close every loop's connections on that loop: now if it is idle, soon if it is running."""
+            transports, self._transports = list(self._transports.items()), weakref.WeakKeyDictionary()
+            for loop, transport in transports:
+                if loop.is_closed():
+                    # Its sockets are closed when the dropped transports are collected
+                    continue
+                if not loop.is_running():
+                    try:
+                        loop.run_until_complete(transport.aclose())
+                        continue
+                    except RuntimeError:
+                        # Another loop is running in this thread
+                        pass
+                asyncio.run_coroutine_threadsafe(transport.aclose(), loop)
+
+    return MeteredTransport, MeteredAsyncTransport
+
+pool_metrics = PoolMetrics()
+
+_lock = threading.Lock()
+_config: Optional[PoolConfig] = None
+_clients: Dict[str, Any] = {}
+_pid: Optional[int] = None
+
+def configure_pool(config: Optional[PoolConfig] = None) -> None:
+    """Use ``config`` for the shared clients (closing the current pools); None goes back to the environment."""
+    global _config
+    with _lock:
+        _config = config
+        client = _clients.pop("sync", None)
+        async_transport = _clients.pop("async_transport", None)
+        _clients.clear()
+    if client is not None:
+        client.close()
+    if async_transport is not None:
+        async_transport.close_all()
+
+def _shared_client(kind: str):
+    global _pid
+    with _lock:
+        if _pid != os.getpid():
+            # A forked child must not reuse the parent's sockets
+            _clients.clear()
+            _pid = os.getpid()
+        if kind not in _clients:
+            import httpx
+
+            config = _config or pool_config_from_env()
+            transport, async_transport = _metered_transports()
+            timeout = httpx.Timeout(config.timeout, connect=config.connect_timeout)
+            if kind == "sync":
+                _clients[kind] = httpx.Client(transport=transport(config, pool_metrics), timeout=timeout, follow_redirects=True)
+            else:
+                # Kept so configure_pool can close the pools of every loop
+                metered = _clients["async_transport"] = async_transport(config, pool_metrics)
+                _clients[kind] = httpx.AsyncClient(transport=metered, timeout=timeout, follow_redirects=True)
+        return _clients[kind]
+
+def get_http_client() -> "httpx.Client":
+    """The process-wide pooled ``httpx.Client``, passed to ChatOpenAI as ``http_client``."""
+    return _shared_client("sync")
+
+def get_async_http_client() -> "httpx.AsyncClient":
+    """The process-wide pooled ``httpx.AsyncClient``, passed to ChatOpenAI as ``http_async_client``."""
+    return _shared_client("async")
+
+def _warm_up_url(url: Optional[str]) -> str:
+    return url or os.environ.get("OPENAI_BASE_URL") or DEFAULT_BASE_URL
+
+def warm_up(connections: int = 4, url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Open up to ``connections`` pooled connections to the API host with concurrent HEAD requests.
+
+    Any response, even a 401 or 404, leaves a warm keep-alive connection in
+    the pool; errors are ignored, since warm-up is only an optimization.
+
+    Returns:
+        Dictionary with the connections opened and the seconds it took
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = get_http_client()
+    target = _warm_up_url(url)
+    opened = pool_metrics.connections
+    start = time.perf_counter()
+
+    def head(_: int) -> None:
+        try:
+            client.head(target)
+        except Exception:
+            pass
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        list(executor.map(head, range(connections)))
+    return {"connections": pool_metrics.connections - opened, "time": time.perf_counter() - start}
+
+async def awarm_up(connections: int = 4, url: Optional[str] = None) -> Dict[str, Any]:
+    """``warm_up`` for the running event loop's pool of the async client."""
+    import asyncio
+
+    client = get_async_http_client()
+    target = _warm_up_url(url)
+    opened = pool_metrics.connections
+    start = time.perf_counter()
+    await asyncio.gather(*(client.head(target) for _ in range(connections)), return_exceptions=True)
+    return {"connections": pool_metrics.connections - opened, "time": time.perf_counter() - start}
+
+def _millis(seconds: Optional[float]) -> str:
+    return f"{seconds * 1e3:,.1f}" if seconds is not None else "-"
+
+def pool_table(snapshot: Optional[Dict[str, Any]] = None, title: str = "HTTP Connection Pool") -> "Table":
+    """Rich table of a ``PoolMetrics.snapshot()`` (the shared pool's by default)."""
+    from rich.table import Table
+
+    snapshot = snapshot if snapshot is not None else pool_metrics.snapshot()
+    table = Table(title=title, show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    table.add_column("Value", justify="right")
+
+    reuse_rate = snapshot["reuse_rate"]
+    rows: List[tuple] = [
+        ("Requests", f"{snapshot['requests']:,}"),
+        ("Connection reuse rate", f"{reuse_rate * 100:.1f}%" if reuse_rate is not None else "-"),
+        ("Connections opened", f"{snapshot['connections']:,}"),
+        ("Mean connect time (ms)", _millis(snapshot["mean_connect"])),
+        ("Mean pool wait (ms)", _millis(snapshot["mean_wait"])),
+        ("p95 pool wait (ms)", _millis(snapshot["p95_wait"])),
+        ("Max pool wait (ms)", _millis(snapshot["max_wait"])),
+        ("Protocols", ", ".join(f"{name}: {count:,}" for name, count in sorted(snapshot["protocols"].items())) or "-"),
+        ("Failed requests", f"{snapshot['failed']:,}")
+    ]
+    for row in rows:
+        table.add_row(*row)
+    return table
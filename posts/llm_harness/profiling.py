@@ -0,0 +1,291 @@
+"""
+Per-stage latency profiler with percentile histograms and trace export.
+
+``profiler.span(stage, strategy)`` times one stage of a chain call: a cache
+lookup, prompt formatting, the model call, parsing, usage accounting or Rich
+rendering. Durations go into a log-bucketed (HDR-style) histogram per
+strategy and stage, so p50/p95/p99 are available for any number of calls in
+bounded memory, with a relative error set by ``significant_figures``. While tracing,
+every span is also kept as a Chrome trace event; ``export_chrome_trace``
+writes them as JSON that chrome://tracing, Perfetto (ui.perfetto.dev) and
+speedscope open directly. Concurrent coroutines get their own track.
+
+The profiler is disabled by default. A disabled ``span`` returns a shared
+no-op context manager, so the instrumentation left in the hot path costs
+one attribute check per stage.
+"""
+import heapq
+import json
+import math
+import os
+import sys
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from rich.table import Table
+
+STAGES = ("cache", "format", "model", "parse", "usage", "render")
+DEFAULT_TRACE_PATH = "genai_trace.json"
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram in the spirit of HdrHistogram.
+
+    Bucket boundaries grow by a factor of ``1 + 10 ** -significant_figures``,
+    so any percentile is reported within that relative error, whatever the
+    range of values, in memory proportional to the number of distinct buckets.
+    """
+
+    def __init__(self, significant_figures: int = 2):
+        self._width = math.log1p(10 ** -significant_figures)
+        self._counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        bucket = math.floor(math.log(max(seconds, 1e-9)) / self._width)
+        self._counts[bucket] = self._counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the ``q`` quantile (0 < q <= 1), or None if empty."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self._counts):
+            seen += self._counts[bucket]
+            if seen >= rank:
+                return min(math.exp((bucket + 1) * self._width), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+class _NullSpan:
+    """Context manager used while profiling is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("profiler", "stage", "strategy", "args", "start", "lane")
+
+    def __init__(self, profiler: "Profiler", stage: str, strategy: str, args: Dict[str, Any]):
+        self.profiler = profiler
+        self.stage = stage
+        self.strategy = strategy
+        self.args = args
+
+    def __enter__(self):
+        self.lane = self.profiler._lane()
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler._finish(self, time.perf_counter_ns())
+        return False
+
+class Profiler:
+    """
+    Collects per-stage latency histograms and, optionally, trace events.
+
+    Args:
+        enabled: Start collecting immediately
+        trace: Keep individual spans for ``export_chrome_trace``
+        max_events: Cap on kept spans; later spans still update the histograms
+        significant_figures: Histogram precision (2 = within 1%)
+        trace_path: Default file for ``export_chrome_trace``
+    """
+
+    def __init__(self, enabled: bool = False, trace: bool = True, max_events: int = 1_000_000,
+                 significant_figures: int = 2, trace_path: str = DEFAULT_TRACE_PATH):
+        self.enabled = enabled
+        self.trace = trace
+        self.max_events = max_events
+        self.significant_figures = significant_figures
+        self.trace_path = trace_path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self, trace: bool = True) -> None:
+        self.trace = trace
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Drop all recorded histograms and spans."""
+        with self._lock:
+            self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+            self._events: List[Tuple[str, str, int, int, int, Dict[str, Any]]] = []
+            # Finished tasks hand their lane back, so lanes stay bounded by peak concurrency
+            self._task_lanes: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+            self._thread_lanes: Dict[int, int] = {}
+            self._lane_kinds: Dict[int, str] = {}
+            self._free_lanes: List[int] = []
+            self.dropped_events = 0
+            self._epoch = time.perf_counter_ns()
+
+    def span(self, stage: str, strategy: Optional[str] = None, **args: Any):
+        """Time a stage of a strategy: ``with profiler.span("parse", "aot"): ...``."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, stage, strategy or "all", args)
+
+    def _lane(self) -> int:
+        """Trace track of the current coroutine (or thread), so concurrent spans don't interleave."""
+        # No coroutine can be running unless something has imported asyncio
+        asyncio = sys.modules.get("asyncio")
+        try:
+            task = asyncio.current_task() if asyncio is not None else None
+        except RuntimeError:
+            task = None
+        if task is None:
+            key = threading.get_ident()
+            lane = self._thread_lanes.get(key)
+            if lane is None:
+                with self._lock:
+                    lane = self._thread_lanes.get(key) or self._new_lane("thread")
+                    self._thread_lanes[key] = lane
+            return lane
+
+        lane = self._task_lanes.get(task)
+        if lane is None:
+            with self._lock:
+                lane = self._task_lanes[task] = heapq.heappop(self._free_lanes) if self._free_lanes else self._new_lane("task")
+            task.add_done_callback(self._release_lane)
+        return lane
+
+    def _new_lane(self, kind: str) -> int:
+        lane = len(self._lane_kinds) + 1
+        self._lane_kinds[lane] = kind
+        return lane
+
+    def _release_lane(self, task: Any) -> None:
+        """Return a finished task's lane to the pool; the next task reuses the lowest free one."""
+        with self._lock:
+            lane = self._task_lanes.pop(task, None)
+            if lane is not None:
+                heapq.heappush(self._free_lanes, lane)
+
+    def _finish(self, span: _Span, end: int) -> None:
+        duration = end - span.start
+        with self._lock:
+            key = (span.strategy, span.stage)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram(self.significant_figures)
+            histogram.record(duration / 1e9)
+            if self.trace:
+                if len(self._events) < self.max_events:
+                    self._events.append((span.stage, span.strategy, span.start - self._epoch, duration, span.lane, span.args))
+                else:
+                    self.dropped_events += 1
+
+    def histogram(self, stage: str, strategy: Optional[str] = None) -> Optional[LatencyHistogram]:
+        return self._histograms.get((strategy or "all", stage))
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """``{strategy: {stage: {count, mean, p50, p95, p99, max, total}}}`` in seconds."""
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        summary: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda item: (item[0][0], order.get(item[0][1], len(order)), item[0][1]))
+            for (strategy, stage), histogram in items:
+                summary.setdefault(strategy, {})[stage] = {
+                    "count": histogram.count,
+                    "mean": histogram.mean,
+                    "p50": histogram.percentile(0.50),
+                    "p95": histogram.percentile(0.95),
+                    "p99": histogram.percentile(0.99),
+                    "max": histogram.max,
+                    "total": histogram.total
+                }
+        return summary
+
+    def table(self, title: str = "Per-stage Latency") -> "Table":
+        """Render the per-strategy, per-stage percentiles as a Rich table."""
+        from rich.table import Table
+
+        table = Table(title=title, show_header=True, header_style="bold magenta")
+        table.add_column("Strategy", style="dim", no_wrap=True)
+        table.add_column("Stage", style="dim", no_wrap=True)
+        table.add_column("Calls", justify="right")
+        for column in ("p50 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Total (s)"):
+            table.add_column(column, justify="right")
+
+        for strategy, stages in self.summary().items():
+            for stage, stats in stages.items():
+                table.add_row(
+                    strategy, stage, str(stats["count"]),
+                    *(f"{stats[key] * 1000:.2f}" for key in ("p50", "p95", "p99", "max")),
+                    f"{stats['total']:.2f}"
+                )
+        return table
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        """Spans as Chrome trace "complete" events (microsecond timestamps), plus track names."""
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+            lanes = list(self._lane_kinds.items())
+        trace = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "genai"}}]
+        trace.extend(
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": lane, "args": {"name": f"{kind} {lane}"}}
+            for lane, kind in lanes
+        )
+        trace.extend(
+            {
+                "name": f"{strategy}.{stage}",
+                "cat": stage,
+                "ph": "X",
+                "ts": start / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": lane,
+                "args": {"strategy": strategy, **args}
+            }
+            for stage, strategy, start, duration, lane, args in events
+        )
+        return trace
+
+    def export_chrome_trace(self, path: Optional[str] = None) -> str:
+        """Write the recorded spans as a Chrome trace JSON file and return its path."""
+        path = path or self.trace_path
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f, default=str)
+        return path
+
+profiler = Profiler()
+
+def profiler_from_env() -> Optional[Profiler]:
+    """
+    Enable the shared profiler if ``GENAI_PROFILE`` is set.
+
+    The variable holds the trace file path ("1" selects the default path).
+    """
+    setting = os.environ.get("GENAI_PROFILE")
+    if not setting or setting == "0":
+        return None
+    if setting != "1":
+        profiler.trace_path = setting
+    profiler.enable()
+    return profiler
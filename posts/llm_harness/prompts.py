@@ -0,0 +1,40 @@
+"""
+Prompt layouts shared by the technique scripts.
+
+Provider prompt caches (OpenAI, Anthropic, vLLM prefix caching, ...) only
+reuse an exact prefix of the prompt. The posts' default layout starts with
+the strategy's system message, so CoT, CoD and AoT prompts diverge from the
+first token even though they share the same few-shot example. The
+``shared_prefix`` layout puts the shared content first and the
+strategy-specific instructions after it, so every strategy and every
+question reuses the same cached prefix.
+"""
+from typing import TYPE_CHECKING, List, Optional
+
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+PROMPT_LAYOUTS = ("default", "shared_prefix")
+
+def layout_messages(system: str, shared: Optional[str] = None, layout: str = "default") -> List:
+    """
+    Order a strategy's messages for the given layout.
+
+    - ``default``: system instructions, the shared example, then the question
+    - ``shared_prefix``: the shared example, system instructions, then the question
+    """
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    if layout not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout: {layout} (expected one of {', '.join(PROMPT_LAYOUTS)})")
+    if shared is None:
+        return [SystemMessage(content=system), ("human", "{question}")]
+    if layout == "shared_prefix":
+        return [SystemMessage(content=f"Example:\n{shared}"), SystemMessage(content=system), ("human", "{question}")]
+    return [SystemMessage(content=system), HumanMessage(content=shared), ("human", "{question}")]
+
+def build_prompt(system: str, shared: Optional[str] = None, layout: str = "default") -> "ChatPromptTemplate":
+    """Build a question prompt with the given layout."""
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_messages(layout_messages(system, shared, layout))
@@ -0,0 +1,446 @@
+"""
+Adaptive request scheduler: RPM/TPM token buckets plus AIMD concurrency.
+
+Every model call made through a ``RequestScheduler`` is paced by two token
+buckets per model (requests per minute and tokens per minute, with the token
+cost estimated from the prompt size plus the expected output) and admitted
+through an adaptive concurrency limit. The limit grows additively while
+requests succeed and shrinks multiplicatively when the provider throttles
+(HTTP 429), and throttled requests are retried with full-jitter exponential
+backoff. The result is close to the maximum sustainable throughput without
+hand-tuning a concurrency number.
+
+Wrap a model once and build chains on the wrapper:
+
+    scheduler = RequestScheduler(limits={"gpt-4o": (500, 300_000)})
+    chains = create_chains(scheduler.wrap(model))
+"""
+import asyncio
+import collections
+import itertools
+import multiprocessing
+import os
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from langchain_core.language_models import LanguageModelInput
+from langchain_core.prompt_values import ChatPromptValue, StringPromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# Rough characters-per-token ratio for English prompts
+CHARS_PER_TOKEN = 4
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at ``per_minute``.
+
+    ``reserve`` always succeeds and returns how long the caller has to wait
+    before using the tokens. The bucket may go into debt, which makes large
+    requests wait proportionally instead of starving.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens and return the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Correct a reservation once the real cost is known (negative refunds)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+class SharedTokenBucket(TokenBucket):
+    """
+    Token bucket whose state lives in shared memory, so several processes
+    draw from one budget.
+
+    Create it in the parent and hand it to workers when the pool starts
+    (e.g. through a ``ProcessPoolExecutor`` initializer). The refill clock is
+    ``time.monotonic``, which is system-wide, so every process agrees on it.
+    """
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None, context: Any = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self._state = (context or multiprocessing).Array("d", [self.capacity, time.monotonic()])
+        self._lock = self._state.get_lock()
+
+    @property
+    def _tokens(self) -> float:
+        return self._state[0]
+
+    @_tokens.setter
+    def _tokens(self, value: float) -> None:
+        self._state[0] = value
+
+    @property
+    def _updated(self) -> float:
+        return self._state[1]
+
+    @_updated.setter
+    def _updated(self, value: float) -> None:
+        self._state[1] = value
+
+class _Waiter:
+    """A queued acquire: keeps its place until it gets a slot or gives up."""
+
+    __slots__ = ("wake",)
+
+    def __init__(self, wake: Callable[[], None]):
+        self.wake = wake
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit usable from threads and from any event loop.
+
+    Waiters get slots in FIFO order: a waiter keeps its place in the queue
+    until it acquires or gives up (timeout re-checks and cancellation
+    included), and new callers do not overtake queued ones. Async waiters are
+    resolved through their own loop, so one limiter can be shared by several
+    ``asyncio.run`` calls.
+    """
+
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 256,
+                 increase: float = 1.0, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._waiters: Deque[_Waiter] = collections.deque()
+
+    def _try_acquire(self, waiter: Optional[_Waiter] = None) -> bool:
+        """Take a slot if one is free for this caller: new callers wait behind every queued waiter."""
+        with self._lock:
+            free = max(1, int(self.limit)) - self.in_flight
+            ahead = len(self._waiters) if waiter is None else self._waiters.index(waiter)
+            if free > ahead:
+                self.in_flight += 1
+                if waiter is not None:
+                    self._waiters.remove(waiter)
+                return True
+            return False
+
+    def _wake(self) -> None:
+        """Wake the queued waiters at the head of the queue that a free slot is waiting for."""
+        with self._lock:
+            free = max(1, int(self.limit)) - self.in_flight
+            wakes = [waiter.wake for waiter in itertools.islice(self._waiters, max(0, free))]
+        for wake in wakes:
+            wake()
+
+    def _leave(self, waiter: _Waiter) -> None:
+        """Drop a waiter that gave up, passing on any wake-up it was sent."""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        self._wake()
+
+    def _enqueue(self, wake: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(wake)
+        with self._lock:
+            self._waiters.append(waiter)
+        return waiter
+
+    def acquire(self) -> None:
+        """Block the current thread until a slot is free."""
+        if self._try_acquire():
+            return
+        event = threading.Event()
+        waiter = self._enqueue(event.set)
+        try:
+            while True:
+                # Clear before the re-check, so a release after it still wakes us
+                event.clear()
+                if self._try_acquire(waiter):
+                    return
+                event.wait(timeout=1.0)
+        except BaseException:
+            self._leave(waiter)
+            raise
+
+    async def aacquire(self) -> None:
+        """Wait on the running event loop until a slot is free."""
+        if self._try_acquire():
+            return
+        loop = asyncio.get_running_loop()
+        waiter = self._enqueue(lambda: None)
+        try:
+            while True:
+                future = loop.create_future()
+                waiter.wake = lambda future=future: loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+                if self._try_acquire(waiter):
+                    return
+                try:
+                    await asyncio.wait_for(future, timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            # Timeouts keep the waiter queued; cancellation (a losing hedge, a cancelled gather) removes it
+            self._leave(waiter)
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._wake()
+
+    def on_success(self) -> None:
+        """Additive increase: roughly +increase per limit's worth of successes."""
+        with self._lock:
+            before = int(self.limit)
+            self.limit = min(self.maximum, self.limit + self.increase / max(self.limit, 1.0))
+            grew = int(self.limit) > before
+        if grew:
+            self._wake()
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease after the provider throttled a request."""
+        with self._lock:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+def is_throttle_error(error: BaseException) -> bool:
+    """True for provider rate-limit errors (HTTP 429)."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError"
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def estimate_prompt_tokens(value: Any) -> int:
+    """Estimate the input tokens of a prompt value, message list or string."""
+    if isinstance(value, ChatPromptValue):
+        value = value.messages
+    elif isinstance(value, StringPromptValue):
+        value = value.text
+    if isinstance(value, str):
+        return len(value) // CHARS_PER_TOKEN + 1
+    if isinstance(value, (list, tuple)):
+        return sum(len(str(getattr(m, "content", m))) for m in value) // CHARS_PER_TOKEN + 1
+    return len(str(value)) // CHARS_PER_TOKEN + 1
+
+def _actual_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    return None
+
+class RequestScheduler:
+    """
+    Shared pacing, admission and retry policy for every model call.
+
+    Args:
+        limits: Per-model ``(requests_per_minute, tokens_per_minute)``; models
+            not listed use ``default_limits``
+        expected_output_tokens: Output estimate added to each request's
+            token cost when the call does not set ``max_tokens``
+        initial_concurrency / max_concurrency: Bounds of the AIMD limit
+        max_retries: Attempts after a throttled request before giving up
+        buckets: Pre-built ``(rpm, tpm)`` buckets per model, e.g.
+            ``SharedTokenBucket`` pairs that hold a budget shared across processes
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 default_limits: Tuple[float, float] = (500, 200_000),
+                 expected_output_tokens: int = 512,
+                 initial_concurrency: float = 4, max_concurrency: float = 256,
+                 max_retries: int = 6, backoff_base: float = 0.5, backoff_cap: float = 30.0,
+                 seed: Optional[int] = None, buckets: Optional[Dict[str, Tuple[TokenBucket, TokenBucket]]] = None):
+        self.limits = dict(limits or {})
+        self.default_limits = default_limits
+        self.expected_output_tokens = expected_output_tokens
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._buckets: Dict[str, Tuple[TokenBucket, TokenBucket]] = dict(buckets or {})
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "failures": 0, "wait_time": 0.0}
+
+    def buckets(self, model_name: str) -> Tuple[TokenBucket, TokenBucket]:
+        """The (RPM, TPM) buckets for a model, created on first use."""
+        with self._lock:
+            if model_name not in self._buckets:
+                rpm, tpm = self.limits.get(model_name, self.default_limits)
+                self._buckets[model_name] = (TokenBucket(rpm), TokenBucket(tpm))
+            return self._buckets[model_name]
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    def _note_failure(self, error: BaseException) -> None:
+        self._count("failures")
+        if is_throttle_error(error):
+            self._count("throttled")
+            self.concurrency.on_throttle()
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After if present."""
+        ceiling = min(self.backoff_cap, self.backoff_base * (2 ** attempt))
+        with self._lock:
+            delay = self._rng.uniform(0, ceiling)
+        return max(delay, _retry_after(error) or 0.0)
+
+    def _reserve(self, model_name: str, tokens: int) -> float:
+        rpm, tpm = self.buckets(model_name)
+        wait = max(rpm.reserve(1), tpm.reserve(tokens))
+        self._count("wait_time", wait)
+        return wait
+
+    def _settle(self, model_name: str, estimated: int, response: Any) -> None:
+        actual = _actual_tokens(response)
+        if actual is not None:
+            self.buckets(model_name)[1].adjust(actual - estimated)
+
+    def run(self, model_name: str, tokens: int, call: Callable[[], Any]) -> Any:
+        """Run a blocking call under the scheduler's pacing and retry policy."""
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._reserve(model_name, tokens))
+            self.concurrency.acquire()
+            try:
+                self._count("requests")
+                response = call()
+            except Exception as error:
+                if not is_throttle_error(error) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("throttled")
+                self._count("retries")
+                self.concurrency.on_throttle()
+                delay = self._backoff(attempt, error)
+            else:
+                self.concurrency.on_success()
+                self._settle(model_name, tokens, response)
+                return response
+            finally:
+                self.concurrency.release()
+            time.sleep(delay)
+
+    async def arun(self, model_name: str, tokens: int, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Async version of run."""
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._reserve(model_name, tokens))
+            await self.concurrency.aacquire()
+            try:
+                self._count("requests")
+                response = await call()
+            except Exception as error:
+                if not is_throttle_error(error) or attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+                self._count("throttled")
+                self._count("retries")
+                self.concurrency.on_throttle()
+                delay = self._backoff(attempt, error)
+            else:
+                self.concurrency.on_success()
+                self._settle(model_name, tokens, response)
+                return response
+            finally:
+                self.concurrency.release()
+            await asyncio.sleep(delay)
+
+    def wrap(self, model: Runnable) -> "ScheduledModel":
+        """Route every call of ``model`` through this scheduler."""
+        return ScheduledModel(model, self)
+
+    def summary(self) -> str:
+        """One-line summary of the scheduler counters."""
+        stats = self.stats
+        return (
+            f"Scheduler: {stats['requests']} requests, {stats['throttled']} throttled, "
+            f"{stats['failures']} failed, concurrency limit {self.concurrency.limit:.1f}, "
+            f"{stats['wait_time']:.1f}s spent pacing"
+        )
+
+class ScheduledModel(Runnable):
+    """A chat model whose calls all go through a RequestScheduler."""
+
+    def __init__(self, model: Runnable, scheduler: RequestScheduler):
+        self.model = model
+        self.scheduler = scheduler
+        self.model_name = getattr(model, "model_name", None) or getattr(model, "model", None) or "default"
+
+    def _tokens(self, input: LanguageModelInput, kwargs: Dict[str, Any]) -> int:
+        output = kwargs.get("max_tokens") or self.scheduler.expected_output_tokens
+        return estimate_prompt_tokens(input) + output
+
+    def invoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return self.scheduler.run(self.model_name, self._tokens(input, kwargs), lambda: self.model.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        return await self.scheduler.arun(self.model_name, self._tokens(input, kwargs), lambda: self.model.ainvoke(input, config, **kwargs))
+
+    def stream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Iterator[Any]:
+        # Streams are admitted once; a throttled stream fails before any token arrives
+        scheduler = self.scheduler
+        time.sleep(scheduler._reserve(self.model_name, self._tokens(input, kwargs)))
+        scheduler.concurrency.acquire()
+        try:
+            scheduler._count("requests")
+            yield from self.model.stream(input, config, **kwargs)
+            scheduler.concurrency.on_success()
+        except Exception as error:
+            scheduler._note_failure(error)
+            raise
+        finally:
+            scheduler.concurrency.release()
+
+    async def astream(self, input: LanguageModelInput, config: Optional[RunnableConfig] = None, **kwargs: Any) -> AsyncIterator[Any]:
+        scheduler = self.scheduler
+        await asyncio.sleep(scheduler._reserve(self.model_name, self._tokens(input, kwargs)))
+        await scheduler.concurrency.aacquire()
+        try:
+            scheduler._count("requests")
+            async for chunk in self.model.astream(input, config, **kwargs):
+                yield chunk
+            scheduler.concurrency.on_success()
+        except Exception as error:
+            scheduler._note_failure(error)
+            raise
+        finally:
+            scheduler.concurrency.release()
+
+_default_scheduler: Optional[RequestScheduler] = None
+
+def scheduler_from_env() -> Optional[RequestScheduler]:
+    """
+    Process-wide scheduler configured by ``GENAI_RPM`` / ``GENAI_TPM``.
+
+    Returns None when neither variable is set.
+    """
+    global _default_scheduler
+    if "GENAI_RPM" not in os.environ and "GENAI_TPM" not in os.environ:
+        return None
+    if _default_scheduler is None:
+        limits = (float(os.environ.get("GENAI_RPM", 500)), float(os.environ.get("GENAI_TPM", 200_000)))
+        _default_scheduler = RequestScheduler(default_limits=limits)
+    return _default_scheduler
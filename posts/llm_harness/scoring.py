@@ -0,0 +1,387 @@
+"""
+Vectorized answer normalization and scoring for large evaluation runs.
+
+Extracted answers rarely match as strings: "$4.00" and "4", "3 cakes" and
+"3", "1 1/2" and "1.5" are the same answer. ``normalize_answers`` parses each
+distinct answer once into a number (currency symbols, thousands separators,
+units, fractions, mixed numbers, LaTeX ``\\frac`` and scientific notation are
+handled) or, failing that, a normalized text key, and broadcasts the result
+back over the column. ``answers_match`` then compares two columns with
+``np.isclose`` for numbers and key equality for text.
+
+``evaluate`` scores columnar results (``result_columns`` / ``load_columns``)
+against gold labels: accuracy, answer rate, latency percentiles, tokens and
+cost per strategy, plus bootstrap confidence intervals for each strategy's
+difference from a baseline. The bootstrap draws its resamples as count
+matrices, so every metric and strategy shares one matrix product per chunk of
+resamples, and 100k-row result sets are scored in seconds.
+"""
+import csv
+import json
+import math
+import re
+import warnings
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from rich.table import Table
+
+from llm_harness.dataset import iter_questions, iter_results
+from llm_harness.sinks import summarize
+
+NO_ANSWER = "No answer found"
+
+# Columns kept as text even when every value looks like a number
+TEXT_COLUMNS = ("id", "question", "problem")
+
+_LATEX_FRAC = re.compile(r"\\d?frac\{([^{}]*)\}\{([^{}]*)\}")
+_LATEX_WRAPPER = re.compile(r"\\(?:boxed|text|mathrm|textbf)\{([^{}]*)\}")
+_CURRENCY = re.compile(r"\\?[$€£¥₹]|\b(?:usd|eur|gbp)\b")
+_NUMBER = re.compile(
+    r"(?P<sign>[-+])?(?:"
+    r"(?P<whole>\d+)\s+(?P<num>\d+)\s*/\s*(?P<den>\d+)"  # mixed number: 1 1/2
+    r"|(?P<fnum>\d+(?:\.\d+)?)\s*/\s*(?P<fden>\d+(?:\.\d+)?)"  # fraction: 3/4
+    r"|(?P<value>(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|\.\d+)(?:e(?P<exp>[-+]?\d+))?"
+    r")"
+)
+
+def _clean(answer: str) -> str:
+    text = answer.lower().replace("**", "")
+    if "\\" in text:
+        text = _LATEX_FRAC.sub(r"\1/\2", text.replace("\\!", "").replace("\\,", ""))
+        text = _LATEX_WRAPPER.sub(r"\1", text)
+    return _CURRENCY.sub("", text.replace("−", "-"))
+
+def _parse(text: str) -> float:
+    matches = _NUMBER.findall(text)
+    if len(matches) != 1:
+        return math.nan
+    sign, whole, num, den, fnum, fden, value, exp = matches[0]
+    if den:
+        value = float(whole) + float(num) / float(den) if float(den) else math.nan
+    elif fden:
+        value = float(fnum) / float(fden) if float(fden) else math.nan
+    else:
+        value = float(value.replace(",", "")) * 10.0 ** int(exp or 0)
+    return -value if sign == "-" else value + 0.0
+
+def _normalize(answer: Optional[str]) -> Tuple[float, str]:
+    if answer is None or answer == NO_ANSWER:
+        return math.nan, ""
+    text = _clean(answer)
+    value = _parse(text)
+    if not math.isnan(value):
+        return value, f"{value:.10g}"
+    return value, " ".join(text.split()).strip(" .")
+
+def parse_number(answer: str) -> float:
+    """
+    The single number an answer states, or NaN.
+
+    Units and other words around the number are ignored ("12 km/h" is 12,
+    "25%" is 25). Answers with several numbers ("3 cakes and 2 pies",
+    "2 hours 30 minutes") are ambiguous and give NaN, so they fall back to
+    text comparison.
+    """
+    return _parse(_clean(answer))
+
+def answer_key(answer: Optional[str]) -> str:
+    """
+    Canonical form of one answer: the number it states ("4" for "$4.00") or
+    its normalized text. Missing answers give "".
+    """
+    return _normalize(answer)[1]
+
+class Answers(NamedTuple):
+    """A normalized answer column: numeric values (NaN if not a number) and canonical keys."""
+    values: np.ndarray
+    keys: np.ndarray
+
+def normalize_answers(answers: Union[Sequence[Optional[str]], np.ndarray]) -> Answers:
+    """Normalize a column of answers, parsing each distinct answer only once."""
+    texts = np.asarray(["" if answer is None else str(answer) for answer in answers], dtype=str)
+    if not len(texts):
+        return Answers(np.empty(0), np.empty(0, dtype=str))
+    uniques, inverse = np.unique(texts, return_inverse=True)
+    values, keys = zip(*map(_normalize, uniques.tolist()))
+    return Answers(np.array(values, dtype=float)[inverse], np.array(keys, dtype=str)[inverse])
+
+def answers_match(a: Union[Answers, Sequence[Optional[str]]], b: Union[Answers, Sequence[Optional[str]]],
+                  rtol: float = 1e-6, atol: float = 1e-9) -> np.ndarray:
+    """
+    Element-wise answer equivalence of two columns.
+
+    Numbers match within ``rtol``/``atol``; anything else matches on its
+    normalized text. A missing answer never matches.
+    """
+    a = a if isinstance(a, Answers) else normalize_answers(a)
+    b = b if isinstance(b, Answers) else normalize_answers(b)
+    numeric = ~np.isnan(a.values) & ~np.isnan(b.values)
+    with np.errstate(invalid="ignore"):
+        close = np.isclose(a.values, b.values, rtol=rtol, atol=atol)
+    return np.where(numeric, close, (a.keys == b.keys) & (a.keys != ""))
+
+def answer_matches(a: Optional[str], b: Optional[str], rtol: float = 1e-6, atol: float = 1e-9) -> bool:
+    """Scalar ``answers_match`` for comparing two answers of one result."""
+    if a is None or b is None or NO_ANSWER in (a, b):
+        return False
+    (x, key), (y, other) = _normalize(a), _normalize(b)
+    if not (math.isnan(x) or math.isnan(y)):
+        return math.isclose(x, y, rel_tol=rtol, abs_tol=atol)
+    return key != "" and key == other
+
+def _flatten(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Summary row of one result, unwrapping dataset checkpoints and strategy fan-outs."""
+    if isinstance(record.get("result"), dict):
+        record = {**record["result"], **{key: record[key] for key in ("id", "question") if key in record}}
+    if isinstance(record.get("results"), dict):
+        record = {**{key: value for key, value in record.items() if key != "results"}, **record["results"]}
+    return summarize(record)
+
+def _column(name: str, values: List[Any]) -> np.ndarray:
+    if name in TEXT_COLUMNS or name.endswith(".answer"):
+        return np.array(["" if value is None else str(value) for value in values], dtype=str)
+    try:
+        return np.array([math.nan if value in (None, "") else float(value) for value in values], dtype=float)
+    except (TypeError, ValueError):
+        return np.array(["" if value is None else str(value) for value in values], dtype=str)
+
+def _columns(rows: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    names: Dict[str, None] = {}
+    for row in rows:
+        names.update(dict.fromkeys(row))
+    return {name: _column(name, [row.get(name) for row in rows]) for name in names}
+
+def result_columns(results: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Columnar view of comparison results, one array per dotted summary field.
+
+    Accepts the results of any script (``cot``/``aot``, ``cot``/``cod``,
+    ``direct``/``stepback``), ``run_strategies`` fan-outs and ``run_dataset``
+    checkpoint rows. Names match the ``CsvSink`` columns, e.g. ``cot.answer``
+    and ``cot.usage.output_tokens``.
+    """
+    return _columns([_flatten(record) for record in results])
+
+def load_columns(path: str) -> Dict[str, np.ndarray]:
+    """Load a ``CsvSink`` summary, or a JSONL file of results (``JsonlSink`` or ``run_dataset``), as columns."""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            return _columns(list(csv.DictReader(f)))
+    return result_columns(iter_results(path))
+
+def gold_answer(value: Any) -> str:
+    """A dataset's gold answer as text, keeping only the part after ``####`` of GSM8K-style answers."""
+    return "" if value is None else str(value).rsplit("####", 1)[-1].strip()
+
+def load_gold(path: str, answer_field: str = "answer", key: str = "id", question_field: str = "question") -> Dict[str, str]:
+    """
+    Gold answers from a JSONL/CSV dataset, keyed by item id (``key="id"``) or question text (``key="question"``).
+
+    GSM8K-style answers ("... #### 72") are reduced to the part after the separator.
+    """
+    gold = {}
+    for item_id, question, record in iter_questions(path, question_field):
+        gold[item_id if key == "id" else question] = gold_answer(record[answer_field])
+    return gold
+
+def result_strategies(columns: Mapping[str, np.ndarray]) -> List[str]:
+    """Strategies with an answer column, in column order."""
+    return [name[:-len(".answer")] for name in columns if name.endswith(".answer") and "." not in name[:-len(".answer")]]
+
+def _align_gold(columns: Mapping[str, np.ndarray], gold: Union[Mapping[str, str], Sequence[str]], key: Optional[str] = None) -> List[str]:
+    if not isinstance(gold, Mapping):
+        return list(gold)
+    key = key or next((name for name in TEXT_COLUMNS if name in columns), None)
+    if key is None or key not in columns:
+        raise KeyError(f"Gold labels given as a mapping need a {key or 'id, question or problem'} column to align on")
+    items = [str(item) for item in columns[key]]
+    found = sum(item in gold for item in items)
+    if items and found * 2 < len(items):
+        raise ValueError(f"Only {found:,} of {len(items):,} rows have a gold answer by {key!r}; "
+                         "check that the gold labels are keyed by the same field")
+    return [gold.get(item, "") for item in items]
+
+def bootstrap_means(samples: np.ndarray, n_boot: int = 1000, seed: Optional[int] = 0, chunk_size: int = 2_000_000) -> np.ndarray:
+    """
+    Bootstrap distribution of the column means of ``samples`` (rows x metrics).
+
+    Each chunk of resamples is drawn as a matrix of row counts, so all
+    columns share one matrix product. NaNs are left out of each mean.
+
+    Returns:
+        Array of shape (n_boot, metrics)
+    """
+    samples = np.asarray(samples, dtype=float).reshape(len(samples), -1)
+    rows = len(samples)
+    valid = ~np.isnan(samples)
+    values = np.where(valid, samples, 0.0)
+    rng = np.random.default_rng(seed)
+    per_chunk = max(1, chunk_size // max(rows, 1))
+    means = np.empty((n_boot, samples.shape[1]))
+    for start in range(0, n_boot, per_chunk):
+        size = min(per_chunk, n_boot - start)
+        draws = rng.integers(0, rows, size=(size, rows)) + (np.arange(size) * rows)[:, None]
+        counts = np.bincount(draws.ravel(), minlength=size * rows).reshape(size, rows).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[start:start + size] = (counts @ values) / (counts @ valid)
+    return means
+
+def _stat(values: np.ndarray, fn) -> Optional[float]:
+    values = values[~np.isnan(values)]
+    return float(fn(values)) if len(values) else None
+
+def evaluate(columns: Mapping[str, np.ndarray], gold: Optional[Union[Mapping[str, str], Sequence[str]]] = None,
+             strategies: Optional[Sequence[str]] = None, baseline: Optional[str] = None,
+             n_boot: int = 1000, confidence: float = 0.95, seed: Optional[int] = 0,
+             rtol: float = 1e-6, key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Score columnar results per strategy and compare each strategy to a baseline.
+
+    Args:
+        columns: Output of ``result_columns`` or ``load_columns``
+        gold: Gold answers aligned with the rows, or a mapping from id (or
+            question) to answer such as ``load_gold`` returns
+        strategies: Strategies to score (default: every ``*.answer`` column)
+        baseline: Strategy the others are compared to (default: the first)
+        n_boot: Bootstrap resamples for the confidence intervals
+        confidence: Confidence level of the intervals
+        seed: Seed of the bootstrap resampling
+        rtol: Relative tolerance for numeric answers
+        key: Column a gold mapping is keyed by, the ``key`` given to
+            ``load_gold`` (default: the first of id, question, problem)
+
+    Returns:
+        Dictionary with per-strategy statistics, and paired differences from
+        the baseline (accuracy, time, output tokens, cost) with bootstrap
+        confidence intervals
+    """
+    if n_boot < 1:
+        raise ValueError("n_boot must be at least 1")
+    strategies = list(strategies or result_strategies(columns))
+    if not strategies:
+        raise ValueError("No strategy answer columns found")
+    baseline = baseline or strategies[0]
+    rows = len(columns[f"{strategies[0]}.answer"])
+    missing = np.full(rows, math.nan)
+    answers = {name: normalize_answers(columns[f"{name}.answer"]) for name in strategies}
+    gold_answers = normalize_answers(_align_gold(columns, gold, key)) if gold is not None else None
+
+    metrics: Dict[str, Dict[str, np.ndarray]] = {}
+    stats: Dict[str, Dict[str, Any]] = {}
+    for name in strategies:
+        answered = answers[name].keys != ""
+        metrics[name] = {
+            "time": columns.get(f"{name}.time", missing),
+            "output_tokens": columns.get(f"{name}.usage.output_tokens", missing),
+            "cost": columns.get(f"{name}.usage.cost", missing)
+        }
+        if gold_answers is not None:
+            metrics[name]["accuracy"] = answers_match(answers[name], gold_answers, rtol=rtol).astype(float)
+        times = metrics[name]["time"]
+        stats[name] = {
+            "accuracy": float(metrics[name]["accuracy"].mean()) if gold_answers is not None and rows else None,
+            "answer_rate": float(answered.mean()) if rows else None,
+            "agreement": float(answers_match(answers[name], answers[baseline], rtol=rtol).mean()) if rows else None,
+            "mean_time": _stat(times, np.mean),
+            "p50_time": _stat(times, lambda t: np.percentile(t, 50)),
+            "p95_time": _stat(times, lambda t: np.percentile(t, 95)),
+            "p99_time": _stat(times, lambda t: np.percentile(t, 99)),
+            "mean_input_tokens": _stat(columns.get(f"{name}.usage.input_tokens", missing), np.mean),
+            "mean_output_tokens": _stat(metrics[name]["output_tokens"], np.mean),
+            "total_cost": _stat(metrics[name]["cost"], np.sum)
+        }
+
+    # Paired per-row differences from the baseline, bootstrapped together
+    labels = []
+    differences = []
+    for name in strategies:
+        if name == baseline:
+            continue
+        for metric, values in metrics[name].items():
+            labels.append((name, metric))
+            differences.append(values - metrics[baseline][metric])
+    comparisons = []
+    if differences and rows:
+        samples = np.column_stack(differences)
+        means = bootstrap_means(samples, n_boot, seed)
+        tail = (1 - confidence) / 2 * 100
+        with warnings.catch_warnings():
+            # Metrics no row has (e.g. cost without prices) are all NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            low, high = np.nanpercentile(means, [tail, 100 - tail], axis=0)
+        for i, (name, metric) in enumerate(labels):
+            point = _stat(samples[:, i], np.mean)
+            comparisons.append({
+                "strategy": name,
+                "metric": metric,
+                "difference": point,
+                "low": None if point is None or math.isnan(low[i]) else float(low[i]),
+                "high": None if point is None or math.isnan(high[i]) else float(high[i])
+            })
+
+    return {
+        "rows": rows,
+        "baseline": baseline,
+        "confidence": confidence,
+        "n_boot": n_boot,
+        "strategies": stats,
+        "differences": comparisons
+    }
+
+def _percent(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.1%}"
+
+def _number(value: Optional[float], digits: int = 2) -> str:
+    return "-" if value is None else f"{value:,.{digits}f}"
+
+def evaluation_table(evaluation: Dict[str, Any], title: str = "Evaluation") -> Table:
+    """Per-strategy accuracy, latency, tokens and cost as a Rich table."""
+    table = Table(title=f"{title} ({evaluation['rows']:,} rows)", show_header=True, header_style="bold magenta")
+    for column in ("Strategy", "Accuracy", "Answered", "Agrees w/ Baseline", "Time p50 / p95 / p99 (s)", "Avg Output Tokens", "Total Cost (USD)"):
+        table.add_column(column, justify="left" if column == "Strategy" else "right")
+    for name, stats in evaluation["strategies"].items():
+        table.add_row(
+            name, _percent(stats["accuracy"]), _percent(stats["answer_rate"]), _percent(stats["agreement"]),
+            " / ".join(_number(stats[key]) for key in ("p50_time", "p95_time", "p99_time")),
+            _number(stats["mean_output_tokens"], 1),
+            "-" if stats["total_cost"] is None else f"${stats['total_cost']:.4f}"
+        )
+    return table
+
+def difference_table(evaluation: Dict[str, Any]) -> Table:
+    """Each strategy's mean difference from the baseline with its bootstrap confidence interval."""
+    level = f"{evaluation['confidence']:.0%}"
+    table = Table(title=f"Difference vs {evaluation['baseline']} ({level} bootstrap CI, {evaluation['n_boot']} resamples)", show_header=True, header_style="bold magenta")
+    for column in ("Strategy", "Metric", "Difference", f"{level} CI"):
+        table.add_column(column, justify="left" if column in ("Strategy", "Metric") else "right")
+    for row in evaluation["differences"]:
+        fmt = (lambda v: "-" if v is None else f"{v * 100:+.1f} pp") if row["metric"] == "accuracy" else (lambda v: "-" if v is None else f"{v:+,.4g}")
+        interval = "-" if row["low"] is None else f"[{fmt(row['low'])}, {fmt(row['high'])}]"
+        table.add_row(row["strategy"], row["metric"], fmt(row["difference"]), interval)
+    return table
+
+if __name__ == "__main__":
+    import argparse
+
+    from rich.console import Console
+
+    parser = argparse.ArgumentParser(description="Score saved results against gold answers")
+    parser.add_argument("results", help="JSONL results (JsonlSink or run_dataset output) or a CsvSink summary")
+    parser.add_argument("--gold", help="JSONL/CSV dataset with gold answers")
+    parser.add_argument("--answer-field", default="answer")
+    parser.add_argument("--key", choices=("id", "question"), default="id", help="Field that aligns results with gold answers")
+    parser.add_argument("--baseline")
+    parser.add_argument("--n-boot", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="Print the evaluation as JSON")
+    args = parser.parse_args()
+
+    columns = load_columns(args.results)
+    gold = load_gold(args.gold, args.answer_field, args.key) if args.gold else None
+    evaluation = evaluate(columns, gold, baseline=args.baseline, n_boot=args.n_boot, key=args.key)
+    if args.json:
+        print(json.dumps(evaluation, indent=2))
+    else:
+        console = Console()
+        console.print(evaluation_table(evaluation))
+        console.print(difference_table(evaluation))
@@ -0,0 +1,101 @@
+"""
+Local similarity cache for reusable intermediate results.
+
+``SimilarityCache`` maps past texts (e.g. questions) to values (e.g. their
+step-back analyses) and returns the value of the closest past text when its
+cosine similarity clears a threshold. Texts are embedded offline as hashed
+word n-gram vectors: numbers are replaced by a placeholder, so the same
+problem type with different figures still matches. The vectors are L2
+normalized rows of one NumPy matrix, so a lookup is a single matrix-vector
+product.
+"""
+import math
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z]+|\d[\d,.]*")
+_NUMBER = re.compile(r"\d")
+
+def hashed_ngram_vector(text: str, dims: int = 4096, ngrams: Tuple[int, ...] = (1, 2)) -> np.ndarray:
+    """Embed text as an L2-normalized vector of hashed word n-gram counts (sublinear tf)."""
+    words = ["<num>" if _NUMBER.match(w) else w for w in _WORD.findall(text.lower())]
+    counts: Dict[int, int] = {}
+    for n in ngrams:
+        for i in range(len(words) - n + 1):
+            # crc32 is stable across processes, unlike hash()
+            bucket = zlib.crc32(" ".join(words[i:i + n]).encode()) % dims
+            counts[bucket] = counts.get(bucket, 0) + 1
+
+    vector = np.zeros(dims, dtype=np.float32)
+    for bucket, count in counts.items():
+        vector[bucket] = 1.0 + math.log(count)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+class SimilarityCache:
+    """
+    Nearest-neighbour cache over hashed n-gram vectors.
+
+    Args:
+        threshold: Minimum cosine similarity for a lookup to count as a hit
+        dims: Hashed vector size; more dimensions mean fewer collisions
+        capacity: Initial number of matrix rows (grows by doubling)
+    """
+
+    def __init__(self, threshold: float = 0.85, dims: int = 4096, capacity: int = 64):
+        self.threshold = threshold
+        self.dims = dims
+        self._matrix = np.zeros((capacity, dims), dtype=np.float32)
+        self._texts: List[str] = []
+        self._values: List[Any] = []
+        self._costs: List[float] = []
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits": 0, "time_saved": 0.0}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def nearest(self, text: str) -> Optional[Tuple[int, float]]:
+        """Index and cosine similarity of the closest stored text, or None if empty."""
+        vector = hashed_ngram_vector(text, self.dims)
+        with self._lock:
+            if not self._values:
+                return None
+            scores = self._matrix[:len(self._values)] @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, text: str) -> Optional[Tuple[Any, float]]:
+        """Return ``(value, similarity)`` of a close enough past text, or None on a miss."""
+        match = self.nearest(text)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if match is None or match[1] < self.threshold:
+                return None
+            index, score = match
+            self._stats["hits"] += 1
+            self._stats["time_saved"] += self._costs[index]
+            return self._values[index], score
+
+    def add(self, text: str, value: Any, cost: float = 0.0) -> None:
+        """Store a value; ``cost`` (seconds) is credited as time saved whenever it is reused."""
+        vector = hashed_ngram_vector(text, self.dims)
+        with self._lock:
+            if len(self._values) == len(self._matrix):
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+            self._matrix[len(self._values)] = vector
+            self._texts.append(text)
+            self._values.append(value)
+            self._costs.append(cost)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lookups, hits, hit rate, entries and the total time saved by hits."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        stats["entries"] = len(self)
+        return stats
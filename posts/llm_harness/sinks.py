@@ -0,0 +1,193 @@
+"""
+Pluggable result sinks, fed off the request path.
+
+A headless batch hands each result to a ``SinkDispatcher`` instead of
+rendering it. The dispatcher queues results for a single background thread
+that feeds every sink in order, so the request path only pays for a queue
+put, and slow sinks (terminal output, disk) never hold up the model calls.
+The queue is bounded, so a sink that falls far behind applies backpressure
+instead of growing memory.
+
+Sinks:
+
+- ``RichSink``: calls a script's display function (the old default output)
+- ``JsonlSink``: one JSON line per result
+- ``CsvSink`` / ``ParquetSink``: one summary row per result (scalar fields
+  flattened to dotted names, full responses left out)
+- ``AggregateSink``: running statistics in memory (see ``dataset.RunningStats``)
+"""
+import csv
+import json
+import queue
+import threading
+import warnings
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from llm_harness.dataset import RunningStats
+
+SUMMARY_EXCLUDE = ("content", "problem_analysis", "solution", "samples")
+
+class ResultSink:
+    """Receives results one at a time on the dispatcher thread."""
+
+    def write(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class RichSink(ResultSink):
+    """Render each result with a display function, e.g. ``display_comparison``."""
+
+    def __init__(self, render: Callable[[Dict[str, Any]], None]):
+        self.render = render
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.render(record)
+
+class JsonlSink(ResultSink):
+    """Append each result as one JSON line."""
+
+    def __init__(self, path: str, mode: str = "w"):
+        self._file = open(path, mode, encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, default=str) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+def summarize(record: Dict[str, Any], exclude: Sequence[str] = SUMMARY_EXCLUDE, prefix: str = "") -> Dict[str, Any]:
+    """Flatten a result to its scalar fields (``cot.usage.cost``), dropping lists and excluded keys."""
+    row: Dict[str, Any] = {}
+    for key, value in record.items():
+        if key in exclude:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            row.update(summarize(value, exclude, f"{name}."))
+        elif value is None or isinstance(value, (str, int, float, bool)):
+            row[name] = value
+    return row
+
+class CsvSink(ResultSink):
+    """
+    Write one summary row per result.
+
+    Columns come from ``fields`` or, by default, from the first result's
+    summary; later fields that are not columns are ignored.
+    """
+
+    def __init__(self, path: str, fields: Optional[Sequence[str]] = None, exclude: Sequence[str] = SUMMARY_EXCLUDE):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self.fields = list(fields) if fields is not None else None
+        self.exclude = exclude
+        self._writer: Optional[csv.DictWriter] = None
+
+    def write(self, record: Dict[str, Any]) -> None:
+        row = summarize(record, self.exclude)
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fields or list(row), extrasaction="ignore")
+            self._writer.writeheader()
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._file.close()
+
+class ParquetSink(ResultSink):
+    """Collect summary rows and write them as one Parquet file on close (requires ``pyarrow``)."""
+
+    def __init__(self, path: str, exclude: Sequence[str] = SUMMARY_EXCLUDE):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("ParquetSink requires pyarrow: pip install pyarrow") from e
+        self._pa = pyarrow
+        self.path = path
+        self.exclude = exclude
+        self._rows: List[Dict[str, Any]] = []
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._rows.append(summarize(record, self.exclude))
+
+    def close(self) -> None:
+        self._pa.parquet.write_table(self._pa.Table.from_pylist(self._rows), self.path)
+
+class AggregateSink(ResultSink):
+    """Fold each result's metrics into running statistics, e.g. with a script's ``result_metrics``."""
+
+    def __init__(self, metrics: Callable[[Dict[str, Any]], Dict[str, float]]):
+        self.metrics = metrics
+        self.stats = RunningStats()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.stats.update(self.metrics(record))
+
+_CLOSE = object()
+
+class SinkDispatcher:
+    """
+    Feed results to sinks on a background thread.
+
+    Use as a context manager, or call ``close`` to drain the queue and close
+    the sinks. A sink that raises is skipped for that result; the first error
+    is re-raised from ``close`` so failures are not lost. When the ``with``
+    body is already raising, its exception wins and the sink error is added
+    to it as a note.
+
+    Args:
+        sinks: Sinks to feed, in order
+        max_queue: Results buffered before ``emit`` blocks
+    """
+
+    def __init__(self, sinks: Iterable[ResultSink], max_queue: int = 1024):
+        self.sinks = list(sinks)
+        self.emitted = 0
+        self.errors = 0
+        self._error: Optional[BaseException] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="result-sinks", daemon=True)
+        self._thread.start()
+
+    def emit(self, record: Dict[str, Any]) -> None:
+        self.emitted += 1
+        self._queue.put(record)
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is _CLOSE:
+                break
+            for sink in self.sinks:
+                try:
+                    sink.write(record)
+                except Exception as e:
+                    self.errors += 1
+                    self._error = self._error or e
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            for sink in self.sinks:
+                sink.close()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def __enter__(self) -> "SinkDispatcher":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception as error:
+            note = f"Result sink also failed: {error!r}"
+            if hasattr(exc, "add_note"):
+                exc.add_note(note)
+            else:
+                warnings.warn(note, RuntimeWarning)
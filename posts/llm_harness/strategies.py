@@ -0,0 +1,315 @@
+"""
+Strategy registry and fan-out engine.
+
+Each technique post registers its prompting strategies here when it is
+imported: ``direct``, ``stepback`` and ``stepback_two_stage`` (step-back
+prompting), ``cot`` and ``cod`` (Chain of Draft) and ``aot`` (Atom of
+Thoughts). ``load_strategies`` imports the posts, so the registry is filled
+without copying any prompt.
+
+``StrategyRunner`` binds strategies to one shared model and runs every
+selected strategy for a question at the same time; ``run_strategies`` is the
+one-call version and ``benchmark_strategies`` runs a whole question set in
+one pass. Results are plain dicts with one entry per strategy, rendered as
+an N-way table by ``strategy_table`` and ``strategy_summary_table``.
+"""
+import collections
+import contextlib
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llm_harness.streaming import ChainRun, arun_chain, extract_answer, format_seconds
+from llm_harness.usage import call_usage, chain_model_name, format_cost, format_tokens, prompt_text, token_usage
+
+if TYPE_CHECKING:
+    import asyncio
+    from rich.table import Table
+
+POSTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TECHNIQUE_DIRS = ["atom_of_thoughts", "chain_of_drafts", "step_back_prompting"]
+
+Chains = Dict[str, Any]
+# Each model call of a strategy: (prompt role, prompt inputs, run)
+Calls = List[Tuple[str, Dict[str, Any], ChainRun]]
+StrategyCall = Callable[[Chains, str, bool], Awaitable[Tuple[str, Calls]]]
+
+async def single_call(chains: Chains, question: str, stream: bool = False, name: str = "main") -> Tuple[str, Calls]:
+    """Run a one-prompt strategy: ``chains["main"]`` on the question."""
+    inputs = {"question": question}
+    run = await arun_chain(chains["main"], inputs, stream=stream, strategy=name)
+    return run.content, [("main", inputs, run)]
+
+@dataclass
+class Strategy:
+    """
+    A prompting strategy.
+
+    ``prompts`` returns the strategy's prompt templates by role (read at bind
+    time, so a post's ``set_prompt_layout`` is picked up); ``run`` calls the
+    bound ``prompt | model`` chains and returns the final content plus each
+    model call as ``(role, inputs, ChainRun)``. One-prompt strategies only
+    need a ``"main"`` prompt.
+    """
+    name: str
+    label: str
+    prompts: Callable[[], Dict[str, Any]]
+    run: Optional[StrategyCall] = None
+
+    def bind(self, model: Any) -> Chains:
+        return {role: prompt | model for role, prompt in self.prompts().items()}
+
+    async def arun(self, chains: Chains, question: str, stream: bool = False) -> Tuple[str, Calls]:
+        if self.run is None:
+            return await single_call(chains, question, stream, self.name)
+        return await self.run(chains, question, stream)
+
+_registry: Dict[str, Strategy] = {}
+
+def register_strategy(strategy: Strategy) -> Strategy:
+    """Add (or replace) a strategy in the registry."""
+    _registry[strategy.name] = strategy
+    return strategy
+
+def get_strategy(name: str) -> Strategy:
+    if name not in _registry:
+        load_strategies()
+    if name not in _registry:
+        raise KeyError(f"Unknown strategy: {name} (registered: {', '.join(_registry)})")
+    return _registry[name]
+
+def list_strategies() -> List[str]:
+    load_strategies()
+    return list(_registry)
+
+def load_techniques() -> Dict[str, Any]:
+    """Import the three technique modules from their post directories."""
+    for name in TECHNIQUE_DIRS:
+        path = os.path.join(POSTS_DIR, name)
+        if path not in sys.path:
+            sys.path.append(path)
+    import atom_of_thoughts
+    import chain_of_drafts
+    import step_back_prompting
+    return {
+        "atom_of_thoughts": atom_of_thoughts,
+        "chain_of_drafts": chain_of_drafts,
+        "step_back_prompting": step_back_prompting
+    }
+
+def load_strategies() -> Dict[str, Strategy]:
+    """Import the technique posts (which register their strategies) and return the registry."""
+    load_techniques()
+    return dict(_registry)
+
+def merge_usage(usages: Sequence[Dict[str, Any]], seconds: float) -> Dict[str, Any]:
+    """Sum the usage of a strategy's model calls; the cost is None if any call is unpriced."""
+    merged = {key: sum(usage[key] for usage in usages) for key in ("input_tokens", "output_tokens", "cached_input_tokens", "uncached_input_tokens")}
+    costs = [usage["cost"] for usage in usages]
+    merged["cost"] = None if any(cost is None for cost in costs) else sum(costs)
+    merged["source"] = "provider" if all(usage["source"] == "provider" for usage in usages) else "estimated"
+    merged["model_name"] = usages[0]["model_name"] if usages else None
+    merged["tokens_per_second"] = merged["output_tokens"] / seconds if seconds > 0 else None
+    return merged
+
+class StrategyRunner:
+    """
+    Run registered strategies against one shared model.
+
+    Args:
+        model: The chat model every strategy uses (one client, one cache, one rate limit)
+        strategies: Names of the strategies to run by default (None = all registered)
+        max_concurrency: Strategy runs in flight at once across questions (None = unbounded)
+        warm_up: Pooled connections opened to the API before a benchmark starts (0 = none)
+    """
+
+    def __init__(self, model: Any, strategies: Optional[Sequence[str]] = None, max_concurrency: Optional[int] = None, warm_up: int = 0):
+        self.model = model
+        self.names = list(strategies) if strategies is not None else list_strategies()
+        self.max_concurrency = max_concurrency
+        self.warm_up = warm_up
+        self._chains: Dict[str, Chains] = {}
+
+    def chains(self, name: str) -> Chains:
+        if name not in self._chains:
+            self._chains[name] = get_strategy(name).bind(self.model)
+        return self._chains[name]
+
+    async def _arun_one(self, name: str, question: str, stream: bool, semaphore: Optional["asyncio.Semaphore"]) -> Dict[str, Any]:
+        strategy = get_strategy(name)
+        chains = self.chains(name)
+        async with semaphore or contextlib.nullcontext():
+            start = time.perf_counter()
+            content, calls = await strategy.arun(chains, question, stream)
+            elapsed = time.perf_counter() - start
+
+        usages = []
+        for role, inputs, run in calls:
+            # Count the prompt locally only when the response carries no usage metadata
+            prompt = None if token_usage(run.message) else prompt_text(chains[role], inputs)
+            usages.append(call_usage(run.message, run.content, run.total, prompt=prompt, model_name=chain_model_name(chains[role])))
+        return {
+            "strategy": name,
+            "label": strategy.label,
+            "content": content,
+            "answer": extract_answer(content),
+            "words": len(content.split()),
+            "time": elapsed,
+            "model_calls": len(calls),
+            "ttft": calls[0][2].ttft if calls else None,
+            "usage": merge_usage(usages, elapsed)
+        }
+
+    async def arun(self, question: str, strategies: Optional[Sequence[str]] = None, stream: bool = False,
+                   semaphore: Optional["asyncio.Semaphore"] = None) -> Dict[str, Any]:
+        """
+        Run the selected strategies on one question concurrently.
+
+        Returns:
+            Dictionary with the question, one result per strategy (answer,
+            content, time, model calls, usage), the majority answer and the
+            wall time of the fan-out
+        """
+        import asyncio
+
+        names = list(strategies) if strategies is not None else self.names
+        start = time.perf_counter()
+        outcomes = await asyncio.gather(*(self._arun_one(name, question, stream, semaphore) for name in names))
+        results = {outcome["strategy"]: outcome for outcome in outcomes}
+
+        # Vote on canonical answers, so "$4.00" and "4" count together
+        from llm_harness.scoring import answer_key
+
+        keys = {r["strategy"]: answer_key(r["answer"]) for r in outcomes}
+        votes = collections.Counter(key for key in keys.values() if key)
+        majority = votes.most_common(1)[0][0] if votes else None
+        for result in outcomes:
+            result["agrees"] = majority is not None and keys[result["strategy"]] == majority
+        return {"question": question, "results": results, "majority": majority, "time": time.perf_counter() - start}
+
+    def run(self, question: str, strategies: Optional[Sequence[str]] = None, stream: bool = False) -> Dict[str, Any]:
+        import asyncio
+
+        return asyncio.run(self.arun(question, strategies, stream))
+
+    async def abenchmark(self, questions: Sequence[str], strategies: Optional[Sequence[str]] = None, stream: bool = False) -> Dict[str, Any]:
+        """Run every strategy on every question in one pass and summarize each strategy."""
+        import asyncio
+
+        if self.warm_up:
+            from llm_harness.pool import awarm_up
+            await awarm_up(self.warm_up)
+        semaphore = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency else None
+        start = time.perf_counter()
+        comparisons = await asyncio.gather(*(self.arun(question, strategies, stream, semaphore) for question in questions))
+        return {
+            "individual_results": list(comparisons),
+            "summary": summarize_strategies(comparisons),
+            "time": time.perf_counter() - start
+        }
+
+    def benchmark(self, questions: Sequence[str], strategies: Optional[Sequence[str]] = None, stream: bool = False) -> Dict[str, Any]:
+        import asyncio
+
+        return asyncio.run(self.abenchmark(questions, strategies, stream))
+
+def summarize_strategies(comparisons: Sequence[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per-strategy averages over a question set: time, tokens, model calls, cost and majority agreement."""
+    summary: Dict[str, Dict[str, Any]] = {}
+    for comparison in comparisons:
+        for name, result in comparison["results"].items():
+            entry = summary.setdefault(name, {"label": result["label"], "n": 0, "time": 0.0, "output_tokens": 0, "input_tokens": 0,
+                                              "model_calls": 0, "cost": 0.0, "agreement": 0, "answered": 0})
+            entry["n"] += 1
+            entry["time"] += result["time"]
+            entry["output_tokens"] += result["usage"]["output_tokens"]
+            entry["input_tokens"] += result["usage"]["input_tokens"]
+            entry["model_calls"] += result["model_calls"]
+            entry["agreement"] += result["agrees"]
+            entry["answered"] += result["answer"] != "No answer found"
+            cost = result["usage"]["cost"]
+            entry["cost"] = None if cost is None or entry["cost"] is None else entry["cost"] + cost
+
+    for entry in summary.values():
+        n = entry["n"]
+        entry["mean_time"] = entry["time"] / n
+        entry["mean_output_tokens"] = entry["output_tokens"] / n
+        entry["mean_input_tokens"] = entry["input_tokens"] / n
+        entry["mean_model_calls"] = entry["model_calls"] / n
+        entry["agreement_rate"] = entry["agreement"] / n * 100
+        entry["answer_rate"] = entry["answered"] / n * 100
+    return summary
+
+_default_runner: Optional[StrategyRunner] = None
+
+def run_strategies(question: str, strategies: Optional[Sequence[str]] = None, model: Any = None, stream: bool = False) -> Dict[str, Any]:
+    """
+    Fan out the selected strategies (default: all) on one question at the same time.
+
+    ``model`` defaults to ``create_chat_model()`` (honouring ``GENAI_BACKEND``),
+    created once and shared by later calls.
+    """
+    global _default_runner
+    if model is not None:
+        return StrategyRunner(model).run(question, strategies, stream)
+    if _default_runner is None:
+        from llm_harness.models import create_chat_model
+        _default_runner = StrategyRunner(create_chat_model())
+    return _default_runner.run(question, strategies, stream)
+
+def benchmark_strategies(questions: Sequence[str], strategies: Optional[Sequence[str]] = None, model: Any = None,
+                         max_concurrency: int = 8, stream: bool = False) -> Dict[str, Any]:
+    """Run the selected strategies on every question in one pass, with one shared model."""
+    if model is None:
+        from llm_harness.models import create_chat_model
+        model = create_chat_model()
+    return StrategyRunner(model, strategies, max_concurrency).benchmark(questions, strategies, stream)
+
+def strategy_table(comparison: Dict[str, Any], title: str = "Strategy Comparison") -> "Table":
+    """Render one question's N-way comparison: one column per strategy."""
+    from rich.table import Table
+
+    results = list(comparison["results"].values())
+    table = Table(title=title, show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    for result in results:
+        table.add_column(result["label"], justify="right")
+
+    def row(name: str, render: Callable[[Dict[str, Any]], str]) -> None:
+        table.add_row(name, *(render(result) for result in results))
+
+    row("Final Answer", lambda r: r["answer"])
+    row("Agrees with Majority", lambda r: "yes" if r["agrees"] else "no")
+    row("Model Calls", lambda r: str(r["model_calls"]))
+    row("Word Count", lambda r: str(r["words"]))
+    row("Input Tokens", lambda r: format_tokens(r["usage"], "input_tokens"))
+    row("Output Tokens", lambda r: format_tokens(r["usage"], "output_tokens"))
+    row("Time (seconds)", lambda r: format_seconds(r["time"]))
+    if any(r["ttft"] is not None for r in results):
+        row("Time to First Token (seconds)", lambda r: format_seconds(r["ttft"]))
+    row("Cost (USD)", lambda r: format_cost(r["usage"]["cost"]))
+    table.caption = f"All strategies ran concurrently in {comparison['time']:.2f}s"
+    return table
+
+def strategy_summary_table(summary: Dict[str, Dict[str, Any]], num_questions: int, title: str = "Strategy Benchmark") -> "Table":
+    """Render per-strategy averages over a question set."""
+    from rich.table import Table
+
+    table = Table(title=f"{title} ({num_questions} questions)", show_header=True, header_style="bold magenta")
+    table.add_column("Strategy", style="dim")
+    for column in ("Avg Time (s)", "Avg Output Tokens", "Avg Input Tokens", "Avg Model Calls", "Total Cost (USD)", "Answered", "Agrees with Majority"):
+        table.add_column(column, justify="right")
+    for entry in summary.values():
+        table.add_row(
+            entry["label"],
+            f"{entry['mean_time']:.2f}",
+            f"{entry['mean_output_tokens']:.1f}",
+            f"{entry['mean_input_tokens']:.1f}",
+            f"{entry['mean_model_calls']:.1f}",
+            format_cost(entry["cost"]),
+            f"{entry['answer_rate']:.1f}%",
+            f"{entry['agreement_rate']:.1f}%"
+        )
+    return table
@@ -0,0 +1,364 @@
+"""
+Streaming execution with latency breakdowns and early cut-off.
+
+``run_chain`` and ``arun_chain`` execute a ``prompt | model`` chain either
+with a single blocking call or by consuming the token stream. In streaming
+mode they record time-to-first-token, the gaps between chunks and the total
+time, and stop reading as soon as the line after the ``####`` separator is
+complete. Leaving the stream early closes the underlying HTTP response, so
+the provider stops generating the tokens nobody would read.
+
+While the shared profiler is enabled, prompt formatting and the model call
+are timed as separate ``format`` and ``model`` stages of the given strategy.
+While the shared token budget is enabled, each call of a named strategy is
+capped at its learned ``max_tokens`` and retried with a larger budget if it
+is cut off before the answer (see ``budget.py``). LangChain's streams bypass
+the LLM cache, so while a response cache is installed, streamed calls look
+it up here: a hit is replayed as one chunk, cut after the answer line like
+a live stream, and a miss is stored once the stream has been read to its
+end. With a cache installed, a miss therefore still pays for the tokens
+after the answer (see ``cache.py``).
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+
+from llm_harness.budget import token_budget, with_max_tokens
+from llm_harness.profiling import profiler
+
+ANSWER_SEPARATOR = "####"
+
+def extract_answer(response: str) -> str:
+    """Extract the final answer after the #### separator."""
+    parts = response.split(ANSWER_SEPARATOR)
+    if len(parts) > 1:
+        return parts[1].strip()
+    return "No answer found"
+
+def answer_end(text: str, separator: str = ANSWER_SEPARATOR) -> Optional[int]:
+    """Index just past the newline that completes the answer line after ``separator``, or None if it is not complete."""
+    index = text.find(separator)
+    if index == -1:
+        return None
+    answer_text = False
+    for position in range(index + len(separator), len(text)):
+        char = text[position]
+        if char == "\n":
+            if answer_text:
+                return position + 1
+        elif not char.isspace():
+            answer_text = True
+    return None
+
+class AnswerCutoff:
+    """
+    Incrementally detect when the answer line after ``####`` is complete.
+
+    Only the newly arrived text (plus a few characters of overlap for a
+    separator split across chunks) is scanned on each ``feed``.
+    """
+
+    def __init__(self, separator: str = ANSWER_SEPARATOR):
+        self.separator = separator
+        self._tail = ""
+        self._answer_started = False
+        self._answer_text = False
+
+    def feed(self, text: str) -> bool:
+        """Consume the next chunk and return True once the answer line is done."""
+        if not self._answer_started:
+            window = self._tail + text
+            index = window.find(self.separator)
+            if index == -1:
+                self._tail = window[-(len(self.separator) - 1):]
+                return False
+            self._answer_started = True
+            text = window[index + len(self.separator):]
+
+        for char in text:
+            if char == "\n":
+                if self._answer_text:
+                    return True
+            elif not char.isspace():
+                self._answer_text = True
+        return False
+
+@dataclass
+class ChainRun:
+    """The content of one chain call plus its latency breakdown."""
+
+    content: str
+    total: float
+    ttft: Optional[float] = None
+    inter_token: List[float] = field(default_factory=list)
+    chunks: int = 0
+    streamed: bool = False
+    stopped_early: bool = False
+    message: Any = None
+    max_tokens: Optional[int] = None
+    retries: int = 0
+
+    @property
+    def mean_inter_token(self) -> Optional[float]:
+        if not self.inter_token:
+            return None
+        return sum(self.inter_token) / len(self.inter_token)
+
+    @property
+    def p95_inter_token(self) -> Optional[float]:
+        if not self.inter_token:
+            return None
+        gaps = sorted(self.inter_token)
+        return gaps[min(len(gaps) - 1, int(0.95 * len(gaps)))]
+
+    def latency(self) -> Dict[str, Any]:
+        """Latency breakdown as a plain dict for result payloads."""
+        return {
+            "total": self.total,
+            "ttft": self.ttft,
+            "mean_inter_token": self.mean_inter_token,
+            "p95_inter_token": self.p95_inter_token,
+            "chunks": self.chunks,
+            "streamed": self.streamed,
+            "stopped_early": self.stopped_early,
+            "max_tokens": self.max_tokens,
+            "retries": self.retries
+        }
+
+class _StreamRecorder:
+    """Accumulates chunks and timings while a stream is consumed."""
+
+    def __init__(self, stop_after_answer: bool):
+        self.cutoff = AnswerCutoff() if stop_after_answer else None
+        self.parts: List[str] = []
+        self.message = None
+        self.start = time.perf_counter()
+        self.last: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.gaps: List[float] = []
+
+    def add(self, chunk: Any) -> bool:
+        """Record one chunk; return True if the stream should be abandoned."""
+        self.message = chunk if self.message is None else self.message + chunk
+        text = chunk.content if isinstance(chunk.content, str) else ""
+        if not text:
+            # Role or usage-only chunks carry no tokens and do not count for timing
+            return False
+
+        now = time.perf_counter()
+        if self.last is None:
+            self.ttft = now - self.start
+        else:
+            self.gaps.append(now - self.last)
+        self.last = now
+
+        self.parts.append(text)
+        return self.cutoff is not None and self.cutoff.feed(text)
+
+    def replay(self, message: Any) -> ChainRun:
+        """A cached response as one chunk, cut after the answer line exactly like a live stream."""
+        self.add(message)
+        text = message.content if isinstance(message.content, str) else ""
+        return self.finish(self.cutoff is not None and answer_end(text) is not None)
+
+    def finish(self, stopped_early: bool) -> ChainRun:
+        content = "".join(self.parts)
+        if stopped_early:
+            # The last chunk may run past the answer line; keep the content identical to a cached replay
+            content = content[:answer_end(content) or len(content)]
+        return ChainRun(
+            content=content,
+            total=time.perf_counter() - self.start,
+            ttft=self.ttft,
+            inter_token=self.gaps,
+            chunks=len(self.parts),
+            streamed=True,
+            stopped_early=stopped_early,
+            message=self.message
+        )
+
+def split_chain(chain):
+    """Split ``prompt | ... | model`` into its prompt part and the final model (None, chain otherwise)."""
+    from langchain_core.runnables import RunnableSequence
+
+    if isinstance(chain, RunnableSequence):
+        steps = chain.steps
+        prompt = steps[0] if len(steps) == 2 else RunnableSequence(*steps[:-1])
+        return prompt, steps[-1]
+    return None, chain
+
+def _budgeted(strategy: Optional[str]) -> bool:
+    return token_budget.enabled and strategy is not None
+
+def _output_tokens(run: ChainRun) -> int:
+    from llm_harness.usage import count_tokens, token_usage
+
+    usage = token_usage(run.message)
+    return usage["output_tokens"] if usage else count_tokens(run.content)
+
+def _next_cap(run: ChainRun, strategy: str, cap: Optional[int], retries: int) -> Tuple[bool, Optional[int]]:
+    """Record an attempt; return whether to retry it, and with which cap."""
+    tokens = _output_tokens(run)
+    # A stream we abandoned after the answer was not cut off by the cap
+    truncated = not run.stopped_early and token_budget.truncated(run.message, tokens, cap)
+    token_budget.record_attempt(strategy, cap, tokens, truncated)
+    retry = truncated and cap is not None and ANSWER_SEPARATOR not in run.content and retries < token_budget.max_retries
+    return retry, token_budget.retry_cap(cap) if retry else cap
+
+def _finish_budgeted(run: ChainRun, strategy: str, first_cap: Optional[int], elapsed: float, tokens: int, retries: int) -> ChainRun:
+    """Fold the cut-off attempts into the final run and record the call."""
+    run.total += elapsed
+    run.max_tokens = first_cap
+    run.retries = retries
+    token_budget.record_call(strategy, first_cap is not None, run.total, tokens + _output_tokens(run), retries, ANSWER_SEPARATOR in run.content)
+    return run
+
+def run_chain(chain, inputs: Dict[str, Any], stream: bool = False, stop_after_answer: bool = True, strategy: Optional[str] = None) -> ChainRun:
+    """Run a chain, optionally streaming it with an early cut-off after the answer."""
+    if not _budgeted(strategy):
+        return _run_chain(chain, inputs, stream, stop_after_answer, strategy)
+
+    first_cap = cap = token_budget.cap(strategy)
+    elapsed, tokens, retries = 0.0, 0, 0
+    while True:
+        run = _run_chain(with_max_tokens(chain, cap), inputs, stream, stop_after_answer, strategy)
+        retry, cap = _next_cap(run, strategy, cap, retries)
+        if not retry:
+            return _finish_budgeted(run, strategy, first_cap, elapsed, tokens, retries)
+        elapsed += run.total
+        tokens += _output_tokens(run)
+        retries += 1
+
+async def arun_chain(chain, inputs: Dict[str, Any], stream: bool = False, stop_after_answer: bool = True, strategy: Optional[str] = None) -> ChainRun:
+    """Async version of run_chain built on ``ainvoke``/``astream``."""
+    if not _budgeted(strategy):
+        return await _arun_chain(chain, inputs, stream, stop_after_answer, strategy)
+
+    first_cap = cap = token_budget.cap(strategy)
+    elapsed, tokens, retries = 0.0, 0, 0
+    while True:
+        run = await _arun_chain(with_max_tokens(chain, cap), inputs, stream, stop_after_answer, strategy)
+        retry, cap = _next_cap(run, strategy, cap, retries)
+        if not retry:
+            return _finish_budgeted(run, strategy, first_cap, elapsed, tokens, retries)
+        elapsed += run.total
+        tokens += _output_tokens(run)
+        retries += 1
+
+def _stream_cache(chain, inputs: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    """The chain's model, its formatted input and the response cache key, while a cache is installed."""
+    from langchain_core.globals import get_llm_cache
+
+    from llm_harness.cache import stream_cache_key
+
+    if get_llm_cache() is None:
+        return chain, inputs, None
+    prompt, model = split_chain(chain)
+    if prompt is not None:
+        inputs = prompt.invoke(inputs)
+    return model, inputs, stream_cache_key(model, inputs)
+
+async def _astream_cache(chain, inputs: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    """Async version of _stream_cache."""
+    from langchain_core.globals import get_llm_cache
+
+    from llm_harness.cache import stream_cache_key
+
+    if get_llm_cache() is None:
+        return chain, inputs, None
+    prompt, model = split_chain(chain)
+    if prompt is not None:
+        inputs = await prompt.ainvoke(inputs)
+    return model, inputs, stream_cache_key(model, inputs)
+
+def _run_chain(chain, inputs: Dict[str, Any], stream: bool, stop_after_answer: bool, strategy: Optional[str]) -> ChainRun:
+    if profiler.enabled:
+        prompt, model = split_chain(chain)
+        if prompt is not None:
+            with profiler.span("format", strategy):
+                inputs = prompt.invoke(inputs)
+            chain = model
+    key = None
+    if stream:
+        chain, inputs, key = _stream_cache(chain, inputs)
+
+    with profiler.span("model", strategy, streamed=stream):
+        if not stream:
+            start = time.perf_counter()
+            response = chain.invoke(inputs)
+            return ChainRun(content=response.content, total=time.perf_counter() - start, message=response)
+
+        from llm_harness.cache import cache_message, cached_message
+
+        recorder = _StreamRecorder(stop_after_answer)
+        cached = cached_message(key) if key is not None else None
+        if cached is not None:
+            return recorder.replay(cached)
+
+        stopped_early = False
+        stream_iter = iter(chain.stream(inputs))
+        for chunk in stream_iter:
+            if recorder.add(chunk):
+                stopped_early = True
+                break
+        run = recorder.finish(stopped_early)
+        if key is not None:
+            # Trades the early cut-off for a cacheable response: the rest (usually a
+            # few tokens) is still read on a miss, so blocking calls and reruns can reuse it
+            message = run.message
+            for chunk in stream_iter:
+                message = message + chunk
+            if message is not None:
+                cache_message(key, message)
+        return run
+
+async def _arun_chain(chain, inputs: Dict[str, Any], stream: bool, stop_after_answer: bool, strategy: Optional[str]) -> ChainRun:
+    if profiler.enabled:
+        prompt, model = split_chain(chain)
+        if prompt is not None:
+            with profiler.span("format", strategy):
+                inputs = await prompt.ainvoke(inputs)
+            chain = model
+    key = None
+    if stream:
+        chain, inputs, key = await _astream_cache(chain, inputs)
+
+    with profiler.span("model", strategy, streamed=stream):
+        if not stream:
+            start = time.perf_counter()
+            response = await chain.ainvoke(inputs)
+            return ChainRun(content=response.content, total=time.perf_counter() - start, message=response)
+
+        from llm_harness.cache import acache_message, acached_message
+
+        recorder = _StreamRecorder(stop_after_answer)
+        cached = await acached_message(key) if key is not None else None
+        if cached is not None:
+            return recorder.replay(cached)
+
+        stopped_early = False
+        stream_iter = chain.astream(inputs)
+        try:
+            async for chunk in stream_iter:
+                if recorder.add(chunk):
+                    stopped_early = True
+                    break
+            run = recorder.finish(stopped_early)
+            if key is not None:
+                message = run.message
+                async for chunk in stream_iter:
+                    message = message + chunk
+                if message is not None:
+                    await acache_message(key, message)
+        finally:
+            await stream_iter.aclose()
+        return run
+
+def format_seconds(value: Optional[float]) -> str:
+    """Format an optional duration for comparison tables."""
+    return "-" if value is None else f"{value:.2f}"
+
+def format_millis(value: Optional[float]) -> str:
+    """Format an optional duration in milliseconds for comparison tables."""
+    return "-" if value is None else f"{value * 1000:.1f}"
@@ -0,0 +1,346 @@
+"""
+Multi-process parameter sweep over models, temperatures, strategies and datasets.
+
+``run_sweep`` expands a grid of models x temperatures x strategies x datasets
+into cells. Each cell's questions are split into chunks, and the chunks are
+spread over a process pool, so even a two-cell comparison keeps every worker
+busy. Each worker runs its chunks on one long-lived event loop with its own
+concurrency limit, so its pooled HTTP connections (``pool.py``) stay warm
+from chunk to chunk. All workers share:
+
+- one on-disk response cache (SQLite in WAL mode, see ``cache.py``)
+- one request budget: the per-model RPM/TPM token buckets live in shared
+  memory (``ratelimit.SharedTokenBucket``), so the pool as a whole stays
+  under the provider limits however many workers there are
+
+Results are collected in long format, one row per cell and question. They
+are scored against the dataset's gold answers with ``scoring.answers_match``
+and written as one columnar file (``.npz``, or ``.parquet`` with pyarrow).
+``sweep_summary`` reduces them to per-cell accuracy with a bootstrap
+confidence interval, latency percentiles, tokens and cost.
+
+    python -m llm_harness.sweep --datasets gsm8k.jsonl --strategies cod aot \\
+        --temperatures 0 0.7 --workers 8 --concurrency 16 --output sweep.npz
+"""
+import asyncio
+import itertools
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rich.progress import Progress
+from rich.table import Table
+
+from llm_harness.dataset import iter_questions
+from llm_harness.ratelimit import RequestScheduler, SharedTokenBucket
+from llm_harness.scoring import answers_match, bootstrap_means, gold_answer
+
+# Columns of the results file; the first four identify the cell
+COLUMNS = (
+    "model", "temperature", "strategy", "dataset", "id", "question", "gold", "answer", "correct",
+    "time", "ttft", "model_calls", "input_tokens", "output_tokens", "cached_input_tokens", "cost", "error"
+)
+TEXT_COLUMNS = ("model", "strategy", "dataset", "id", "question", "gold", "answer", "error")
+
+@dataclass(frozen=True)
+class SweepCell:
+    """One point of the grid: a strategy run with one model configuration on one dataset."""
+    model: str
+    temperature: float
+    strategy: str
+    dataset: str
+
+def sweep_grid(models: Sequence[str], temperatures: Sequence[float], strategies: Sequence[str], datasets: Sequence[str]) -> List[SweepCell]:
+    """Every combination of the given models, temperatures, strategies and datasets."""
+    return [SweepCell(*values) for values in itertools.product(models, temperatures, strategies, datasets)]
+
+# Per-process state of a pool worker, set by _init_worker
+_worker: Dict[str, Any] = {}
+
+def _init_worker(cache_path: Optional[str], buckets: Optional[Dict[str, Tuple[SharedTokenBucket, SharedTokenBucket]]],
+                 backend: Optional[str], model_kwargs: Dict[str, Any], warm_up: int = 0) -> None:
+    if cache_path:
+        from llm_harness.cache import enable_response_cache
+        enable_response_cache(cache_path)
+    from llm_harness.budget import budget_from_env
+    from llm_harness.strategies import load_strategies
+    load_strategies()
+    # Each worker learns its own max_tokens caps when GENAI_TOKEN_BUDGET is set
+    budget_from_env()
+    # One scheduler per worker: its own AIMD concurrency, the pool's shared buckets
+    _worker.update(
+        scheduler=RequestScheduler(buckets=buckets) if buckets is not None else None,
+        backend=backend,
+        model_kwargs=model_kwargs,
+        runners={},
+        # Kept for the worker's lifetime, so its connection pool is reused across chunks
+        loop=asyncio.new_event_loop(),
+        # There is nothing to warm up without the HTTP backend
+        warm_up=warm_up if (backend or os.environ.get("GENAI_BACKEND", "openai")) == "openai" else 0
+    )
+
+def _runner(cell: SweepCell):
+    from llm_harness.models import create_chat_model
+    from llm_harness.strategies import StrategyRunner
+
+    key = (cell.model, cell.temperature)
+    if key not in _worker["runners"]:
+        model = create_chat_model(cell.model, cell.temperature, backend=_worker["backend"], scheduler=_worker["scheduler"], **_worker["model_kwargs"])
+        _worker["runners"][key] = StrategyRunner(model, strategies=[])
+    return _worker["runners"][key]
+
+def _run_chunk(cell: SweepCell, items: List[Tuple[str, str, str]], max_concurrency: int, stream: bool) -> Dict[str, List[Any]]:
+    """Run one cell on a chunk of ``(id, question, gold)`` items inside a worker; returns columns."""
+    runner = _runner(cell)
+
+    async def run_all() -> List[Dict[str, Any]]:
+        if _worker["warm_up"]:
+            from llm_harness.pool import awarm_up
+            await awarm_up(_worker["warm_up"])
+            _worker["warm_up"] = 0
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(item_id: str, question: str, gold: str) -> Dict[str, Any]:
+            row = {"id": item_id, "question": question, "gold": gold}
+            try:
+                comparison = await runner.arun(question, [cell.strategy], stream, semaphore)
+            except Exception as e:
+                # Kept as a row so failures show up in the summary instead of vanishing
+                return {**row, "answer": "", "error": f"{type(e).__name__}: {e}"}
+            result = comparison["results"][cell.strategy]
+            usage = result["usage"]
+            return {
+                **row,
+                "answer": result["answer"],
+                "time": result["time"],
+                "ttft": result["ttft"],
+                "model_calls": result["model_calls"],
+                "input_tokens": usage["input_tokens"],
+                "output_tokens": usage["output_tokens"],
+                "cached_input_tokens": usage["cached_input_tokens"],
+                "cost": usage["cost"],
+                "error": ""
+            }
+
+        return await asyncio.gather(*(run_one(*item) for item in items))
+
+    rows = _worker["loop"].run_until_complete(run_all())
+    columns = {name: [row.get(name) for row in rows] for name in COLUMNS[4:] if name != "correct"}
+    columns.update({"model": [cell.model] * len(rows), "temperature": [cell.temperature] * len(rows),
+                    "strategy": [cell.strategy] * len(rows), "dataset": [cell.dataset] * len(rows)})
+    return columns
+
+def _load_items(path: str, question_field: str, answer_field: str, limit: Optional[int]) -> List[Tuple[str, str, str]]:
+    items = []
+    for item_id, question, record in iter_questions(path, question_field):
+        if limit is not None and len(items) >= limit:
+            break
+        items.append((item_id, question, gold_answer(record.get(answer_field))))
+    return items
+
+def _array(name: str, values: List[Any]) -> np.ndarray:
+    if name in TEXT_COLUMNS:
+        return np.array(["" if value is None else str(value) for value in values], dtype=str)
+    return np.array([math.nan if value is None else value for value in values], dtype=float)
+
+def write_columns(columns: Dict[str, np.ndarray], path: str) -> str:
+    """Write columns as one ``.parquet`` file (requires pyarrow) or a compressed NumPy ``.npz``."""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet output requires pyarrow: pip install pyarrow (or write .npz)") from e
+        pyarrow.parquet.write_table(pyarrow.table({name: pyarrow.array(values) for name, values in columns.items()}), path)
+        return path
+    path = path if path.endswith(".npz") else f"{path}.npz"
+    np.savez_compressed(path, **columns)
+    return path
+
+def read_columns(path: str) -> Dict[str, np.ndarray]:
+    """Read a sweep results file written by ``write_columns``."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+        return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+def run_sweep(
+    cells: Sequence[SweepCell],
+    output_path: Optional[str] = "sweep.npz",
+    workers: Optional[int] = None,
+    max_concurrency: int = 16,
+    chunk_size: int = 250,
+    limits: Optional[Dict[str, Tuple[float, float]]] = None,
+    default_limits: Optional[Tuple[float, float]] = None,
+    cache_path: Optional[str] = None,
+    backend: Optional[str] = None,
+    model_kwargs: Optional[Dict[str, Any]] = None,
+    question_field: str = "question",
+    answer_field: str = "answer",
+    limit: Optional[int] = None,
+    stream: bool = False,
+    start_method: str = "spawn",
+    warm_up: int = 0
+) -> Dict[str, np.ndarray]:
+    """
+    Run every cell of a sweep on a process pool and write one columnar results file.
+
+    Args:
+        cells: Grid cells, e.g. from ``sweep_grid``
+        output_path: ``.npz`` or ``.parquet`` results file (None to skip writing)
+        workers: Worker processes (default: CPU count)
+        max_concurrency: Questions in flight per worker
+        chunk_size: Questions per task; smaller chunks balance the pool better
+        limits: Per-model ``(requests_per_minute, tokens_per_minute)`` for the whole pool
+        default_limits: Budget for models not in ``limits``; defaults to
+            ``GENAI_RPM``/``GENAI_TPM`` when set. With no limits at all,
+            calls are not paced
+        cache_path: SQLite response cache shared by every worker
+        backend / model_kwargs: Passed to ``create_chat_model`` in the workers
+        question_field / answer_field: Dataset fields of the question and gold answer
+        limit: Questions used from each dataset
+        stream: Stream responses and stop after the #### answer line
+        start_method: multiprocessing start method of the pool
+        warm_up: Connections each worker opens to the API before its first chunk
+
+    Returns:
+        The results columns (see ``COLUMNS``), one row per cell and question
+    """
+    context = multiprocessing.get_context(start_method)
+    if default_limits is None and ("GENAI_RPM" in os.environ or "GENAI_TPM" in os.environ):
+        default_limits = (float(os.environ.get("GENAI_RPM", 500)), float(os.environ.get("GENAI_TPM", 200_000)))
+    buckets = None
+    if limits or default_limits:
+        buckets = {
+            model: tuple(SharedTokenBucket(budget, context=context) for budget in (limits or {}).get(model, default_limits or (500, 200_000)))
+            for model in {cell.model for cell in cells}
+        }
+
+    datasets = {path: _load_items(path, question_field, answer_field, limit) for path in {cell.dataset for cell in cells}}
+    tasks = [(cell, datasets[cell.dataset][i:i + chunk_size]) for cell in cells for i in range(0, len(datasets[cell.dataset]), chunk_size)]
+    total = sum(len(items) for _, items in tasks)
+
+    collected: Dict[str, List[Any]] = {name: [] for name in COLUMNS if name != "correct"}
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(cache_path, buckets, backend, model_kwargs or {}, warm_up)) as pool, \
+            Progress(transient=True) as progress:
+        task = progress.add_task(f"[cyan]Sweeping {len(cells)} cells...", total=total)
+        futures = [pool.submit(_run_chunk, cell, items, max_concurrency, stream) for cell, items in tasks]
+        for future in as_completed(futures):
+            chunk = future.result()
+            for name, values in chunk.items():
+                collected[name].extend(values)
+            progress.advance(task, len(chunk["id"]))
+
+    columns = {name: _array(name, collected[name]) for name in COLUMNS if name != "correct"}
+    # 1/0 against the gold answer, NaN for questions without one
+    columns["correct"] = np.where(columns["gold"] != "", answers_match(columns["answer"], columns["gold"]).astype(float), math.nan)
+    columns = {name: columns[name] for name in COLUMNS}
+    if output_path:
+        write_columns(columns, output_path)
+    return columns
+
+def sweep_summary(columns: Dict[str, np.ndarray], confidence: float = 0.95, n_boot: int = 1000, seed: Optional[int] = 0) -> List[Dict[str, Any]]:
+    """
+    Per-cell statistics of sweep results.
+
+    Returns:
+        One dictionary per cell with its accuracy (and bootstrap confidence
+        interval), answer and error rates, p50/p95 time, mean tokens and total cost
+    """
+    codes = [np.unique(columns[name], return_inverse=True) for name in ("model", "temperature", "strategy", "dataset")]
+    cell_code = np.zeros(len(columns["id"]), dtype=np.int64)
+    for uniques, inverse in codes:
+        cell_code = cell_code * len(uniques) + inverse.reshape(-1)
+    tail = (1 - confidence) / 2 * 100
+
+    summary = []
+    for code in np.unique(cell_code):
+        rows = cell_code == code
+        correct = columns["correct"][rows]
+        graded = correct[~np.isnan(correct)]
+        times = columns["time"][rows]
+        times = times[~np.isnan(times)]
+        cost = columns["cost"][rows]
+        entry = {name: columns[name][rows][0].item() for name in ("model", "temperature", "strategy", "dataset")}
+        entry.update({
+            "questions": int(rows.sum()),
+            "errors": int((columns["error"][rows] != "").sum()),
+            "answer_rate": float(np.isin(columns["answer"][rows], ("", "No answer found"), invert=True).mean()),
+            "accuracy": float(graded.mean()) if len(graded) else None,
+            "accuracy_low": None,
+            "accuracy_high": None,
+            "p50_time": float(np.percentile(times, 50)) if len(times) else None,
+            "p95_time": float(np.percentile(times, 95)) if len(times) else None,
+            "mean_output_tokens": float(np.nanmean(columns["output_tokens"][rows])) if len(times) else None,
+            "total_cost": None if np.isnan(cost).all() else float(np.nansum(cost))
+        })
+        if len(graded) > 1:
+            low, high = np.percentile(bootstrap_means(graded, n_boot, seed)[:, 0], [tail, 100 - tail])
+            entry.update(accuracy_low=float(low), accuracy_high=float(high))
+        summary.append(entry)
+    return summary
+
+def sweep_table(summary: List[Dict[str, Any]], title: str = "Parameter Sweep") -> Table:
+    """Render ``sweep_summary`` as a Rich table, one row per cell."""
+    table = Table(title=title, show_header=True, header_style="bold magenta")
+    for column in ("Strategy", "Model", "Temp", "Dataset", "Questions", "Accuracy (95% CI)", "Answered", "Time p50 / p95 (s)", "Avg Output Tokens", "Cost (USD)"):
+        table.add_column(column, justify="left" if column in ("Strategy", "Model", "Dataset") else "right")
+    for entry in summary:
+        if entry["accuracy"] is None:
+            accuracy = "-"
+        elif entry["accuracy_low"] is None:
+            accuracy = f"{entry['accuracy']:.1%}"
+        else:
+            accuracy = f"{entry['accuracy']:.1%} [{entry['accuracy_low']:.1%}, {entry['accuracy_high']:.1%}]"
+        questions = str(entry["questions"]) + (f" ({entry['errors']} failed)" if entry["errors"] else "")
+        table.add_row(
+            entry["strategy"], entry["model"], f"{entry['temperature']:g}", os.path.basename(entry["dataset"]), questions, accuracy,
+            f"{entry['answer_rate']:.1%}",
+            "-" if entry["p50_time"] is None else f"{entry['p50_time']:.2f} / {entry['p95_time']:.2f}",
+            "-" if entry["mean_output_tokens"] is None else f"{entry['mean_output_tokens']:.1f}",
+            "-" if entry["total_cost"] is None else f"${entry['total_cost']:.4f}"
+        )
+    return table
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from rich.console import Console
+
+    parser = argparse.ArgumentParser(description="Sweep models x temperatures x strategies x datasets on a process pool")
+    parser.add_argument("--datasets", nargs="+", required=True, help="JSONL/CSV datasets with question (and answer) fields")
+    parser.add_argument("--strategies", nargs="+", required=True, help="Registered strategies, e.g. cot cod aot stepback")
+    parser.add_argument("--models", nargs="+", default=["gpt-4o"])
+    parser.add_argument("--temperatures", nargs="+", type=float, default=[0.0])
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=16, help="Questions in flight per worker")
+    parser.add_argument("--chunk-size", type=int, default=250)
+    parser.add_argument("--limit", type=int, default=None, help="Questions used from each dataset")
+    parser.add_argument("--rpm", type=float, help="Requests per minute for the whole pool, per model")
+    parser.add_argument("--tpm", type=float, help="Tokens per minute for the whole pool, per model")
+    parser.add_argument("--cache", help="SQLite response cache shared by the workers")
+    parser.add_argument("--backend", choices=("openai", "fake"))
+    parser.add_argument("--warm-up", type=int, default=0, help="Connections each worker opens before its first chunk")
+    parser.add_argument("--output", default="sweep.npz", help="Results file (.npz, or .parquet with pyarrow)")
+    args = parser.parse_args()
+
+    limits = None
+    if args.rpm or args.tpm:
+        limits = (args.rpm or 500, args.tpm or 200_000)
+    start = time.perf_counter()
+    results = run_sweep(
+        sweep_grid(args.models, args.temperatures, args.strategies, args.datasets), args.output,
+        workers=args.workers, max_concurrency=args.concurrency, chunk_size=args.chunk_size, default_limits=limits,
+        cache_path=args.cache, backend=args.backend, limit=args.limit, warm_up=args.warm_up
+    )
+    console = Console()
+    console.print(sweep_table(sweep_summary(results)))
+    console.print(f"[dim]{len(results['id'])} runs in {time.perf_counter() - start:.1f}s, written to {args.output}[/dim]")
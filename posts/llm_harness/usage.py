@@ -0,0 +1,175 @@
+"""
+Token usage and cost accounting.
+
+``token_usage`` normalizes a response's ``usage_metadata`` into input,
+output and cached/uncached input token counts. Cached input tokens come from
+``input_token_details.cache_read``, which LangChain fills from the
+provider's prompt-cache report (e.g. OpenAI's ``cached_tokens``).
+
+``call_usage`` adds what the comparisons report per call: when the response
+carries no usage (offline runs, streams cut off before the usage chunk) the
+tokens are counted locally with ``tiktoken`` if it is installed, or a rough
+4-characters-per-token estimate otherwise; the cost comes from a price table
+(USD per million tokens) that ``GENAI_PRICES`` can point at a JSON file of
+``{"model": [input, output, cached_input]}``; and throughput is output
+tokens per second of wall time.
+"""
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+# USD per million tokens: (input, output, cached input)
+DEFAULT_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "o3-mini": (1.10, 4.40, 0.55),
+    "fake": (0.0, 0.0, 0.0)
+}
+
+_prices: Optional[Dict[str, Tuple[float, float, float]]] = None
+_encodings: Dict[str, Any] = {}
+
+def set_prices(prices: Dict[str, Tuple[float, float, float]]) -> None:
+    """Replace the price table (USD per million input, output and cached input tokens)."""
+    global _prices
+    _prices = {model: tuple(price) for model, price in prices.items()}
+
+def get_prices() -> Dict[str, Tuple[float, float, float]]:
+    """The active price table: ``set_prices``, else ``GENAI_PRICES`` merged over the defaults."""
+    global _prices
+    if _prices is None:
+        prices = dict(DEFAULT_PRICES)
+        path = os.environ.get("GENAI_PRICES")
+        if path:
+            with open(path, encoding="utf-8") as f:
+                prices.update({model: tuple(price) for model, price in json.load(f).items()})
+        _prices = prices
+    return _prices
+
+def price_for(model_name: Optional[str]) -> Optional[Tuple[float, float, float]]:
+    """Price of a model, matching dated snapshots (``gpt-4o-2024-08-06``) by longest prefix."""
+    if not model_name:
+        return None
+    prices = get_prices()
+    matches = [name for name in prices if model_name == name or model_name.startswith(name + "-")]
+    return prices[max(matches, key=len)] if matches else None
+
+def _encoding(model_name: Optional[str]) -> Any:
+    """The tiktoken encoding for a model, or None when tiktoken or its BPE files are unavailable."""
+    key = model_name or ""
+    if key not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[key] = tiktoken.encoding_for_model(model_name or "gpt-4o")
+            except KeyError:
+                _encodings[key] = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # Not installed, or offline without cached BPE files
+            _encodings[key] = None
+    return _encodings[key]
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+    """Count tokens locally: tiktoken when available, otherwise about 4 characters per token."""
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def token_usage(message: Any) -> Optional[Dict[str, int]]:
+    """Input, output, cached and uncached input tokens of a response, or None if it has no usage metadata."""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    input_tokens = usage.get("input_tokens", 0)
+    cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+    return {
+        "input_tokens": input_tokens,
+        "output_tokens": usage.get("output_tokens", 0),
+        "cached_input_tokens": cached,
+        "uncached_input_tokens": input_tokens - cached
+    }
+
+def prompt_text(chain: Any, inputs: Dict[str, Any]) -> Optional[str]:
+    """Format a ``prompt | model`` chain's prompt to text, for counting input tokens locally."""
+    prompt = getattr(chain, "first", None)
+    if prompt is None:
+        return None
+    return "\n".join(str(message.content) for message in prompt.invoke(inputs).to_messages())
+
+def chain_model_name(chain: Any) -> Optional[str]:
+    """Model name of a chain's final model, looking through scheduler/hedging wrappers."""
+    model = getattr(chain, "last", chain)
+    while model is not None:
+        name = getattr(model, "model_name", None)
+        if isinstance(name, str):
+            return name
+        model = getattr(model, "model", None)
+    return None
+
+def call_cost(usage: Dict[str, int], model_name: Optional[str]) -> Optional[float]:
+    """Cost of one call in USD, or None when the model has no price."""
+    price = price_for(model_name)
+    if price is None:
+        return None
+    input_price, output_price, cached_price = price
+    return (usage["uncached_input_tokens"] * input_price
+            + usage["cached_input_tokens"] * cached_price
+            + usage["output_tokens"] * output_price) / 1_000_000
+
+def call_usage(message: Any, content: str, seconds: float, prompt: Optional[str] = None, model_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Token usage, cost and throughput of one call.
+
+    Args:
+        message: The response message (its usage metadata is preferred)
+        content: The response text, counted locally when there is no usage metadata
+        seconds: Wall time of the call, for tokens per second
+        prompt: The formatted prompt text, counted locally when there is no usage metadata
+        model_name: Model to price when the response does not report one
+            (e.g. a stream cut off before its final chunk)
+    """
+    metadata = getattr(message, "response_metadata", None) or {}
+    model_name = metadata.get("model_name") or model_name
+
+    usage = token_usage(message)
+    if usage is not None:
+        usage["source"] = "provider"
+    else:
+        input_tokens = count_tokens(prompt, model_name) if prompt else 0
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": count_tokens(content, model_name),
+            "cached_input_tokens": 0,
+            "uncached_input_tokens": input_tokens,
+            "source": "estimated"
+        }
+
+    usage["model_name"] = model_name
+    usage["cost"] = call_cost(usage, model_name)
+    usage["tokens_per_second"] = usage["output_tokens"] / seconds if seconds > 0 else None
+    return usage
+
+def format_cached_tokens(usage: Optional[Dict[str, int]]) -> str:
+    """Render cached vs total input tokens, e.g. ``96 / 210 (46%)``."""
+    if not usage:
+        return "-"
+    total = usage["input_tokens"]
+    share = usage["cached_input_tokens"] / total if total else 0.0
+    return f"{usage['cached_input_tokens']} / {total} ({share:.0%})"
+
+def format_tokens(usage: Dict[str, Any], key: str = "output_tokens") -> str:
+    """Render a token count, marked with ~ when estimated locally instead of reported by the provider."""
+    return ("~" if usage["source"] == "estimated" else "") + str(usage[key])
+
+def format_rate(usage: Dict[str, Any]) -> str:
+    """Render output tokens per second."""
+    rate = usage["tokens_per_second"]
+    return "-" if rate is None else f"{rate:.1f}"
+
+def format_cost(cost: Optional[float]) -> str:
+    """Render a USD cost with enough precision for single calls."""
+    return "-" if cost is None else f"${cost:.5f}"
@@ -0,0 +1,84 @@
+"""
+Benchmark prompt/chain construction in multi_step_stepback: per call vs once.
+
+The old implementation built both ChatPromptTemplates and both chains on every
+call, with the question baked into the messages. Both versions run against a
+zero-latency fake model, so the numbers are pure harness overhead:
+
+    python benchmark_templates.py --calls 2000
+"""
+import argparse
+import time
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema import HumanMessage, SystemMessage
+from rich.table import Table
+
+import step_back_prompting as sb
+from llm_harness.fake import FakeChatModel
+
+def build_per_call(question: str, problem_analysis: str):
+    """The previous per-call construction of both step chains."""
+    identification_prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=sb.SYSTEM_MESSAGE_IDENTIFY),
+        HumanMessage(content=question)
+    ])
+    solution_prompt = ChatPromptTemplate.from_messages([
+        SystemMessage(content=sb.SYSTEM_MESSAGE_SOLVE),
+        HumanMessage(content=f"Problem: {question}\n\nProblem Analysis: {problem_analysis}")
+    ])
+    return identification_prompt | sb.model, solution_prompt | sb.model
+
+def run_per_call(question: str) -> str:
+    """multi_step_stepback as it was: build, then invoke, both steps."""
+    identification_chain, _ = build_per_call(question, "")
+    analysis = identification_chain.invoke({}).content
+    _, solution_chain = build_per_call(question, analysis)
+    return solution_chain.invoke({}).content
+
+def per_call(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(f"Q: benchmark question {i}")
+    return (time.perf_counter() - start) / calls
+
+def run_benchmark(calls: int) -> None:
+    """Time construction alone and full two-step calls, before and after."""
+    sb.set_model(FakeChatModel())
+    question = "Q: A fair die is rolled twice. What is the expected sum?"
+
+    # Both versions must send exactly the same messages
+    inputs = {"question": question, "problem_analysis": "analysis"}
+    for old_chain, new_prompt in zip(build_per_call(question, "analysis"), (sb.identification_prompt, sb.solution_prompt)):
+        before = old_chain.first.invoke({}).to_messages()
+        after = new_prompt.invoke(inputs).to_messages()
+        assert before == after, "precompiled prompt differs from the per-call prompt"
+
+    build_before = per_call(lambda q: build_per_call(q, "analysis"), calls)
+    build_after = per_call(lambda q: (sb.identification_chain, sb.solution_chain), calls)
+    format_before = per_call(lambda q: [c.first.invoke({}) for c in build_per_call(q, "analysis")], calls)
+    format_after = per_call(lambda q: (sb.identification_prompt.invoke({"question": q}), sb.solution_prompt.invoke({"question": q, "problem_analysis": "analysis"})), calls)
+    call_before = per_call(run_per_call, calls)
+    call_after = per_call(lambda q: sb.multi_step_stepback(q), calls)
+
+    table = Table(title=f"multi_step_stepback construction overhead ({calls} calls, zero-latency model)", show_header=True, header_style="bold magenta")
+    table.add_column("Per call", style="dim")
+    table.add_column("Built per call (µs)", justify="right")
+    table.add_column("Built once (µs)", justify="right")
+    table.add_column("Saved", justify="right")
+
+    for name, before_time, after_time in (
+        ("Template + chain construction", build_before, build_after),
+        ("Construction + prompt formatting", format_before, format_after),
+        ("Full two-step call", call_before, call_after),
+    ):
+        table.add_row(name, f"{before_time * 1e6:.1f}", f"{after_time * 1e6:.1f}", f"{(1 - after_time / before_time) * 100:.1f}%")
+
+    sb.console.print(table)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    run_benchmark(args.calls)
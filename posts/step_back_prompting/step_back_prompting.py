@@ -1,20 +1,42 @@
+import contextlib
 import os
-from typing import Dict, Any
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-from rich.text import Text
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import HumanMessage, SystemMessage
+import sys
+import time
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 
-os.environ["OPENAI_API_KEY"] = "your api key"
+# Make the shared harness in posts/ importable when running this file directly
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_harness.lazy import LazyConsole
+from llm_harness.models import create_chat_model
+from llm_harness.profiling import profiler, profiler_from_env
+from llm_harness.sinks import CsvSink, JsonlSink, ResultSink, SinkDispatcher
+from llm_harness.strategies import Strategy, register_strategy
+from llm_harness.streaming import arun_chain, extract_answer, format_millis, format_seconds, run_chain
+
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
+    from llm_harness.similarity import SimilarityCache
+
+# Rich, LangChain and the model client are loaded on first use, so importing
+# this module (e.g. for extract_answer or the prompts) stays cheap. The model
+# is configured by setup_model's arguments or GENAI_MODEL / GENAI_TEMPERATURE,
+# and ChatOpenAI reads the key from OPENAI_API_KEY.
 
 # Initialize Rich console for pretty printing
-console = Console()
+console = LazyConsole()
 
-# Set up the OpenAI model
-model = ChatOpenAI(model="gpt-4o", temperature=0.2)
+def setup_model(model_name: Optional[str] = None, temperature: Optional[float] = None, backend: Optional[str] = None, **kwargs: Any) -> "ChatOpenAI":
+    """
+    Initialize the LLM with the specified parameters.
+    
+    Unset arguments come from ``GENAI_MODEL`` / ``GENAI_TEMPERATURE``
+    (default gpt-4o at temperature 0.2). ``backend="fake"`` (or
+    ``GENAI_BACKEND=fake``) returns the offline FakeChatModel instead of
+    ChatOpenAI; extra kwargs go to the model.
+    """
+    if temperature is None and "GENAI_TEMPERATURE" not in os.environ:
+        temperature = 0.2
+    return create_chat_model(model_name, temperature, backend=backend, **kwargs)
 
 # Example for few-shot learning
 FEW_SHOT_EXAMPLE = """
@@ -43,111 +65,334 @@ To solve this problem:
 Return the answer at the end of the response after a separator ####.
 """
 
-# Create prompt templates
-direct_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content=SYSTEM_MESSAGE_DIRECT),
-    HumanMessage(content="{question}")
-])
-
-stepback_prompt = ChatPromptTemplate.from_messages([
-    SystemMessage(content=SYSTEM_MESSAGE_STEPBACK),
-    HumanMessage(content=FEW_SHOT_EXAMPLE),
-    HumanMessage(content="{question}")
-])
-
-# Create chains
-direct_chain = direct_prompt | model
-stepback_chain = stepback_prompt | model
-
-def extract_answer(response: str) -> str:
-    """Extract the final answer after the #### separator."""
-    parts = response.split("####")
-    if len(parts) > 1:
-        return parts[1].strip()
-    return "No answer found"
-
-def compare_approaches(question: str) -> None:
-    """Compare Direct vs Step-Back reasoning approaches."""
-    console.print(Panel(question, title="Problem", border_style="blue"))
-    
-    # Get Direct response
-    direct_response = direct_chain.invoke({"question": question})
-    direct_content = direct_response.content
-    direct_tokens = len(direct_content.split())
-    direct_answer = extract_answer(direct_content)
-    
-    # Get Step-Back response
-    stepback_response = stepback_chain.invoke({"question": question})
-    stepback_content = stepback_response.content
-    stepback_tokens = len(stepback_content.split())
-    stepback_answer = extract_answer(stepback_content)
+SYSTEM_MESSAGE_IDENTIFY = "Consider the following problem. Before solving it, identify what type of problem this is and what key concepts, principles, or methods are relevant to it."
+
+SYSTEM_MESSAGE_SOLVE = "Solve the following problem step by step, using the provided problem analysis. Return the final answer after a separator ####."
+
+# The model, prompt templates and chains, built on first use
+_model = None
+_prompts: Dict[str, Any] = {}
+_chains: Dict[str, Any] = {}
+
+def _build_prompts() -> Dict[str, Any]:
+    """Create the prompt templates; the question is always an input variable."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate
+    
+    return {
+        "direct": ChatPromptTemplate.from_messages([
+            SystemMessage(content=SYSTEM_MESSAGE_DIRECT),
+            ("human", "{question}")
+        ]),
+        "stepback": ChatPromptTemplate.from_messages([
+            SystemMessage(content=SYSTEM_MESSAGE_STEPBACK),
+            HumanMessage(content=FEW_SHOT_EXAMPLE),
+            ("human", "{question}")
+        ]),
+        "identification": ChatPromptTemplate.from_messages([
+            SystemMessage(content=SYSTEM_MESSAGE_IDENTIFY),
+            ("human", "{question}")
+        ]),
+        "solution": ChatPromptTemplate.from_messages([
+            SystemMessage(content=SYSTEM_MESSAGE_SOLVE),
+            ("human", "Problem: {question}\n\nProblem Analysis: {problem_analysis}")
+        ])
+    }
+
+def get_model():
+    """The module's model, created with ``setup_model()`` on first use."""
+    global _model
+    if _model is None:
+        _model = setup_model()
+    return _model
+
+def get_prompt(name: str):
+    """The ``"direct"``, ``"stepback"``, ``"identification"`` or ``"solution"`` prompt template."""
+    if not _prompts:
+        _prompts.update(_build_prompts())
+    return _prompts[name]
+
+def get_chain(name: str):
+    """The ``prompt | model`` chain of one of the prompts."""
+    if name not in _chains:
+        _chains[name] = get_prompt(name) | get_model()
+    return _chains[name]
+
+_PROMPT_NAMES = ("direct", "stepback", "identification", "solution")
+
+def __getattr__(name: str) -> Any:
+    # Keep model, direct_prompt, solution_chain, ... available as module attributes
+    if name == "model":
+        return get_model()
+    prompt, _, kind = name.rpartition("_")
+    if prompt in _PROMPT_NAMES and kind in ("prompt", "chain"):
+        return get_prompt(prompt) if kind == "prompt" else get_chain(prompt)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+async def _arun_two_stage(chains: Dict[str, Any], question: str, stream: bool = False):
+    """Two-stage step-back for the strategy registry: identify the problem type, then solve with that analysis."""
+    identify_inputs = {"question": question}
+    identification = await arun_chain(chains["identify"], identify_inputs, stream=stream, stop_after_answer=False, strategy="stepback_two_stage.identify")
+    solve_inputs = {"question": question, "problem_analysis": identification.content}
+    solution = await arun_chain(chains["solve"], solve_inputs, stream=stream, strategy="stepback_two_stage.solve")
+    return solution.content, [("identify", identify_inputs, identification), ("solve", solve_inputs, solution)]
+
+# Register the approaches for llm_harness.strategies.run_strategies
+register_strategy(Strategy("direct", "Direct", lambda: {"main": get_prompt("direct")}))
+register_strategy(Strategy("stepback", "Step-Back", lambda: {"main": get_prompt("stepback")}))
+register_strategy(Strategy("stepback_two_stage", "Step-Back (two-stage)",
+                           lambda: {"identify": get_prompt("identification"), "solve": get_prompt("solution")}, run=_arun_two_stage))
+
+def set_model(new_model) -> None:
+    """Swap the module-level model (e.g. for a FakeChatModel); the chains are rebuilt on next use."""
+    global _model
+    _model = new_model
+    _chains.clear()
+
+def _measure(chain, question: str, stream: bool, strategy: str) -> Dict[str, Any]:
+    """Run one approach and collect its response, answer and latency breakdown."""
+    run = run_chain(chain, {"question": question}, stream=stream, strategy=strategy)
+    with profiler.span("parse", strategy):
+        words = len(run.content.split())
+        answer = extract_answer(run.content)
+    return {"content": run.content, "words": words, "answer": answer, "time": run.total, "latency": run.latency()}
+
+def display_comparison(results: Dict[str, Any]) -> None:
+    """Render the responses and comparison table of ``compare_approaches``; also usable as ``RichSink(display_comparison)``."""
+    from rich.panel import Panel
+    from rich.table import Table
+    
+    direct, stepback = results["direct"], results["stepback"]
+    direct_latency, stepback_latency = direct["latency"], stepback["latency"]
     
     # Calculate correctness probability (hypothetical - in reality would need evaluation)
     # This is just for demonstration purposes
     direct_accuracy = "Lower"
     stepback_accuracy = "Higher"
     
-    # Display the responses in pretty format
-    console.print("\n[bold red]Direct Approach Response:[/bold red]")
-    console.print(Panel(direct_content, border_style="red"))
+    with profiler.span("render"):
+        console.print(Panel(results["problem"], title="Problem", border_style="blue"))
+        
+        # Display the responses in pretty format
+        console.print("\n[bold red]Direct Approach Response:[/bold red]")
+        console.print(Panel(direct["content"], border_style="red"))
+        
+        console.print("\n[bold green]Step-Back Approach Response:[/bold green]")
+        console.print(Panel(stepback["content"], border_style="green"))
+        
+        # Create comparison table
+        table = Table(title="Comparison Results", show_header=True, header_style="bold magenta")
+        table.add_column("Metric", style="dim")
+        table.add_column("Direct Approach", justify="right")
+        table.add_column("Step-Back Approach", justify="right")
+        
+        table.add_row("Word Count", str(direct["words"]), str(stepback["words"]))
+        table.add_row("Time (seconds)", format_seconds(direct["time"]), format_seconds(stepback["time"]))
+        if direct_latency["streamed"]:
+            table.add_row("Time to First Token (seconds)", format_seconds(direct_latency["ttft"]), format_seconds(stepback_latency["ttft"]))
+            table.add_row("Inter-token Latency (ms, mean)", format_millis(direct_latency["mean_inter_token"]), format_millis(stepback_latency["mean_inter_token"]))
+            table.add_row("Inter-token Latency (ms, p95)", format_millis(direct_latency["p95_inter_token"]), format_millis(stepback_latency["p95_inter_token"]))
+        table.add_row("Final Answer", direct["answer"], stepback["answer"])
+        table.add_row("Expected Accuracy", direct_accuracy, stepback_accuracy)
+        
+        console.print(table)
+
+def compare_approaches(question: str, stream: bool = False, render: bool = True) -> Dict[str, Any]:
+    """
+    Compare Direct vs Step-Back reasoning approaches.
     
-    console.print("\n[bold green]Step-Back Approach Response:[/bold green]")
-    console.print(Panel(stepback_content, border_style="green"))
+    Set ``stream=True`` to stream both responses, report time-to-first-token and
+    inter-token latency, and stop each generation once the #### answer line is done.
+    With ``render=False`` nothing is printed (headless mode; see ``batch_compare``).
     
-    # Create comparison table
-    table = Table(title="Comparison Results", show_header=True, header_style="bold magenta")
-    table.add_column("Metric", style="dim")
-    table.add_column("Direct Approach", justify="right")
-    table.add_column("Step-Back Approach", justify="right")
+    Returns:
+        Dictionary with the problem and both approaches' responses, answers and latency
+    """
+    results = {
+        "problem": question,
+        "direct": _measure(get_chain("direct"), question, stream, "direct"),
+        "stepback": _measure(get_chain("stepback"), question, stream, "stepback")
+    }
+    if render:
+        display_comparison(results)
+    
+    return results
+
+def batch_compare(questions: List[str], sinks: List[ResultSink], stream: bool = False) -> List[Dict[str, Any]]:
+    """
+    Compare the direct and step-back approaches on many questions headlessly.
     
-    table.add_row("Word Count", str(direct_tokens), str(stepback_tokens))
-    table.add_row("Final Answer", direct_answer, stepback_answer)
-    table.add_row("Expected Accuracy", direct_accuracy, stepback_accuracy)
+    Nothing is rendered on the request path: each result goes to ``sinks`` on a
+    background thread, e.g. ``[JsonlSink("results.jsonl"), CsvSink("summary.csv")]``
+    (add ``RichSink(display_comparison)`` to still print them).
     
-    console.print(table)
+    Returns:
+        The results of every question, in order
+    """
+    results = []
+    with SinkDispatcher(sinks) as dispatcher:
+        for question in questions:
+            result = compare_approaches(question, stream=stream, render=False)
+            dispatcher.emit(result)
+            results.append(result)
+    return results
 
-def multi_step_stepback(question: str) -> Dict[str, Any]:
-    """Implement full step-back prompting with separate steps."""
-    # Step 1: Identify problem type and principles
-    identification_prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content="Consider the following problem. Before solving it, identify what type of problem this is and what key concepts, principles, or methods are relevant to it."),
-        HumanMessage(content=question)
-    ])
+def multi_step_stepback(question: str, stream: bool = False, analysis_cache: Optional["SimilarityCache"] = None) -> Dict[str, Any]:
+    """
+    Implement full step-back prompting with separate steps.
     
-    identification_chain = identification_prompt | model
-    identification_response = identification_chain.invoke({})
-    problem_analysis = identification_response.content
+    With ``stream=True`` both steps are streamed and the solution stops once the
+    #### answer line is complete; per-step latency is returned under "timings".
+    
+    With an ``analysis_cache``, step 1 is skipped when a sufficiently similar
+    question was analysed before, and its analysis is reused for step 2.
+    """
+    # Step 1: Identify problem type and principles (or reuse a similar problem's analysis)
+    with profiler.span("cache", "stepback.identify"):
+        cached = analysis_cache.lookup(question) if analysis_cache is not None else None
+    if cached is not None:
+        problem_analysis, similarity = cached
+        identification_run = None
+    else:
+        identification_run = run_chain(get_chain("identification"), {"question": question}, stream=stream, stop_after_answer=False, strategy="stepback.identify")
+        problem_analysis = identification_run.content
+        similarity = None
+        if analysis_cache is not None:
+            analysis_cache.add(question, problem_analysis, cost=identification_run.total)
     
     # Step 2: Solve with the analysis in mind
-    solution_prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content="Solve the following problem step by step, using the provided problem analysis. Return the final answer after a separator ####."),
-        HumanMessage(content=f"Problem: {question}\n\nProblem Analysis: {problem_analysis}")
-    ])
+    solution_run = run_chain(get_chain("solution"), {"question": question, "problem_analysis": problem_analysis}, stream=stream, strategy="stepback.solve")
+    solution = solution_run.content
+    with profiler.span("parse", "stepback.solve"):
+        answer = extract_answer(solution)
     
-    solution_chain = solution_prompt | model
-    solution_response = solution_chain.invoke({})
-    solution = solution_response.content
+    timings = {"solution": solution_run.latency()}
+    if identification_run is not None:
+        timings = {"analysis": identification_run.latency(), **timings}
     
     return {
         "problem": question,
         "problem_analysis": problem_analysis,
+        "analysis_cached": cached is not None,
+        "analysis_similarity": similarity,
         "solution": solution,
-        "answer": extract_answer(solution)
+        "answer": answer,
+        "timings": timings
     }
 
 def display_multi_step_results(results: Dict[str, Any]) -> None:
     """Display the results of multi-step step-back prompting."""
+    from rich.panel import Panel
+    from rich.table import Table
+    
     console.print(Panel(results["problem"], title="Problem", border_style="blue"))
     
-    console.print("\n[bold yellow]Step 1: Problem Analysis[/bold yellow]")
+    if results.get("analysis_cached"):
+        console.print(f"\n[bold yellow]Step 1: Problem Analysis[/bold yellow] [dim](reused from a similar problem, similarity {results['analysis_similarity']:.2f})[/dim]")
+    else:
+        console.print("\n[bold yellow]Step 1: Problem Analysis[/bold yellow]")
     console.print(Panel(results["problem_analysis"], border_style="yellow"))
     
     console.print("\n[bold green]Step 2: Problem Solution[/bold green]")
     console.print(Panel(results["solution"], border_style="green"))
     
     console.print("\n[bold cyan]Final Answer:[/bold cyan]", results["answer"])
+    
+    if "timings" in results:
+        table = Table(title="Step Latency", show_header=True, header_style="bold magenta")
+        table.add_column("Step", style="dim")
+        table.add_column("Total (seconds)", justify="right")
+        table.add_column("Time to First Token (seconds)", justify="right")
+        table.add_column("Inter-token Latency (ms, mean)", justify="right")
+        for step, timing in results["timings"].items():
+            table.add_row(step.capitalize(), format_seconds(timing["total"]), format_seconds(timing["ttft"]), format_millis(timing["mean_inter_token"]))
+        console.print(table)
+
+def self_consistency(question: str, chain=None, k: int = 10, **options: Any) -> Dict[str, Any]:
+    """
+    Majority-vote over up to ``k`` samples of a chain (the step-back chain by default).
+    
+    Sampling stops as soon as the remaining samples can no longer overturn
+    the leading answer; the vote table reports how many samples were saved.
+    Extra options (``temperature``, ``use_n``, ``normalize``) go to
+    ``SelfConsistentChain``.
+    
+    Returns:
+        Dictionary with the majority answer, votes and samples drawn/saved
+    """
+    from rich.panel import Panel
+    from llm_harness.consistency import SelfConsistentChain, vote_table
+    
+    chain = get_chain("stepback") if chain is None else chain
+    console.print(Panel(question, title="Question", border_style="blue"))
+    
+    with console.status(f"[bold cyan]Sampling up to {k} responses..."):
+        result = SelfConsistentChain(chain, extract_answer, k=k, **options).invoke({"question": question})
+    
+    console.print(vote_table(result))
+    return result
+
+def batch_multi_step_stepback(questions: List[str], analysis_cache: Optional["SimilarityCache"] = None, sinks: Optional[List[ResultSink]] = None) -> Dict[str, Any]:
+    """
+    Run two-step step-back prompting over many questions, reusing analyses of similar ones.
+    
+    With ``sinks``, each question's result is handed to them on a background
+    thread as soon as it completes, e.g. ``[JsonlSink("results.jsonl"),
+    RichSink(display_multi_step_results)]``.
+    
+    Returns:
+        Dictionary with per-question results and the analysis cache statistics
+    """
+    from rich.table import Table
+    from llm_harness.similarity import SimilarityCache
+    
+    analysis_cache = analysis_cache if analysis_cache is not None else SimilarityCache()
+    results = []
+    headless = sinks is not None
+    status = console.status if not headless else (lambda _: contextlib.nullcontext())
+    with SinkDispatcher(sinks) if headless else contextlib.nullcontext() as dispatcher:
+        for i, question in enumerate(questions):
+            with status(f"[bold cyan]Question {i+1}/{len(questions)}..."):
+                start = time.perf_counter()
+                result = multi_step_stepback(question, analysis_cache=analysis_cache)
+                result["time"] = time.perf_counter() - start
+            if headless:
+                dispatcher.emit(result)
+            results.append(result)
+    
+    stats = analysis_cache.stats()
+    hits = [r["time"] for r in results if r["analysis_cached"]]
+    misses = [r["time"] for r in results if not r["analysis_cached"]]
+    
+    table = Table(title="Step-Back Analysis Cache", show_header=True, header_style="bold magenta")
+    table.add_column("Metric", style="dim")
+    table.add_column("Value", justify="right")
+    
+    table.add_row("Questions", str(len(results)))
+    table.add_row("Analysis Cache Hit Rate", f"{stats['hit_rate']:.1%}")
+    table.add_row("Analyses Stored", str(stats["entries"]))
+    table.add_row("Average Time, Cache Hit (seconds)", f"{sum(hits) / len(hits):.2f}" if hits else "-")
+    table.add_row("Average Time, Cache Miss (seconds)", f"{sum(misses) / len(misses):.2f}" if misses else "-")
+    table.add_row("End-to-End Time Saved (seconds)", f"{stats['time_saved']:.2f}")
+    
+    console.print(table)
+    
+    return {
+        "individual_results": results,
+        "cache": stats
+    }
 
 if __name__ == "__main__":
+    from llm_harness.budget import budget_from_env, budget_table
+    from llm_harness.cache import cache_from_env
+    
+    # Reuse cached responses when GENAI_RESPONSE_CACHE is set
+    cache = cache_from_env()
+    # Time each stage and write a Chrome trace when GENAI_PROFILE is set
+    profile = profiler_from_env()
+    # Cap max_tokens per strategy at a learned output-length quantile when GENAI_TOKEN_BUDGET is set
+    budget = budget_from_env()
+    
     # Run comparison with a test question
     test_question = """
     A charity fundraiser sells raffle tickets for $5 each. There are three prizes: a first prize of $1000, a second prize of $500, and a third prize of $250. If 500 tickets are sold, what is the expected value of buying a single ticket?
@@ -160,4 +405,21 @@ if __name__ == "__main__":
     # Show multi-step step-back prompting
     console.print("\n\n[bold]Multi-Step Step-Back Prompting[/bold]", style="blue")
     results = multi_step_stepback(test_question)
-    display_multi_step_results(results)
\ No newline at end of file
+    display_multi_step_results(results)
+    
+    # Uncomment to reuse step-back analyses across similar questions
+    # batch_multi_step_stepback([test_question, test_question.replace("$5", "$2")])
+    
+    # Uncomment to majority-vote over up to 10 step-back samples (stops early once settled)
+    # self_consistency(test_question, get_chain("stepback"), k=10)
+    
+    # Uncomment to compare headlessly: results go to JSONL and a CSV summary on a background thread
+    # batch_compare([test_question], [JsonlSink("stepback_results.jsonl"), CsvSink("stepback_summary.csv")])
+    
+    if cache:
+        console.print(f"[dim]{cache.summary()}[/dim]")
+    if profile:
+        console.print(profile.table())
+        console.print(f"[dim]Trace written to {profile.export_chrome_trace()}[/dim]")
+    if budget:
+        console.print(budget_table(budget.stats()))
\ No newline at end of file